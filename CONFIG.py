@@ -6,6 +6,54 @@ load_dotenv()
 class CONFIG:
     FAISS_INDEX_PATH = 'db/mvp_rag_database'
     CHATLIST_INDEX_PATH = "db/chats/chats.json"
+    CHAT_DB_PATH = "db/chats/chats.sqlite3"
     OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")  # Из .env
     OPENAI_PROXY = os.getenv("OPENAI_PROXY")      # Из .env
     EMBEDDINGS_DEVICE = 'cpu'
+    EMBEDDINGS_MODEL = os.getenv("EMBEDDINGS_MODEL", 'intfloat/multilingual-e5-large')  # Имя на HuggingFace или локальный путь
+    EMBEDDINGS_LOCAL_ONLY = os.getenv("EMBEDDINGS_LOCAL_ONLY") == "1"  # Брать модель только из локального кэша, без сети
+    EMBEDDINGS_BACKEND = 'torch'  # 'torch' — sentence-transformers, 'onnx' — onnxruntime (см. scripts/export_onnx.py)
+    ONNX_MODEL_PATH = 'models/multilingual-e5-large-onnx'
+    ONNX_QUANTIZED = True  # Использовать int8-квантованную ONNX-модель
+    ONNX_THREADS = os.cpu_count() or 4  # Потоков onnxruntime на один батч
+    PARTITION_CACHE_SIZE = 16  # Сколько разделов FAISS (чатов) держать в памяти
+    WAL_COMPACT_BYTES = 64 * 1024 * 1024  # Размер журнала раздела, после которого снимок пересобирается в фоне
+    CHUNK_SIZE = 1200  # Размер чанка по умолчанию для новых чатов (символы; токены для стратегии token)
+    CHUNK_OVERLAP = 200  # Перекрытие соседних чанков по умолчанию
+    TOKEN_CHUNK_MAX_SIZE = 510  # Предел размера чанка стратегии token: e5 обрезает вход на 512 токенах (2 служебных)
+    CHUNK_STRATEGY = 'recursive'  # 'recursive' — по абзацам и строкам, 'sentence' — по границам предложений, 'token' — по токенам модели эмбеддингов
+    EMBEDDING_BATCH_SIZE = 64  # Размер батча для модели эмбеддингов при загрузке документов
+    QUERY_BATCH_SIZE = 32  # Сколько одновременных запросов объединять в один проход модели и поиск FAISS (0 — без батчинга)
+    QUERY_BATCH_WAIT_MS = 5  # Сколько ждать остальные запросы батча после первого, мс
+    INGEST_WORKERS = 4  # Потоков на чтение и разбиение файлов при загрузке
+    INGEST_JOB_WORKERS = 1  # Рабочих потоков фоновой очереди загрузки
+    JOB_POLL_SECONDS = 1  # Период обновления прогресса загрузки в сайдбаре
+    EMBEDDING_CACHE_PATH = 'db/embedding_cache'
+    EMBEDDING_CACHE_SIZE = 50000  # Емкость дискового кэша эмбеддингов (0 — кэш выключен)
+    ANSWER_CACHE_THRESHOLD = 0.95  # Косинусная близость вопросов, при которой отдается ответ из кэша
+    ANSWER_CACHE_SIZE = 256  # Ответов в кэше на чат и набор параметров запроса
+    CONTEXT_TOKEN_BUDGET = 3000  # Максимум токенов контекста документов в запросе к LLM
+    RERANK_MODEL = os.getenv("RERANK_MODEL", 'cross-encoder/mmarco-mMiniLMv2-L12-H384-v1')  # Многоязычный кросс-энкодер (глубина поиска 3)
+    RERANK_FETCH_K = 50  # Сколько кандидатов FAISS переранжировать
+    RERANK_TOP_K = 10  # Сколько чанков оставлять после переранжирования
+    RERANK_THRESHOLD = 0.05  # Минимальная оценка кросс-энкодера (0..1), ниже чанк отбрасывается
+    RERANK_BATCH_SIZE = 32  # Пар (вопрос, чанк) в одном проходе кросс-энкодера
+    RERANK_CACHE_SIZE = 10000  # Оценок (вопрос, чанк) в кэше кросс-энкодера
+    RERANK_RETRY_SECONDS = 300  # Через сколько секунд повторять загрузку кросс-энкодера после ошибки
+    VALIDATOR_WORKERS = 10  # Одновременных LLM-запросов при валидации чанков (глубина поиска 5)
+    VALIDATOR_TIMEOUT = 30  # Таймаут валидации чанков на один запрос, секунды
+    VALIDATOR_CACHE_SIZE = 10000  # Оценок (тема, чанк) в кэше валидатора
+    # Тип индекса разделов: строка фабрики FAISS — "Flat", "HNSW32", "IVF1024,Flat", "IVF1024,PQ64", "IVF1024,SQ8"
+    FAISS_INDEX_FACTORY = "Flat"
+    FAISS_INDEX_MIN_VECTORS = 40000  # С какого размера раздел переводится на IVF (нужно ~39 векторов на кластер)
+    FAISS_INDEX_TRAIN_SIZE = 100000  # Размер выборки для обучения IVF/PQ
+    FAISS_NPROBE = 16  # Число просматриваемых кластеров IVF при поиске
+    TRACE_ENABLED = os.getenv("TRACE_ENABLED", "1") == "1"  # Замеры этапов запросов, метрики и трассы (0 — выключено)
+    TRACE_LOG = os.getenv("TRACE_LOG", "stdout")  # Куда писать JSON-трассы: 'stdout', путь к файлу или '' — не писать
+    TRACE_KEEP = 100  # Сколько последних трасс держать в памяти процесса
+    METRICS_HOST = '0.0.0.0'
+    METRICS_PORT = int(os.getenv("METRICS_PORT", "9108"))  # Порт /metrics для процесса Streamlit (0 — не запускать)
+    API_HOST = '0.0.0.0'
+    API_PORT = 8000
+    API_IN_APP = True  # Поднимать HTTP API внутри процесса Streamlit: общие модели, хранилище, кэши и чаты
+    API_MAX_CONCURRENCY = 8  # Одновременных RAG-запросов в HTTP API, остальные ждут в очереди
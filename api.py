@@ -0,0 +1,189 @@
+import asyncio
+from typing import Literal
+from fastapi import FastAPI, HTTPException, UploadFile, File
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import PlainTextResponse
+from pydantic import BaseModel, Field, model_validator
+import uvicorn
+from src.initialisateTols import load_database, load_embeddings, load_llm, load_job_queue, load_answer_cache, load_chat_manager
+from src.aiTools import full_rag_request, load_docs, seatch_all_docs, delete_doc_in_bd
+from src.ingestTools import UploadedDoc
+from src.traceTools import metrics, trace, span, enabled as tracing_enabled, CONTENT_TYPE
+from CONFIG import CONFIG
+
+# HTTP API. По умолчанию поднимается внутри процесса Streamlit (CONFIG.API_IN_APP, см. load_api_server)
+# и через загрузчики st.cache_resource работает с теми же объектами, что и интерфейс.
+# Без интерфейса: python api.py (данные в db/ открывает на запись только один процесс, см. src/lockTools.py)
+
+######################
+# Инициализация кеша #
+######################
+embending = load_embeddings(CONFIG.EMBEDDINGS_DEVICE)
+database = load_database(embending, CONFIG.FAISS_INDEX_PATH)
+llm = load_llm(CONFIG.OPENAI_API_KEY, CONFIG.OPENAI_PROXY)
+job_queue = load_job_queue(CONFIG.INGEST_JOB_WORKERS)
+answer_cache = load_answer_cache(CONFIG.ANSWER_CACHE_THRESHOLD, CONFIG.ANSWER_CACHE_SIZE)
+chat_manager = load_chat_manager(CONFIG.CHAT_DB_PATH, CONFIG.CHATLIST_INDEX_PATH)
+
+# Ограничитель одновременных запросов к RAG; лишние запросы ждут в очереди
+rag_limiter = asyncio.Semaphore(CONFIG.API_MAX_CONCURRENCY)
+
+app = FastAPI(title="RAG MVP API")
+
+
+class Chunking(BaseModel):
+    size: int = Field(CONFIG.CHUNK_SIZE, gt=0)
+    overlap: int = Field(CONFIG.CHUNK_OVERLAP, ge=0)
+    strategy: Literal["recursive", "sentence", "token"] = CONFIG.CHUNK_STRATEGY
+
+    @model_validator(mode="after")
+    def check_overlap(self):
+        # Сплиттеры LangChain падают при перекрытии не меньше размера чанка
+        if self.overlap >= self.size:
+            raise ValueError("overlap должен быть меньше size")
+        if self.strategy == "token" and self.size > CONFIG.TOKEN_CHUNK_MAX_SIZE:
+            raise ValueError(f"Для стратегии token size не больше {CONFIG.TOKEN_CHUNK_MAX_SIZE} (длина входа модели эмбеддингов)")
+        return self
+
+
+class ChatCreate(BaseModel):
+    name: str
+    description: str
+    system_prompt: str
+    chunking: Chunking | None = None
+
+
+class ChatUpdate(BaseModel):
+    name: str | None = None
+    description: str | None = None
+    system_prompt: str | None = None
+    chunking: Chunking | None = None
+
+
+class Query(BaseModel):
+    question: str
+    retriver: int = 1
+    save: bool = True
+    trace: bool = False
+
+
+def chat_info(chat):
+    return {
+        "id": chat.id,
+        "name": chat.name,
+        "description": chat.description,
+        "system_prompt": chat.system_prompt,
+        "database_id": chat.database_id,
+        "chunking": chat.chunking,
+    }
+
+
+def get_chat(chat_id):
+    chat = chat_manager.get_chat_by_id(chat_id)
+    if chat is None:
+        raise HTTPException(status_code=404, detail=f"Чат с ID {chat_id} не найден")
+    return chat
+
+
+@app.get("/chats")
+def list_chats():
+    return [chat_info(chat) for chat in list(chat_manager.chats)]
+
+
+@app.post("/chats")
+def create_chat(data: ChatCreate):
+    chunking = data.chunking.model_dump() if data.chunking else None
+    return chat_info(chat_manager.add_chat(data.name, data.description, data.system_prompt, chunking))
+
+
+@app.patch("/chats/{chat_id}")
+def update_chat(chat_id: str, data: ChatUpdate):
+    get_chat(chat_id)
+    chunking = data.chunking.model_dump() if data.chunking else None
+    chat_manager.update_chat(chat_id, data.name, data.description, data.system_prompt, chunking)
+    return chat_info(get_chat(chat_id))
+
+
+@app.delete("/chats/{chat_id}")
+def delete_chat(chat_id: str):
+    get_chat(chat_id)
+    chat_manager.delete_chat(chat_id)
+    return {"deleted": chat_id}
+
+
+@app.get("/chats/{chat_id}/messages")
+def chat_messages(chat_id: str):
+    return get_chat(chat_id).messages
+
+
+def save_turn(chat_id, question, answer):
+    chat_manager.add_message_to_chat(chat_id, {"role": "user", "content": question})
+    chat_manager.add_message_to_chat(chat_id, {"role": "assistant", "content": answer})
+
+
+@app.post("/chats/{chat_id}/query")
+async def query_chat(chat_id: str, data: Query):
+    # Менеджер чатов и SQLite блокируют поток, поэтому вызываются вне цикла событий
+    chat = await run_in_threadpool(get_chat, chat_id)
+    if data.retriver not in (1, 2, 3, 4, 5):
+        raise HTTPException(status_code=422, detail="retriver должен быть от 1 до 5")
+    with trace("api_query", chat_id=chat.database_id, mode=data.retriver) as request:
+        with span("queue_wait"):
+            await rag_limiter.acquire()
+        try:
+            answer = await run_in_threadpool(
+                full_rag_request,
+                llm=llm,
+                question=data.question,
+                sys_prompt=chat.system_prompt,
+                database=database,
+                retriver=data.retriver,
+                chat_id=chat.database_id,
+                answer_cache=answer_cache,
+            )
+        finally:
+            rag_limiter.release()
+        if data.save:
+            await run_in_threadpool(save_turn, chat_id, data.question, answer)
+    if data.trace:
+        return {"answer": answer, "trace": request.to_dict() if tracing_enabled() else None}
+    return {"answer": answer}
+
+
+@app.get("/chats/{chat_id}/documents")
+def list_documents(chat_id: str):
+    return seatch_all_docs(database, get_chat(chat_id).database_id)
+
+
+@app.post("/chats/{chat_id}/documents")
+async def upload_documents(chat_id: str, files: list[UploadFile] = File(...)):
+    chat = await run_in_threadpool(get_chat, chat_id)
+    docs = []
+    for file in files:
+        data = await file.read()
+        docs.append(UploadedDoc(file.filename, len(data), file.content_type, data))
+    job_id = load_docs(docs, chat.database_id, database, job_queue, chat.chunking)
+    return {"job_id": job_id}
+
+
+@app.delete("/chats/{chat_id}/documents/{doc_id}")
+def delete_document(chat_id: str, doc_id: str):
+    delete_doc_in_bd(database, get_chat(chat_id).database_id, doc_id)
+    return {"deleted": doc_id}
+
+
+@app.get("/metrics")
+def prometheus_metrics():
+    return PlainTextResponse(metrics.render(), media_type=CONTENT_TYPE)
+
+
+@app.get("/jobs/{job_id}")
+def job_status(job_id: str):
+    job = job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Задача с ID {job_id} не найдена")
+    return job.to_dict()
+
+
+if __name__ == "__main__":
+    uvicorn.run(app, host=CONFIG.API_HOST, port=CONFIG.API_PORT)
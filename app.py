@@ -1,9 +1,8 @@
 import streamlit as st
 from pages.managerPage import manager_page
-from pages.chatPage import chat_page
+from pages.warmupPage import warmup_status
 # Сдедать логин либу для стреамлит
-from src.initialisateTols import load_database, load_embeddings, load_llm
-from src.chatTools import ChatManager
+from src.initialisateTols import load_resources, load_job_queue, load_answer_cache, load_chat_manager, load_metrics_server
 from CONFIG import CONFIG
 st.set_page_config(page_title="My App", page_icon="🔥", layout="wide")
 
@@ -12,16 +11,20 @@ st.set_page_config(page_title="My App", page_icon="🔥", layout="wide")
 ######################
 # Инициализация кеша #
 ######################
-embending = load_embeddings('cpu')
-database = load_database(embending, CONFIG.FAISS_INDEX_PATH)
-llm = load_llm(CONFIG.OPENAI_API_KEY, CONFIG.OPENAI_PROXY)
+# Модели и хранилище грузятся в фоне, страница менеджера от них не зависит
+resources = load_resources()
+job_queue = load_job_queue(CONFIG.INGEST_JOB_WORKERS)
+answer_cache = load_answer_cache(CONFIG.ANSWER_CACHE_THRESHOLD, CONFIG.ANSWER_CACHE_SIZE)
+chat_manager = load_chat_manager(CONFIG.CHAT_DB_PATH, CONFIG.CHATLIST_INDEX_PATH)
+if CONFIG.TRACE_ENABLED and CONFIG.METRICS_PORT:
+    load_metrics_server(CONFIG.METRICS_HOST, CONFIG.METRICS_PORT)
 
 ########################
 # Инициализация сессии #
 ########################
 
 if "chat_manager" not in st.session_state:
-    st.session_state.chat_manager = ChatManager(CONFIG.CHATLIST_INDEX_PATH)
+    st.session_state.chat_manager = chat_manager
 
 if "chats" not in st.session_state:
    st.session_state.chats = st.session_state.chat_manager.chats
@@ -29,6 +32,10 @@ if "chats" not in st.session_state:
 if "selected_chat" not in st.session_state:
     st.session_state.selected_chat = None
 
+# Чат могли удалить из другой сессии
+if st.session_state.selected_chat and not chat_manager.get_chat_by_id(st.session_state.selected_chat.id):
+    st.session_state.selected_chat = None
+
 if "messages" not in st.session_state:
         if st.session_state.selected_chat:
             st.session_state.messages = st.session_state.selected_chat.messages
@@ -39,10 +46,20 @@ if "messages" not in st.session_state:
 
 
 
+def chat():
+    if not resources.ready:
+        warmup_status(resources)
+        return
+    # Страница чата тянет langchain, импортируется после фоновой загрузки
+    from pages.chatPage import chat_page
+    chat_page(resources.get("database"), resources.get("llm"), job_queue, answer_cache)
+
+
 if __name__ == "__main__":
     pg = st.navigation([
         st.Page(manager_page, title="Manager", icon="💬"),
-        st.Page(lambda: chat_page(database, llm, CONFIG.FAISS_INDEX_PATH), title="Chat", icon="📂"),],
+        st.Page(chat, title="Chat", icon="📂"),],
         position='sidebar')
 
-    pg.run()
\ No newline at end of file
+    pg.run()
+    resources.mark_ui()
\ No newline at end of file
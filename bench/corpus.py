@@ -0,0 +1,99 @@
+import random
+from src.ingestTools import UploadedDoc
+
+SYLLABLES = ["ка", "ло", "ми", "ра", "то", "не", "за", "ви", "су", "де", "по", "ры", "ва", "ле", "ну", "ко", "ти", "са", "мо", "жи"]
+
+
+def make_vocabulary(size, seed=0):
+    """
+    Генерирует словарь псевдослов.
+
+    :param size: Число слов.
+    :param seed: Зерно генератора.
+    :return: Список уникальных слов.
+    """
+    rng = random.Random(seed)
+    words = set()
+    while len(words) < size:
+        words.add("".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))))
+    return sorted(words)
+
+
+class SyntheticCorpus:
+    """
+    Синтетический корпус для нескольких чатов: у каждого чата своя тематическая
+    часть словаря, документы состоят из предложений по 8–20 слов.
+    """
+    def __init__(self, chats, docs_per_chat, words_per_doc=1500, vocabulary=5000, seed=0):
+        """
+        Инициализация генератора.
+
+        :param chats: Число чатов.
+        :param docs_per_chat: Документов на чат.
+        :param words_per_doc: Слов в документе.
+        :param vocabulary: Размер общего словаря.
+        :param seed: Зерно генератора.
+        """
+        self.chats = chats
+        self.docs_per_chat = docs_per_chat
+        self.words_per_doc = words_per_doc
+        self.seed = seed
+        self.words = make_vocabulary(vocabulary, seed)
+
+    def _topic(self, chat_idx):
+        rng = random.Random(self.seed * 1000 + chat_idx)
+        return rng.sample(self.words, len(self.words) // 10)
+
+    def _sentence(self, rng, topic):
+        words = [rng.choice(topic if rng.random() < 0.6 else self.words) for _ in range(rng.randint(8, 20))]
+        return " ".join(words).capitalize() + "."
+
+    def document(self, chat_idx, doc_idx):
+        """
+        Генерирует текст документа.
+
+        :param chat_idx: Номер чата.
+        :param doc_idx: Номер документа в чате.
+        :return: Текст документа.
+        """
+        rng = random.Random(f"{self.seed}-{chat_idx}-{doc_idx}")
+        topic = self._topic(chat_idx)
+        sentences, count = [], 0
+        while count < self.words_per_doc:
+            sentence = self._sentence(rng, topic)
+            sentences.append(sentence)
+            count += sentence.count(" ") + 1
+            if rng.random() < 0.15:
+                sentences.append("\n\n")
+        return " ".join(sentences)
+
+    def uploads(self, chat_idx):
+        """
+        Возвращает документы чата в виде загруженных файлов.
+
+        :param chat_idx: Номер чата.
+        :return: Список объектов UploadedDoc.
+        """
+        docs = []
+        for doc_idx in range(self.docs_per_chat):
+            data = self.document(chat_idx, doc_idx).encode("utf-8")
+            docs.append(UploadedDoc(f"doc_{chat_idx}_{doc_idx}.txt", len(data), "text/plain", data))
+        return docs
+
+    def queries(self, chat_idx, count):
+        """
+        Генерирует вопросы к чату: куски предложений его документов.
+
+        :param chat_idx: Номер чата.
+        :param count: Число вопросов.
+        :return: Список строк.
+        """
+        rng = random.Random(f"q-{self.seed}-{chat_idx}")
+        queries = []
+        for _ in range(count):
+            text = self.document(chat_idx, rng.randrange(self.docs_per_chat))
+            sentence = rng.choice([part for part in text.split(". ") if len(part.split()) > 5])
+            words = sentence.split()
+            start = rng.randrange(len(words) - 4)
+            queries.append(" ".join(words[start:start + rng.randint(4, 8)]) + "?")
+        return queries
@@ -0,0 +1,100 @@
+import re
+import time
+import zlib
+import threading
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+WORD_PATTERN = re.compile(r"\w+")
+
+
+class FakeEmbeddings(Embeddings):
+    """
+    Детерминированная модель эмбеддингов без сети: вектор текста — нормированная
+    сумма псевдослучайных векторов его слов. Похожие тексты дают близкие векторы,
+    поэтому поиск по синтетическому корпусу осмыслен.
+    """
+    def __init__(self, dim=1024, batch_latency=0.0, text_latency=0.0):
+        """
+        Инициализация модели.
+
+        :param dim: Размерность векторов (1024 — как у multilingual-e5-large).
+        :param batch_latency: Задержка на один вызов модели, секунды.
+        :param text_latency: Дополнительная задержка на каждый текст батча, секунды.
+        """
+        self.dim = dim
+        self.batch_latency = batch_latency
+        self.text_latency = text_latency
+        self.calls = 0
+        self._words = {}
+        self._lock = threading.Lock()
+
+    def _word(self, word):
+        vector = self._words.get(word)
+        if vector is None:
+            vector = np.random.default_rng(zlib.crc32(word.encode("utf-8"))).standard_normal(self.dim).astype(np.float32)
+            with self._lock:
+                self._words[word] = vector
+        return vector
+
+    def _embed(self, text):
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for word in WORD_PATTERN.findall(text.lower()):
+            vector += self._word(word)
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).tolist()
+
+    def embed_documents(self, texts):
+        self.calls += 1
+        time.sleep(self.batch_latency + self.text_latency * len(texts))
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+
+class FakeChatModel(BaseChatModel):
+    """
+    Языковая модель с фиксированным ответом и настраиваемой задержкой.
+    Ответ начинается с процента, чтобы его разбирал валидатор чанков (глубина поиска 5).
+    """
+    latency: float = 0.0
+    answer: str = "85%\nСинтетический ответ для бенчмарка.\nВторой вариант вопроса."
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        time.sleep(self.latency)
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=self.answer))])
+
+    @property
+    def _llm_type(self):
+        return "fake-bench"
+
+
+class FakeCrossEncoder:
+    """
+    Кросс-энкодер без модели: оценка пары — доля слов вопроса, встречающихся
+    в чанке. Повторяет интерфейс CrossEncoder.predict.
+    """
+    def __init__(self, batch_latency=0.0, pair_latency=0.0):
+        """
+        Инициализация модели.
+
+        :param batch_latency: Задержка на один батч, секунды.
+        :param pair_latency: Дополнительная задержка на каждую пару, секунды.
+        """
+        self.batch_latency = batch_latency
+        self.pair_latency = pair_latency
+
+    def predict(self, pairs, batch_size=32, show_progress_bar=False):
+        scores = []
+        for start in range(0, len(pairs), batch_size):
+            batch = pairs[start:start + batch_size]
+            time.sleep(self.batch_latency + self.pair_latency * len(batch))
+            for question, text in batch:
+                words = set(WORD_PATTERN.findall(question.lower()))
+                found = set(WORD_PATTERN.findall(text.lower()))
+                scores.append(len(words & found) / len(words) if words else 0.0)
+        return np.asarray(scores, dtype=np.float32)
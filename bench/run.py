@@ -0,0 +1,288 @@
+"""
+Офлайн-бенчмарк горячих путей: загрузка документов, поиск (все режимы),
+список и удаление документов, сохранение чатов и полный запрос RAG.
+
+Сеть не нужна: эмбеддинги и LLM заменены детерминированными фейками (bench/fakes.py),
+корпус генерируется (bench/corpus.py). Запуск из корня проекта:
+    python -m bench.run --quick
+    python -m bench.run --chats 2 8 --docs 10 50 --concurrency 1 4 16 --save bench/baselines/my.json
+    python -m bench.run --quick --compare bench/baselines/quick.json
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import tempfile
+import argparse
+import platform
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from CONFIG import CONFIG
+from src.storeTools import PartitionedStore
+from src.jobTools import JobQueue
+from src.cacheTools import SemanticCache, LRUCache
+from src.chatTools import ChatManager
+from src.embeddingTools import BatchedEmbeddings
+from src.traceTools import configure as configure_tracing
+import src.aiTools as ai_tools
+from src.aiTools import load_docs, base_retriver, seatch_all_docs, delete_doc_in_bd, full_rag_request
+from bench.fakes import FakeEmbeddings, FakeChatModel, FakeCrossEncoder
+from bench.corpus import SyntheticCorpus
+
+# Метрики, по которым сравнение с базовой линией ищет регрессии: больше — хуже / меньше — хуже
+LOWER_IS_BETTER = ("p50_ms", "p95_ms", "p99_ms")
+HIGHER_IS_BETTER = ("throughput",)
+
+
+def latency_stats(samples):
+    """
+    Считает перцентили задержки.
+
+    :param samples: Список задержек в секундах.
+    :return: Словарь с p50_ms, p95_ms, p99_ms и mean_ms.
+    """
+    samples = np.asarray(samples) * 1000
+    return {
+        "p50_ms": float(np.percentile(samples, 50)),
+        "p95_ms": float(np.percentile(samples, 95)),
+        "p99_ms": float(np.percentile(samples, 99)),
+        "mean_ms": float(samples.mean()),
+    }
+
+
+def run_concurrent(fn, items, concurrency):
+    """
+    Выполняет fn(item) для всех items с заданной конкурентностью.
+
+    :param fn: Функция одного запроса.
+    :param items: Аргументы запросов.
+    :param concurrency: Число одновременных запросов.
+    :return: Словарь со статистикой задержки и пропускной способностью (запросов в секунду).
+    """
+    def timed(item):
+        start = time.perf_counter()
+        fn(item)
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        latencies = list(pool.map(timed, items))
+    wall = time.perf_counter() - start
+    return {**latency_stats(latencies), "throughput": len(items) / wall, "count": len(items)}
+
+
+def bench_ingest(store, corpus, chat_ids):
+    """
+    Загружает корпус через фоновую очередь, как это делает интерфейс.
+
+    :return: Словарь с метриками загрузки.
+    """
+    job_queue = JobQueue(workers=CONFIG.INGEST_JOB_WORKERS)
+    start = time.perf_counter()
+    job_ids = [load_docs(corpus.uploads(idx), chat_id, store, job_queue) for idx, chat_id in enumerate(chat_ids)]
+    latencies = []
+    for job_id in job_ids:
+        job = job_queue.get(job_id)
+        while job.active:
+            time.sleep(0.01)
+        if job.status == "error":
+            raise RuntimeError(job.error)
+        latencies.append(job.finished - job.created)
+    wall = time.perf_counter() - start
+    chunks = sum(doc["chunks_count"] for chat_id in chat_ids for doc in store.list_documents(chat_id))
+    docs = corpus.docs_per_chat * len(chat_ids)
+    return {**latency_stats(latencies), "throughput": docs / wall, "chunks_per_s": chunks / wall, "chunks": chunks}
+
+
+def bench_chat_manager(root, chats, messages):
+    """
+    Замеряет сохранение чатов и добавление сообщений.
+
+    :return: Список результатов (save_chats и add_message).
+    """
+    path = os.path.join(root, "chats.sqlite3")
+    manager = ChatManager(path)
+    for idx in range(chats):
+        chat = manager.add_chat(f"chat_{idx}", "Бенчмарк", "Системный промпт")
+        for msg_idx in range(messages):
+            manager.add_message_to_chat(chat.id, {"role": "user", "content": f"Сообщение {msg_idx}"})
+    chat_ids = [chat.id for chat in manager.chats]
+    return [
+        {"scenario": "save_chats", **run_concurrent(lambda _: manager.save_chats(), range(20), 1)},
+        {"scenario": "add_message", **run_concurrent(
+            lambda idx: manager.add_message_to_chat(chat_ids[idx % len(chat_ids)], {"role": "user", "content": "Вопрос"}),
+            range(200), 1)},
+    ]
+
+
+def run_suite(args):
+    """
+    Прогоняет все сценарии по сетке параметров.
+
+    :param args: Аргументы командной строки.
+    :return: Список результатов.
+    """
+    results = []
+    for chats in args.chats:
+        for docs in args.docs:
+            root = tempfile.mkdtemp(prefix="rag_bench_")
+            try:
+                params = {"chats": chats, "docs": docs}
+                embedding = FakeEmbeddings(args.dim, args.embed_batch_latency, args.embed_text_latency)
+                # Обертки и хранилище настроены как в load_embeddings / load_database
+                batch_size = 0 if args.no_batching else CONFIG.QUERY_BATCH_SIZE
+                if batch_size:
+                    embedding = BatchedEmbeddings(embedding, batch_size, CONFIG.QUERY_BATCH_WAIT_MS / 1000)
+                llm = FakeChatModel(latency=args.llm_latency)
+                # Переранжировщик глубины поиска 3 со свежим кэшем оценок
+                ai_tools._reranker.model = FakeCrossEncoder(args.rerank_batch_latency, args.rerank_pair_latency)
+                ai_tools._reranker.scores = LRUCache(CONFIG.RERANK_CACHE_SIZE)
+                store = PartitionedStore(embedding, os.path.join(root, "db"), max_partitions=CONFIG.PARTITION_CACHE_SIZE,
+                                         compact_bytes=CONFIG.WAL_COMPACT_BYTES, search_batch=batch_size,
+                                         search_wait=CONFIG.QUERY_BATCH_WAIT_MS / 1000)
+                corpus = SyntheticCorpus(chats, docs, words_per_doc=args.words, seed=args.seed)
+                chat_ids = [f"bench_chat_{idx}" for idx in range(chats)]
+
+                results.append({"scenario": "ingest", **params, **bench_ingest(store, corpus, chat_ids)})
+                print(json.dumps(results[-1], ensure_ascii=False), flush=True)
+
+                queries = [(chat_ids[idx % chats], query)
+                           for idx, query in enumerate(q for c in range(chats) for q in corpus.queries(c, args.queries))]
+
+                for mode in args.modes:
+                    for concurrency in args.concurrency:
+                        row = run_concurrent(lambda item: base_retriver(item[1], item[0], llm, store, mode), queries, concurrency)
+                        results.append({"scenario": "retrieve", "mode": mode, "concurrency": concurrency, **params, **row})
+                        print(json.dumps(results[-1], ensure_ascii=False), flush=True)
+
+                for concurrency in args.concurrency:
+                    row = run_concurrent(
+                        lambda item: full_rag_request(llm, item[1], "Ты помощник.", store, 1, item[0]), queries, concurrency)
+                    results.append({"scenario": "rag", "concurrency": concurrency, **params, **row})
+                    print(json.dumps(results[-1], ensure_ascii=False), flush=True)
+
+                # Повтор тех же вопросов: вторая половина отвечается из семантического кэша
+                answer_cache = SemanticCache(CONFIG.ANSWER_CACHE_THRESHOLD, CONFIG.ANSWER_CACHE_SIZE)
+                row = run_concurrent(
+                    lambda item: full_rag_request(llm, item[1], "Ты помощник.", store, 1, item[0], answer_cache),
+                    queries * 2, 1)
+                results.append({"scenario": "rag_cached", **params, **row, "hit_rate": answer_cache.stats()["hit_rate"]})
+                print(json.dumps(results[-1], ensure_ascii=False), flush=True)
+
+                row = run_concurrent(lambda chat_id: seatch_all_docs(store, chat_id), chat_ids * 20, 1)
+                results.append({"scenario": "list_docs", **params, **row})
+
+                doc_ids = [(chat_id, doc["doc_id"]) for chat_id in chat_ids for doc in store.list_documents(chat_id)]
+                doc_ids = doc_ids[::max(1, len(doc_ids) // 20)]
+                row = run_concurrent(lambda item: delete_doc_in_bd(store, item[0], item[1]), doc_ids, 1)
+                results.append({"scenario": "delete_doc", **params, **row})
+                print(json.dumps(results[-1], ensure_ascii=False), flush=True)
+
+                for row in bench_chat_manager(root, chats * 10, args.messages):
+                    results.append({**row, **params})
+                    print(json.dumps(results[-1], ensure_ascii=False), flush=True)
+            finally:
+                shutil.rmtree(root, ignore_errors=True)
+    return results
+
+
+def result_key(row):
+    return tuple((name, row.get(name)) for name in ("scenario", "chats", "docs", "mode", "concurrency"))
+
+
+def compare(results, baseline, tolerance, min_ms=1.0):
+    """
+    Сравнивает результаты с базовой линией.
+
+    :param results: Текущие результаты.
+    :param baseline: Результаты базовой линии.
+    :param tolerance: Допустимое ухудшение (доля, например 0.2).
+    :param min_ms: Рост задержки (или времени на запрос для пропускной способности) меньше
+                   этого порога (мс) не считается регрессией — это шум.
+    :return: Список строк с регрессиями.
+    """
+    previous = {result_key(row): row for row in baseline}
+    regressions = []
+    for row in results:
+        old = previous.get(result_key(row))
+        if old is None:
+            continue
+        for metric in LOWER_IS_BETTER + HIGHER_IS_BETTER:
+            if metric not in row or not old.get(metric):
+                continue
+            ratio = row[metric] / old[metric]
+            if metric in LOWER_IS_BETTER:
+                worse = ratio > 1 + tolerance and row[metric] - old[metric] > min_ms
+            else:
+                worse = ratio < 1 - tolerance and 1000 / row[metric] - 1000 / old[metric] > min_ms
+            if worse:
+                label = ", ".join(f"{name}={value}" for name, value in result_key(row) if value is not None)
+                regressions.append(f"{label}: {metric} {old[metric]:.2f} -> {row[metric]:.2f} ({ratio:.2f}x)")
+    return regressions
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True).stdout.strip()
+    except OSError:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Офлайн-бенчмарк RAG MVP")
+    parser.add_argument("--quick", action="store_true", help="Маленькая сетка для быстрой проверки")
+    parser.add_argument("--chats", type=int, nargs="+", default=[2, 8], help="Число чатов")
+    parser.add_argument("--docs", type=int, nargs="+", default=[10, 50], help="Документов на чат")
+    parser.add_argument("--words", type=int, default=1500, help="Слов в документе")
+    parser.add_argument("--queries", type=int, default=25, help="Вопросов на чат")
+    parser.add_argument("--messages", type=int, default=50, help="Сообщений на чат в сценарии ChatManager")
+    parser.add_argument("--modes", type=int, nargs="+", default=[1, 2, 3, 4, 5], help="Режимы base_retriver")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16], help="Одновременных запросов")
+    parser.add_argument("--dim", type=int, default=1024, help="Размерность фейковых эмбеддингов")
+    parser.add_argument("--embed-batch-latency", type=float, default=0.02, help="Задержка фейковой модели на батч, с")
+    parser.add_argument("--embed-text-latency", type=float, default=0.002, help="Задержка фейковой модели на текст, с")
+    parser.add_argument("--llm-latency", type=float, default=0.05, help="Задержка фейковой LLM на вызов, с")
+    parser.add_argument("--rerank-batch-latency", type=float, default=0.01, help="Задержка фейкового кросс-энкодера на батч, с")
+    parser.add_argument("--rerank-pair-latency", type=float, default=0.0005, help="Задержка фейкового кросс-энкодера на пару, с")
+    parser.add_argument("--no-batching", action="store_true", help="Без микробатчинга запросов (CONFIG.QUERY_BATCH_SIZE)")
+    parser.add_argument("--no-tracing", action="store_true", help="Выключить замеры этапов (CONFIG.TRACE_ENABLED)")
+    parser.add_argument("--trace-log", default="", help="Куда писать JSON-трассы запросов (по умолчанию не писать)")
+    parser.add_argument("--seed", type=int, default=0, help="Зерно генератора корпуса")
+    parser.add_argument("--save", help="Сохранить результаты в JSON")
+    parser.add_argument("--compare", help="Сравнить с базовой линией из JSON")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Допустимое ухудшение при сравнении")
+    parser.add_argument("--min-ms", type=float, default=1.0, help="Минимальный рост задержки (мс) для регрессии")
+    args = parser.parse_args()
+    if args.quick:
+        args.chats, args.docs, args.concurrency, args.queries, args.words = [2], [5], [1, 4], 10, 800
+    configure_tracing(enabled=not args.no_tracing, log=args.trace_log)
+
+    results = run_suite(args)
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "cpus": os.cpu_count(),
+            "args": {key: value for key, value in vars(args).items() if key not in ("save", "compare", "trace_log")},
+        },
+        "results": results,
+    }
+    if args.save:
+        os.makedirs(os.path.dirname(args.save) or ".", exist_ok=True)
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            regressions = compare(results, json.load(f)["results"], args.tolerance, args.min_ms)
+        for line in regressions:
+            print(f"РЕГРЕССИЯ {line}")
+        if regressions:
+            sys.exit(1)
+        print("Регрессий нет")
+
+
+if __name__ == "__main__":
+    main()
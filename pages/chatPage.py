@@ -1,7 +1,50 @@
 import streamlit as st
-from src.aiTools import load_docs, seatch_all_docs, delete_doc_in_bd, full_rag_request
+from src.aiTools import load_docs, seatch_all_docs, delete_doc_in_bd, stream_rag_request
+from src.traceTools import trace, enabled as tracing_enabled
+from src.embeddingTools import CachedEmbeddings
+from CONFIG import CONFIG
 
-def chat_page(db, llm_model, index_path):
+@st.fragment(run_every=CONFIG.JOB_POLL_SECONDS)
+def ingest_status(job_queue, table_id):
+    """
+    Показывает прогресс фоновых загрузок чата. Перерисовывается по таймеру,
+    после завершения загрузки перезапускает страницу, чтобы обновить список файлов.
+
+    :param job_queue: Очередь фоновых задач (JobQueue).
+    :param table_id: Идентификатор таблицы/чата.
+    """
+    seen_jobs = st.session_state.setdefault("seen_jobs", set())
+    for job in job_queue.jobs_for(table_id):
+        if job.id in seen_jobs:
+            continue
+        if job.status == "done":
+            seen_jobs.add(job.id)
+            st.rerun()
+        elif job.status == "error":
+            st.error(f"Ошибка загрузки: {job.error}")
+        else:
+            for file in job.files:
+                if file["total"] is None:
+                    st.progress(0.0, text=f'{file["name"]} — в очереди')
+                else:
+                    st.progress(file["done"] / file["total"] if file["total"] else 1.0, text=f'{file["name"]} — {file["done"]}/{file["total"]}')
+
+def trace_view(request_trace):
+    """
+    Показывает этапы последнего запроса чата с длительностями и атрибутами.
+
+    :param request_trace: Завершенная трасса (Trace).
+    """
+    st.caption(f'Всего {request_trace.duration * 1000:.0f} мс, трасса {request_trace.id}')
+    lines = []
+    for stage in request_trace.spans:
+        attrs = " ".join(f"{key}={value}" for key, value in stage.items()
+                         if key not in ("name", "depth", "offset_ms", "ms") and value is not None)
+        lines.append(f'{"  " * stage["depth"]}{stage["name"]:<{24 - 2 * stage["depth"]}} {stage["ms"] or 0:>9.1f} мс  {attrs}'.rstrip())
+    lines.extend(f"{name}: {value}" for name, value in request_trace.counters.items())
+    st.code("\n".join(lines), language=None)
+
+def chat_page(db, llm_model, job_queue, answer_cache):
 
     ########################################
     # Параметры чата и загрузка документов #
@@ -14,12 +57,23 @@ def chat_page(db, llm_model, index_path):
             options=[
                 "1",
                 "2",
-                "3",],)
+                "3",
+                "4",
+                "5",],)
+
+            cache_stats = answer_cache.stats()
+            st.caption(f'Кэш ответов: {cache_stats["hits"]} из {cache_stats["hits"] + cache_stats["misses"]} ({cache_stats["hit_rate"]:.0%})')
+            if isinstance(db.embedding, CachedEmbeddings):
+                embedding_stats = db.embedding.stats()
+                st.caption(f'Кэш эмбеддингов: {embedding_stats["hits"]} из {embedding_stats["hits"] + embedding_stats["misses"]} '
+                           f'({embedding_stats["hit_rate"]:.0%}), векторов: {embedding_stats["items"]}')
 
             st.title("Загрузка файла")
             uploaded_files = st.file_uploader(label = 'Загрузка файла', type = [".txt"], accept_multiple_files=True, label_visibility='collapsed')
             if st.button('Загрузить', disabled=bool(False if uploaded_files != [] else True),use_container_width=True):
-                load_docs(uploaded_files, st.session_state.selected_chat.database_id, db, index_path)
+                load_docs(uploaded_files, st.session_state.selected_chat.database_id, db, job_queue, st.session_state.selected_chat.chunking)
+
+            ingest_status(job_queue, st.session_state.selected_chat.database_id)
 
             st.title("Список файлов")
             stats = seatch_all_docs(db, st.session_state.selected_chat.database_id)
@@ -29,9 +83,12 @@ def chat_page(db, llm_model, index_path):
                 col2.write(doc["doc_size"])
                 col3.write(doc["doc_date"])
                 if col4.button('Удалить', use_container_width=True, key=f"Data_button-{idx}"):
-                    delete_doc_in_bd(db, doc["doc_id"], index_path)
+                    delete_doc_in_bd(db, st.session_state.selected_chat.database_id, doc["doc_id"])
                     st.rerun()
 
+            # Заполняется в конце страницы, когда трасса текущего запроса уже готова
+            trace_box = st.empty()
+
     #############
     # Окно чата #
     #############
@@ -42,22 +99,30 @@ def chat_page(db, llm_model, index_path):
                     st.markdown(message["content"])
 
         if prompt := st.chat_input("Введите сообщение:"):
-            user_message = {"role": "user", "content": prompt}
-            st.session_state.chat_manager.add_message_to_chat(st.session_state.selected_chat.id, user_message)
+            with trace("chat_turn", chat_id=st.session_state.selected_chat.database_id, mode=int(rag_deep)) as turn:
+                user_message = {"role": "user", "content": prompt}
+                st.session_state.chat_manager.add_message_to_chat(st.session_state.selected_chat.id, user_message)
+
 
+                with st.chat_message("user"):
+                    st.markdown(prompt)
 
-            with st.chat_message("user"):
-                st.markdown(prompt)
+                with st.chat_message("assistant"):
+                    response = st.write_stream(stream_rag_request(
+                                                llm=llm_model,
+                                                question=prompt,
+                                                sys_prompt = st.session_state.selected_chat.system_prompt,
+                                                database=db,
+                                                retriver=int(rag_deep),
+                                                chat_id=st.session_state.selected_chat.database_id,
+                                                answer_cache=answer_cache
+                                            ))
 
-            with st.chat_message("assistant"):
-                response = full_rag_request(
-                                            llm=llm_model,
-                                            question=prompt,
-                                            sys_prompt = st.session_state.selected_chat.system_prompt,
-                                            database=db,
-                                            retriver=int(rag_deep),
-                                            chat_id=st.session_state.selected_chat.database_id
-                                        )
-                st.markdown(response)
+                st.session_state.chat_manager.add_message_to_chat(st.session_state.selected_chat.id, {"role": "assistant", "content": response})
+            if tracing_enabled():
+                st.session_state.last_trace = turn
 
-            st.session_state.chat_manager.add_message_to_chat(st.session_state.selected_chat.id, {"role": "assistant", "content": response})
+        if st.session_state.get("last_trace") is not None:
+            with trace_box.container():
+                with st.expander("Трассировка последнего запроса"):
+                    trace_view(st.session_state.last_trace)
@@ -1,4 +1,5 @@
 import streamlit as st
+from CONFIG import CONFIG
 def manager_page():
 
     select_chunk, create_chunk = st.columns([0.3, 0.7])
@@ -32,10 +33,24 @@ def manager_page():
             chat_description = st.text_area("Описание", value='', placeholder="Введите описание чата...")
             sys_prompt = st.text_area("Системный промпт", value='', height=220, placeholder="Введите системный промпт...")
 
+            with st.expander("Нарезка документов"):
+                strategies = ["recursive", "sentence", "token"]
+                chunk_strategy = st.selectbox("Стратегия", options=strategies, index=strategies.index(CONFIG.CHUNK_STRATEGY))
+                size_col, overlap_col = st.columns(2)
+                # Для token размер в токенах и не больше длины входа модели эмбеддингов
+                max_size = CONFIG.TOKEN_CHUNK_MAX_SIZE if chunk_strategy == "token" else None
+                chunk_size = size_col.number_input("Размер чанка", min_value=50, max_value=max_size, value=min(CONFIG.CHUNK_SIZE, max_size or CONFIG.CHUNK_SIZE), step=50)
+                chunk_overlap = overlap_col.number_input("Перекрытие", min_value=0, max_value=int(chunk_size) - 1, value=min(CONFIG.CHUNK_OVERLAP, int(chunk_size) - 1), step=10)
+
             all_fields_filled = bool(chat_name.strip() and chat_description.strip() and sys_prompt.strip())
 
             if st.button("Создать чат", disabled=not all_fields_filled, use_container_width=True):
-                st.session_state.chat_manager.add_chat(chat_name, chat_description, sys_prompt)
+                st.session_state.chat_manager.add_chat(
+                    chat_name,
+                    chat_description,
+                    sys_prompt,
+                    chunking={"size": int(chunk_size), "overlap": int(chunk_overlap), "strategy": chunk_strategy},
+                )
                 st.session_state.chats = st.session_state.chat_manager.chats
                 st.rerun()
 
@@ -0,0 +1,34 @@
+import streamlit as st
+from CONFIG import CONFIG
+
+STEP_TITLES = {
+    "modules": "Библиотеки",
+    "embeddings": "Модель эмбеддингов",
+    "database": "Хранилище документов",
+    "llm": "Языковая модель",
+    "api": "HTTP API",
+}
+
+@st.fragment(run_every=CONFIG.JOB_POLL_SECONDS)
+def warmup_status(warmup):
+    """
+    Показывает состояние фоновой загрузки ресурсов. Перерисовывается по таймеру,
+    после готовности перезапускает страницу.
+
+    :param warmup: Фоновая загрузка ресурсов (Warmup).
+    """
+    if warmup.ready:
+        st.rerun()
+    if warmup.error:
+        st.error(f"Ошибка загрузки ресурсов: {warmup.error}")
+        return
+
+    st.info("Загрузка моделей, страница чата откроется автоматически...")
+    for step in warmup.steps:
+        title = STEP_TITLES.get(step, step)
+        if step in warmup.timings:
+            st.write(f"✅ {title} — {warmup.timings[step]:.1f} с")
+        elif step == warmup.current:
+            st.write(f"⏳ {title}")
+        else:
+            st.write(f"▫️ {title}")
@@ -0,0 +1,109 @@
+"""
+Проверка совпадения эмбеддингов ONNX-бэкенда с исходной моделью sentence-transformers.
+
+Запуск из корня проекта:
+    python -m scripts.check_embeddings
+    python -m scripts.check_embeddings --float32 --corpus my_corpus.txt --queries my_queries.txt
+
+Печатает косинусные расхождения векторов, recall@k поиска по корпусу
+относительно исходной модели и скорость обоих бэкендов (текстов в секунду).
+"""
+import os
+import time
+import json
+import argparse
+import numpy as np
+from langchain_huggingface import HuggingFaceEmbeddings
+from CONFIG import CONFIG
+from src.embeddingTools import OnnxEmbeddings
+
+FIXTURES = os.path.join(os.path.dirname(__file__), "fixtures")
+
+
+def read_lines(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+def timed_embed(embedding, texts):
+    """
+    Считает эмбеддинги и замеряет скорость.
+
+    :param embedding: Модель эмбеддингов.
+    :param texts: Список текстов.
+    :return: Кортеж (матрица векторов, текстов в секунду).
+    """
+    start = time.perf_counter()
+    vectors = np.asarray(embedding.embed_documents(texts), dtype=np.float32)
+    return vectors, len(texts) / (time.perf_counter() - start)
+
+
+def normalize(vectors):
+    return vectors / np.clip(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12, None)
+
+
+def parity_report(reference, candidate, corpus, queries, k=10):
+    """
+    Сравнивает две модели эмбеддингов на корпусе и запросах.
+
+    :param reference: Исходная модель.
+    :param candidate: Проверяемая модель.
+    :param corpus: Список текстов корпуса.
+    :param queries: Список запросов.
+    :param k: Глубина поиска для recall@k.
+    :return: Словарь с метриками.
+    """
+    ref_corpus, ref_speed = timed_embed(reference, corpus)
+    new_corpus, new_speed = timed_embed(candidate, corpus)
+    ref_queries = np.asarray([reference.embed_query(query) for query in queries], dtype=np.float32)
+    new_queries = np.asarray([candidate.embed_query(query) for query in queries], dtype=np.float32)
+
+    deltas = 1 - np.sum(normalize(ref_corpus) * normalize(new_corpus), axis=1)
+    k = min(k, len(corpus))
+    ref_top = np.argsort(-normalize(ref_queries) @ normalize(ref_corpus).T, axis=1)[:, :k]
+    new_top = np.argsort(-normalize(new_queries) @ normalize(new_corpus).T, axis=1)[:, :k]
+    recall = np.mean([len(set(ref_top[i]) & set(new_top[i])) / k for i in range(len(queries))])
+
+    return {
+        "texts": len(corpus),
+        "queries": len(queries),
+        "cosine_delta_mean": float(deltas.mean()),
+        "cosine_delta_max": float(deltas.max()),
+        f"recall@{k}": float(recall),
+        "reference_texts_per_s": ref_speed,
+        "candidate_texts_per_s": new_speed,
+        "speedup": new_speed / ref_speed,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Сравнение ONNX-эмбеддингов с исходной моделью")
+    parser.add_argument("--model", default=CONFIG.EMBEDDINGS_MODEL, help="Имя или путь исходной модели")
+    parser.add_argument("--onnx", default=CONFIG.ONNX_MODEL_PATH, help="Каталог ONNX-модели")
+    parser.add_argument("--float32", action="store_true", help="Проверять неквантованную модель")
+    parser.add_argument("--corpus", default=os.path.join(FIXTURES, "parity_corpus.txt"), help="Корпус, по тексту на строку")
+    parser.add_argument("--queries", default=os.path.join(FIXTURES, "parity_queries.txt"), help="Запросы, по одному на строку")
+    parser.add_argument("--repeat", type=int, default=4, help="Во сколько раз размножить корпус для замера скорости")
+    args = parser.parse_args()
+
+    reference = HuggingFaceEmbeddings(
+        model_name=args.model,
+        model_kwargs={"device": "cpu"},
+        encode_kwargs={"batch_size": CONFIG.EMBEDDING_BATCH_SIZE},
+    )
+    candidate = OnnxEmbeddings(args.onnx, quantized=not args.float32, threads=CONFIG.ONNX_THREADS,
+                               batch_size=CONFIG.EMBEDDING_BATCH_SIZE)
+    corpus = read_lines(args.corpus)
+    report = parity_report(reference, candidate, corpus, read_lines(args.queries))
+
+    # Скорость на маленьком корпусе шумная, поэтому замер повторяется на размноженном
+    if args.repeat > 1:
+        _, ref_speed = timed_embed(reference, corpus * args.repeat)
+        _, new_speed = timed_embed(candidate, corpus * args.repeat)
+        report.update(reference_texts_per_s=ref_speed, candidate_texts_per_s=new_speed, speedup=new_speed / ref_speed)
+    print(json.dumps({"model": args.model, "onnx": args.onnx, "quantized": not args.float32, **report},
+                     ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
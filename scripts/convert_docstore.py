@@ -0,0 +1,65 @@
+"""
+Перевод хранилища FAISS на колоночный docstore (тексты и метаданные чанков в mmap-файлах
+вместо pickle InMemoryDocstore).
+
+Запуск из корня проекта:
+    python -m scripts.convert_docstore
+    python -m scripts.convert_docstore --root db/mvp_rag_database
+
+Старый общий индекс (index.faiss + index.pkl в корне) сначала разносится по разделам чатов.
+Снимки разделов в старом формате пересохраняются, старые index.pkl удаляются.
+Запускать при остановленном приложении.
+"""
+import os
+import time
+import argparse
+from CONFIG import CONFIG
+from src.storeTools import Partition, PartitionedStore, migrate_legacy_index
+from src.lockTools import acquire_writer
+from scripts.rebuild_index import partition_names
+
+
+def dir_size(path):
+    """
+    Возвращает суммарный размер файлов каталога.
+
+    :param path: Путь к каталогу.
+    :return: Размер в байтах.
+    """
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names)
+
+
+def load_partition(name, path):
+    start = time.perf_counter()
+    part = Partition(name, path, None)
+    part.load()
+    return part, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Перевод разделов FAISS на колоночный docstore")
+    parser.add_argument("--root", default=CONFIG.FAISS_INDEX_PATH, help="Корневой каталог хранилища")
+    args = parser.parse_args()
+
+    acquire_writer(os.path.join(args.root, ".lock"))
+    if os.path.isfile(os.path.join(args.root, "index.faiss")):
+        print("Перенос общего индекса по разделам чатов")
+        migrate_legacy_index(PartitionedStore(None, args.root), args.root)
+
+    for name in partition_names(args.root):
+        path = os.path.join(args.root, name)
+        part, load_before = load_partition(name, path)
+        if part.db is None or not part.legacy_snapshot:
+            continue
+        size_before = dir_size(path)
+        part.compact()
+        _, load_after = load_partition(name, path)
+        print(
+            f"{name}: {part.db.index.ntotal} чанков, "
+            f"{size_before / 2**20:.1f} -> {dir_size(path) / 2**20:.1f} МБ, "
+            f"загрузка {load_before:.2f} -> {load_after:.2f} с"
+        )
+
+
+if __name__ == "__main__":
+    main()
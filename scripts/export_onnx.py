@@ -0,0 +1,94 @@
+"""
+Экспорт модели эмбеддингов в ONNX и динамическая int8-квантизация.
+
+Запуск из корня проекта:
+    python -m scripts.export_onnx
+    python -m scripts.export_onnx --model intfloat/multilingual-e5-large --out models/multilingual-e5-large-onnx
+
+В каталоге --out появляются model.onnx (float32), model_quantized.onnx (int8)
+и файлы токенизатора. Каталог указывается в CONFIG.ONNX_MODEL_PATH.
+"""
+import os
+import argparse
+import torch
+from transformers import AutoModel, AutoTokenizer
+from onnxruntime.quantization import quantize_dynamic, QuantType
+from CONFIG import CONFIG
+
+
+class HiddenStates(torch.nn.Module):
+    """
+    Обертка, возвращающая из трансформера только last_hidden_state.
+    """
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+
+    def forward(self, input_ids, attention_mask):
+        return self.model(input_ids=input_ids, attention_mask=attention_mask).last_hidden_state
+
+
+def export(model_id, out, opset=17):
+    """
+    Экспортирует модель и токенизатор в ONNX.
+
+    :param model_id: Имя или путь модели HuggingFace.
+    :param out: Каталог для результата.
+    :param opset: Версия opset ONNX.
+    :return: Путь к model.onnx.
+    """
+    os.makedirs(out, exist_ok=True)
+    tokenizer = AutoTokenizer.from_pretrained(model_id)
+    tokenizer.save_pretrained(out)
+    model = HiddenStates(AutoModel.from_pretrained(model_id).eval())
+
+    sample = tokenizer(["query: пример", "passage: пример текста"], padding=True, return_tensors="pt")
+    model_file = os.path.join(out, "model.onnx")
+    with torch.no_grad():
+        torch.onnx.export(
+            model,
+            (sample["input_ids"], sample["attention_mask"]),
+            model_file,
+            input_names=["input_ids", "attention_mask"],
+            output_names=["last_hidden_state"],
+            dynamic_axes={
+                "input_ids": {0: "batch", 1: "sequence"},
+                "attention_mask": {0: "batch", 1: "sequence"},
+                "last_hidden_state": {0: "batch", 1: "sequence"},
+            },
+            opset_version=opset,
+            dynamo=False,
+        )
+    return model_file
+
+
+def quantize(model_file, out):
+    """
+    Динамически квантует веса модели в int8.
+
+    :param model_file: Путь к model.onnx.
+    :param out: Каталог для результата.
+    :return: Путь к model_quantized.onnx.
+    """
+    quantized_file = os.path.join(out, "model_quantized.onnx")
+    # Веса e5-large в float32 больше 2 ГБ и лежат во внешнем файле рядом с model.onnx,
+    # квантованная модель (~0.6 ГБ) помещается в один файл
+    quantize_dynamic(model_file, quantized_file, weight_type=QuantType.QInt8, use_external_data_format=False)
+    return quantized_file
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Экспорт модели эмбеддингов в ONNX")
+    parser.add_argument("--model", default=CONFIG.EMBEDDINGS_MODEL, help="Имя или путь модели HuggingFace")
+    parser.add_argument("--out", default=CONFIG.ONNX_MODEL_PATH, help="Каталог для ONNX-модели")
+    parser.add_argument("--no-quantize", action="store_true", help="Не делать int8-квантизацию")
+    args = parser.parse_args()
+
+    model_file = export(args.model, args.out)
+    print(f"ONNX: {model_file}")
+    if not args.no_quantize:
+        print(f"int8: {quantize(model_file, args.out)}")
+
+
+if __name__ == "__main__":
+    main()
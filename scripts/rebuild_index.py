@@ -0,0 +1,127 @@
+"""
+Пересборка индексов FAISS разделов под другую фабрику и отчет recall/latency.
+
+Запуск из корня проекта:
+    python -m scripts.rebuild_index --report --factories Flat HNSW32 "IVF256,SQ8" "IVF256,PQ64"
+    python -m scripts.rebuild_index --factory "IVF1024,SQ8"
+
+Пересборку нужно запускать при остановленном приложении: разделы пишутся напрямую на диск.
+Разделы, которым не хватает векторов для обучения фабрики (меньше FAISS_INDEX_MIN_VECTORS
+или числа кластеров IVF), получают плоский индекс, как при автоматическом переходе на IVF.
+"""
+import os
+import time
+import json
+import argparse
+import numpy as np
+import faiss
+from CONFIG import CONFIG
+from src.storeTools import Partition, build_index, reconstruct_rows, train_minimum, is_flat
+from src.lockTools import acquire_writer
+
+
+def partition_names(root):
+    """
+    Возвращает каталоги разделов хранилища.
+
+    :param root: Корневой каталог хранилища.
+    :return: Список имен каталогов.
+    """
+    return sorted(
+        name for name in os.listdir(root)
+        if os.path.isdir(os.path.join(root, name)) and not name.startswith(".")
+    )
+
+
+def recall_report(vectors, factories, queries=200, k=10, train_size=100000, nprobe=16):
+    """
+    Сравнивает фабрики индексов с точным поиском на векторах раздела.
+
+    :param vectors: Матрица векторов раздела (float32).
+    :param factories: Список строк фабрик FAISS.
+    :param queries: Число запросов (случайные векторы раздела с шумом).
+    :param k: Глубина поиска для recall@k.
+    :param train_size: Размер выборки для обучения IVF/PQ.
+    :param nprobe: Число просматриваемых кластеров IVF.
+    :return: Список словарей с factory, recall, ms_per_query и bytes
+             (или factory и skipped, если векторов раздела не хватает для обучения).
+    """
+    rng = np.random.default_rng(0)
+    query_rows = rng.choice(len(vectors), size=min(queries, len(vectors)), replace=False)
+    query_vectors = vectors[query_rows] + rng.normal(0, 0.01, size=(len(query_rows), vectors.shape[1])).astype(np.float32)
+
+    exact = faiss.IndexFlatL2(vectors.shape[1])
+    exact.add(vectors)
+    _, truth = exact.search(query_vectors, k)
+
+    report = []
+    ids = np.arange(len(vectors), dtype=np.int64)
+    for factory in factories:
+        minimum = train_minimum(vectors.shape[1], factory)
+        if minimum > len(vectors):
+            report.append({"factory": factory, "skipped": f"нужно не меньше {minimum} векторов"})
+            continue
+        sample = vectors[rng.choice(len(vectors), size=min(train_size, len(vectors)), replace=False)]
+        index = build_index(vectors.shape[1], factory, sample, nprobe)
+        index.add_with_ids(vectors, ids)
+
+        start = time.perf_counter()
+        _, found = index.search(query_vectors, k)
+        elapsed = time.perf_counter() - start
+
+        recall = np.mean([len(set(found[i]) & set(truth[i])) / k for i in range(len(query_vectors))])
+        report.append({
+            "factory": factory,
+            "recall": float(recall),
+            "ms_per_query": elapsed * 1000 / len(query_vectors),
+            "bytes": int(faiss.serialize_index(index).size),
+        })
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Пересборка индексов FAISS разделов чатов")
+    parser.add_argument("--root", default=CONFIG.FAISS_INDEX_PATH, help="Корневой каталог хранилища")
+    parser.add_argument("--factory", default=CONFIG.FAISS_INDEX_FACTORY, help="Фабрика FAISS для пересборки")
+    parser.add_argument("--report", action="store_true", help="Только отчет recall/latency, без пересборки")
+    parser.add_argument("--factories", nargs="+", default=["Flat", "HNSW32", "IVF256,Flat", "IVF256,SQ8", "IVF256,PQ64"],
+                        help="Фабрики для отчета")
+    parser.add_argument("--min-vectors", type=int, default=1000, help="Пропускать в отчете разделы меньше этого размера")
+    args = parser.parse_args()
+
+    index_options = {
+        "factory": args.factory,
+        "min_vectors": CONFIG.FAISS_INDEX_MIN_VECTORS,
+        "train_size": CONFIG.FAISS_INDEX_TRAIN_SIZE,
+        "nprobe": CONFIG.FAISS_NPROBE,
+    }
+
+    acquire_writer(os.path.join(args.root, ".lock"))
+    for name in partition_names(args.root):
+        part = Partition(name, os.path.join(args.root, name), None, index_options=index_options)
+        part.load()
+        if part.db is None:
+            continue
+
+        if args.report:
+            if len(part.row_of) < args.min_vectors:
+                continue
+            vectors = reconstruct_rows(part.db.index, list(part.db.index_to_docstore_id))
+            for row in recall_report(vectors, args.factories, train_size=CONFIG.FAISS_INDEX_TRAIN_SIZE, nprobe=CONFIG.FAISS_NPROBE):
+                print(json.dumps({"partition": name, "vectors": len(vectors), **row}, ensure_ascii=False))
+        else:
+            vectors = len(part.row_of)
+            factory = args.factory
+            if not part.fits_factory(factory):
+                minimum = max(train_minimum(part.db.index.d, factory), index_options["min_vectors"])
+                print(f"{name}: {vectors} векторов, для {factory} нужно не меньше {minimum} — остается плоский индекс")
+                if is_flat(part.db.index) and not part.deleted:
+                    continue
+                factory = "Flat"
+            print(f"{name}: {vectors} векторов -> {factory}")
+            part.rebuild(factory)
+            part.compact()
+
+
+if __name__ == "__main__":
+    main()
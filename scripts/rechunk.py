@@ -0,0 +1,50 @@
+"""
+Перенарезка и переиндексация уже загруженных документов чатов.
+
+Запуск из корня проекта:
+    python -m scripts.rechunk --chat <id чата> --size 800 --overlap 100 --strategy sentence
+    python -m scripts.rechunk --all
+
+Новые настройки сохраняются в чате, документы режутся заново по настройкам чата.
+Текст документов собирается из сохраненных чанков. Запускать при остановленном приложении.
+"""
+import argparse
+from CONFIG import CONFIG
+from src.chatTools import ChatManager
+from src.initialisateTols import load_embeddings, load_database
+from src.aiTools import rechunk_docs
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Перенарезка документов чатов")
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--chat", help="ID чата")
+    target.add_argument("--all", action="store_true", help="Все чаты")
+    parser.add_argument("--size", type=int, help="Размер чанка")
+    parser.add_argument("--overlap", type=int, help="Перекрытие чанков")
+    parser.add_argument("--strategy", choices=["recursive", "sentence", "token"], help="Стратегия нарезки")
+    args = parser.parse_args()
+
+    chat_manager = ChatManager(CONFIG.CHAT_DB_PATH, CONFIG.CHATLIST_INDEX_PATH)
+    chats = chat_manager.chats if args.all else [chat_manager.get_chat_by_id(args.chat)]
+    if chats == [None]:
+        raise SystemExit(f"Чат с ID {args.chat} не найден")
+
+    database = load_database(load_embeddings(CONFIG.EMBEDDINGS_DEVICE), CONFIG.FAISS_INDEX_PATH)
+    for chat in chats:
+        overrides = {key: value for key, value in (("size", args.size), ("overlap", args.overlap), ("strategy", args.strategy))
+                     if value is not None}
+        if overrides:
+            chat_manager.update_chat(chat.id, chunking={**chat.chunking, **overrides})
+        print(f"{chat.name}: {chat.chunking}")
+        rechunk_docs(
+            database,
+            chat.database_id,
+            chat.chunking,
+            progress=lambda name, before, after: print(f"  {name}: {before} -> {after} чанков"),
+        )
+        database.compact(chat.database_id)
+
+
+if __name__ == "__main__":
+    main()
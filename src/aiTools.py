@@ -2,12 +2,34 @@ from langchain_core.messages import HumanMessage, SystemMessage
 import datetime
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 from langchain_core.documents import Document
-from uuid import uuid4
-import numpy as np
 from langchain.retrievers.multi_query import MultiQueryRetriever
 import re
-
-def doc_chunks(content, tabl_name, doc_name, doc_size, doc_date, doc_id):
+import time
+import threading
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor, wait
+from src.ingestTools import embed_documents_pipeline, content_hash, UploadedDoc
+from src.cacheTools import LRUCache
+from src.contextTools import pack_context, join_chunks
+from src.traceTools import trace, span, cache_result, count
+from src.rerankTools import CrossEncoderReranker
+from CONFIG import CONFIG
+
+# Общий пул для LLM-валидации чанков: ограничивает число одновременных запросов
+# и не держит зависшие вызовы внутри запроса пользователя
+_validator_pool = ThreadPoolExecutor(max_workers=CONFIG.VALIDATOR_WORKERS)
+_validator_scores = LRUCache(CONFIG.VALIDATOR_CACHE_SIZE)
+# Кросс-энкодер для переранжирования (глубина поиска 3), модель грузится при первом запросе
+_reranker = CrossEncoderReranker(
+    CONFIG.RERANK_MODEL,
+    device=CONFIG.EMBEDDINGS_DEVICE,
+    batch_size=CONFIG.RERANK_BATCH_SIZE,
+    cache_size=CONFIG.RERANK_CACHE_SIZE,
+    local_files_only=CONFIG.EMBEDDINGS_LOCAL_ONLY,
+    retry_after=CONFIG.RERANK_RETRY_SECONDS,
+)
+
+def doc_chunks(content, tabl_name, doc_name, doc_size, doc_date, doc_id, start_index=None, ordinal=None):
     """
     Создает объект документа с заданным содержимым и метаданными.
 
@@ -17,6 +39,8 @@ def doc_chunks(content, tabl_name, doc_name, doc_size, doc_date, doc_id):
     :param doc_size: Размер документа.
     :param doc_date: Дата создания документа.
     :param doc_id: Уникальный идентификатор документа.
+    :param start_index: Смещение начала чанка в тексте документа (в символах).
+    :param ordinal: Порядковый номер чанка в документе.
     :return: Объект Document с заданными параметрами.
     """
     return Document(
@@ -27,92 +51,259 @@ def doc_chunks(content, tabl_name, doc_name, doc_size, doc_date, doc_id):
             "doc_size": doc_size,
             "doc_date": doc_date,
             "doc_id": doc_id,
+            "start_index": start_index,
+            "end_index": start_index + len(content) if start_index is not None else None,
+            "ordinal": ordinal,
         },
     )
 
-def load_docs(document_list, table_id, db, faiss_idx):
+@lru_cache(maxsize=1)
+def embedding_tokenizer():
     """
-    Загружает список документов в базу данных и сохраняет её.
+    Токенизатор модели эмбеддингов для нарезки по токенам.
 
-    :param document_list: Список загружаемых документов (например, файлов).
-    :param table_id: Идентификатор таблицы/чата.
-    :param db: База данных для хранения документов.
-    :param faiss_idx: Путь к локальному индексу FAISS.
+    :return: Токенизатор HuggingFace.
     """
-    for doc in document_list:
-        content_doc = doc.read().decode("utf-8")
-        name_doc = doc.name
-        size_doc = doc.size
-        date_doc = str(datetime.date.today())
-        type_doc = doc.type
-        doc_id = f"doc_id_{str(uuid4())}"
-
-        if type_doc == 'text/plain':
-            all_splits = RecursiveCharacterTextSplitter(chunk_size=1200, chunk_overlap=600).split_text(content_doc)
-            doc_list = [doc_chunks(split, table_id, name_doc, size_doc, date_doc, doc_id) for split in all_splits]
+    from transformers import AutoTokenizer
+    return AutoTokenizer.from_pretrained(CONFIG.EMBEDDINGS_MODEL, local_files_only=CONFIG.EMBEDDINGS_LOCAL_ONLY)
 
-            uuids = [str(uuid4()) for _ in range(len(doc_list))]
-            db.add_documents(documents=doc_list, ids=uuids)
+def make_splitter(chunking=None):
+    """
+    Создает сплиттер по настройкам нарезки чата.
 
-    db.save_local(faiss_idx)
+    :param chunking: Настройки {"size", "overlap", "strategy"}. Если не заданы, берутся из CONFIG.
+    :return: Экземпляр RecursiveCharacterTextSplitter.
+    """
+    chunking = chunking or {}
+    size = chunking.get("size", CONFIG.CHUNK_SIZE)
+    overlap = chunking.get("overlap", CONFIG.CHUNK_OVERLAP)
+    strategy = chunking.get("strategy", CONFIG.CHUNK_STRATEGY)
+
+    if strategy == "token":
+        # Размер и перекрытие в токенах модели эмбеддингов; хвост длиннее входа модели не попал бы в эмбеддинг
+        size = min(size, CONFIG.TOKEN_CHUNK_MAX_SIZE)
+        overlap = min(overlap, size - 1)
+        return RecursiveCharacterTextSplitter.from_huggingface_tokenizer(
+            embedding_tokenizer(), chunk_size=size, chunk_overlap=overlap
+        )
+    if strategy == "sentence":
+        return RecursiveCharacterTextSplitter(
+            chunk_size=size,
+            chunk_overlap=overlap,
+            separators=[r"\n\n", r"\n", r"(?<=[.!?…])\s+", r"\s+", ""],
+            is_separator_regex=True,
+            keep_separator="end",
+        )
+    if strategy == "recursive":
+        return RecursiveCharacterTextSplitter(chunk_size=size, chunk_overlap=overlap)
+    raise ValueError(f"Неизвестная стратегия нарезки: {strategy}")
 
-def seatch_all_docs(db, table_name):
+def split_text(content, table_id, doc_name, doc_size, doc_date, doc_id, chunking=None):
     """
-    Ищет все документы, принадлежащие указанной таблице.
+    Разбивает текст документа на чанки со смещениями и порядковыми номерами.
 
-    :param db: База данных, содержащая документы.
-    :param table_name: Название таблицы (чата).
-    :return: Список метаданных уникальных документов.
+    :param content: Текст документа.
+    :param table_id: Идентификатор таблицы/чата.
+    :param doc_name: Имя документа.
+    :param doc_size: Размер документа.
+    :param doc_date: Дата загрузки документа.
+    :param doc_id: Идентификатор документа.
+    :param chunking: Настройки нарезки чата.
+    :return: Список объектов Document.
+    """
+    splitter = make_splitter(chunking)
+    splits = splitter.split_text(content)
+    offsets = chunk_offsets(content, splits, splitter._chunk_overlap, splitter._length_function)
+    return [
+        doc_chunks(split, table_id, doc_name, doc_size, doc_date, doc_id, start, ordinal)
+        for ordinal, (split, start) in enumerate(zip(splits, offsets))
+    ]
+
+def chunk_offsets(content, splits, overlap, length=len):
+    """
+    Находит смещения чанков в тексте. Чанк начинается правее начала предыдущего
+    и перекрывает его не больше чем на overlap (в единицах length), поэтому
+    повторяющиеся в документе фрагменты получают каждый свое смещение.
+
+    :param content: Текст документа.
+    :param splits: Тексты чанков в порядке нарезки.
+    :param overlap: Перекрытие чанков.
+    :param length: Функция длины сплиттера (символы или токены).
+    :return: Список смещений (None, если чанк не найден).
+    """
+    offsets = []
+    start, end = -1, 0
+    for split in splits:
+        position = content.find(split, start + 1)
+        while position != -1 and position < end and length(content[position:end]) > overlap:
+            position = content.find(split, position + 1)
+        offsets.append(position if position != -1 else None)
+        if position != -1:
+            start, end = position, position + len(split)
+    return offsets
+
+def chunk_layout(content, chunks, chunk_ids):
     """
-    unique_id_doc = set()
-    id_to_metadata_map = {}
+    Возвращает положение чанков в документе для вторичного индекса раздела.
+    Текст между соседними чанками (пробелы, переводы строк) сохраняется,
+    чтобы документ можно было точно собрать обратно из чанков.
+
+    :param content: Текст документа.
+    :param chunks: Чанки документа из split_text.
+    :param chunk_ids: Идентификаторы чанков.
+    :return: Список вхождений [id чанка, start, length, gap] в порядке документа.
+    """
+    layout, end = [], 0
+    for chunk_id, chunk in zip(chunk_ids, chunks):
+        start = chunk.metadata.get("start_index")
+        gap = content[end:start] if start is not None and start >= end else None
+        layout.append([chunk_id, start, len(chunk.page_content), gap])
+        if start is not None:
+            end = max(end, start + len(chunk.page_content))
+    return layout
+
+def split_doc(doc, table_id, chunking=None):
+    """
+    Читает загруженный файл и разбивает его на чанки.
 
-    for doc_id, document in db.docstore._dict.items():
-        if document.metadata and document.metadata.get("table") == str(table_name):
-            doc_id = document.metadata.get("doc_id")
-            if doc_id:
-                unique_id_doc.add(doc_id)
-                id_to_metadata_map[doc_id] = document.metadata
+    :param doc: Загруженный файл.
+    :param table_id: Идентификатор таблицы/чата.
+    :param chunking: Настройки нарезки чата.
+    :return: Кортеж (текст документа, список объектов Document); для неподдерживаемых типов — ("", []).
+    """
+    if doc.type != 'text/plain':
+        return "", []
 
-    return [id_to_metadata_map[doc_id] for doc_id in unique_id_doc if doc_id in id_to_metadata_map]
+    content_doc = doc.read().decode("utf-8")
+    date_doc = str(datetime.date.today())
+    doc_id = f"doc_id_{content_hash(content_doc)}"
+    return content_doc, split_text(content_doc, table_id, doc.name, doc.size, date_doc, doc_id, chunking)
 
-def delete_doc_in_bd(db, doc_id, db_path):
+def ingest_docs(document_list, table_id, db, progress=None, chunking=None):
     """
-    Удаляет документ по идентификатору и обновляет базу данных.
+    Загружает список документов в раздел чата одной пакетной вставкой.
+    Идентификаторы документов и чанков — хэши нормализованного текста: уже
+    загруженные файлы пропускаются, а эмбеддятся только чанки, которых еще нет в разделе.
+    Изменения сохраняются в журнал раздела.
 
-    :param db: База данных, содержащая документы.
-    :param doc_id: Идентификатор документа для удаления.
-    :param db_path: Путь для сохранения обновленной базы данных.
+    :param document_list: Список загружаемых документов (например, файлов).
+    :param table_id: Идентификатор таблицы/чата.
+    :param db: Хранилище документов, разбитое на разделы по чатам.
+    :param progress: Необязательный колбэк progress(индекс файла, готово чанков, всего чанков).
+    :param chunking: Настройки нарезки чата.
+    """
+    lock = threading.Lock()
+    seen_chunks = set()
+    new_docs = {}
+
+    def split_new(doc):
+        content, chunks = split_doc(doc, table_id, chunking)
+        if not chunks:
+            return []
+        doc_id = chunks[0].metadata["doc_id"]
+        chunk_ids = [content_hash(chunk.page_content) for chunk in chunks]
+
+        with lock:
+            if doc_id in new_docs or db.has_document(table_id, doc_id):
+                return []
+            new_docs[doc_id] = {
+                "metadata": chunks[0].metadata,
+                "chunks": chunk_layout(content, chunks, chunk_ids),
+            }
+            fresh = {}
+            for chunk_id, chunk in zip(chunk_ids, chunks):
+                if chunk_id not in seen_chunks:
+                    seen_chunks.add(chunk_id)
+                    fresh[chunk_id] = chunk
+
+        missing = db.missing_chunks(table_id, list(fresh))
+        return [chunk for chunk_id, chunk in fresh.items() if chunk_id in missing]
+
+    with trace("ingest", table_id=table_id, files=len(document_list)):
+        with span("split_embed") as stage:
+            doc_list, embeddings = embed_documents_pipeline(
+                document_list,
+                split_new,
+                db.embedding,
+                batch_size=CONFIG.EMBEDDING_BATCH_SIZE,
+                workers=CONFIG.INGEST_WORKERS,
+                progress=progress,
+            )
+            stage.set(docs=len(new_docs), chunks=len(doc_list))
+
+        if new_docs:
+            with span("store_add", chunks=len(doc_list)):
+                chunk_ids = [content_hash(doc.page_content) for doc in doc_list]
+                db.add_embeddings(table_id, doc_list, embeddings, chunk_ids, docs=new_docs)
+
+def load_docs(document_list, table_id, db, job_queue, chunking=None):
     """
-    chunk_ids_to_delete = []
+    Ставит загрузку документов в фоновую очередь и сразу возвращает управление.
 
-    for chunk_id, document in db.docstore._dict.items():
-        if document.metadata and document.metadata.get("doc_id") == doc_id:
-            chunk_ids_to_delete.append(chunk_id)
+    :param document_list: Список загружаемых документов (например, файлов).
+    :param table_id: Идентификатор таблицы/чата.
+    :param db: Хранилище документов, разбитое на разделы по чатам.
+    :param job_queue: Очередь фоновых задач (JobQueue).
+    :param chunking: Настройки нарезки чата (Chat.chunking).
+    :return: Идентификатор задачи загрузки.
+    """
+    with span("upload_read", files=len(document_list)):
+        docs = [UploadedDoc.from_upload(doc) for doc in document_list]
+    return job_queue.submit(
+        table_id,
+        [doc.name for doc in docs],
+        lambda job: ingest_docs(docs, table_id, db, progress=job.update_file, chunking=chunking),
+    )
 
-    for chunk_id in chunk_ids_to_delete:
-        del db.docstore._dict[chunk_id]
+def rechunk_docs(db, table_id, chunking=None, progress=None):
+    """
+    Перенарезает уже загруженные документы чата с новыми настройками.
+    Исходный текст собирается из сохраненных чанков, эмбеддятся только чанки,
+    которых еще нет в разделе.
 
-    if hasattr(db, "index_to_docstore_id") and hasattr(db, "index"):
-        indices_to_remove = [
-            idx for idx, docstore_id in db.index_to_docstore_id.items()
-            if docstore_id in chunk_ids_to_delete
-        ]
+    :param db: Хранилище документов, разбитое на разделы по чатам.
+    :param table_id: Идентификатор таблицы/чата.
+    :param chunking: Новые настройки нарезки чата.
+    :param progress: Необязательный колбэк progress(имя документа, было чанков, стало чанков).
+    """
+    for stats in db.list_documents(table_id):
+        doc_id = stats["doc_id"]
+        content = join_chunks(db.document_chunks(table_id, doc_id), doc_id)
+        chunks = split_text(content, table_id, stats["name_doc"], stats["doc_size"], stats["doc_date"], doc_id, chunking)
+        chunk_ids = [content_hash(chunk.page_content) for chunk in chunks]
+        missing = db.missing_chunks(table_id, chunk_ids)
+        first = {}
+        for i, chunk_id in enumerate(chunk_ids):
+            if chunk_id in missing:
+                first.setdefault(chunk_id, i)
+        new = list(first.values())
+        vectors = db.embedding.embed_documents([chunks[i].page_content for i in new]) if new else []
+        embeddings = [None] * len(chunks)
+        for i, vector in zip(new, vectors):
+            embeddings[i] = vector
+        db.replace_document(table_id, doc_id, chunks, embeddings, chunk_ids, chunk_layout(content, chunks, chunk_ids))
+        if progress is not None:
+            progress(stats["name_doc"], stats["chunks_count"], len(chunks))
 
-        if indices_to_remove:
-            db.index.remove_ids(np.array(indices_to_remove, dtype=np.int64))
+def seatch_all_docs(db, table_name):
+    """
+    Возвращает все документы, принадлежащие указанной таблице, по индексу метаданных.
 
-        db.index_to_docstore_id = {
-            idx: docstore_id
-            for idx, docstore_id in db.index_to_docstore_id.items()
-            if docstore_id not in chunk_ids_to_delete
-        }
+    :param db: Хранилище документов, разбитое на разделы по чатам.
+    :param table_name: Название таблицы (чата).
+    :return: Список метаданных уникальных документов со статистикой (chunks_count, chars_count).
+    """
+    return db.list_documents(table_name)
 
-    if not db.docstore._dict:
-        db.index_to_docstore_id = {}
-        db.index.reset()
+def delete_doc_in_bd(db, table_id, doc_id):
+    """
+    Удаляет документ по идентификатору из раздела чата. Изменения сохраняются в журнал раздела.
 
-    db.save_local(db_path)
+    :param db: Хранилище документов, разбитое на разделы по чатам.
+    :param table_id: Идентификатор таблицы/чата.
+    :param doc_id: Идентификатор документа для удаления.
+    """
+    db.delete_document(table_id, doc_id)
 
 def chunks_validator(llm, theme, text):
     """
@@ -121,7 +312,7 @@ def chunks_validator(llm, theme, text):
     :param llm: Языковая модель для обработки текста.
     :param theme: Тема, с которой сравнивается текст.
     :param text: Проверяемый текст.
-    :return: Процент соответствия текста теме.
+    :return: Процент соответствия текста теме или None, если в ответе нет числа.
     """
     system_message = SystemMessage(content=(
         """
@@ -134,8 +325,42 @@ def chunks_validator(llm, theme, text):
 
     messages = [system_message, human_message]
     response = llm.invoke(messages).content
-    number_procent = re.findall(r"\d+", response)[0]
-    return int(number_procent)
+    number_procent = re.search(r"\d+", response)
+    if number_procent is None:
+        return None
+    return min(int(number_procent.group()), 100)
+
+def validate_chunks(llm, theme, docs, threshold=70):
+    """
+    Оценивает чанки через LLM параллельно, с общим таймаутом на запрос.
+    Оценки кэшируются по паре (тема, id чанка). Чанки, для которых оценку
+    получить не удалось (таймаут, ошибка, ответ без числа), не отбрасываются.
+
+    :param llm: Языковая модель для обработки текста.
+    :param theme: Тема, с которой сравнивается текст.
+    :param docs: Список объектов Document.
+    :param threshold: Минимальный процент соответствия.
+    :return: Список прошедших валидацию документов в исходном порядке.
+    """
+    keys = [(theme, doc.id or content_hash(doc.page_content)) for doc in docs]
+    scores = [_validator_scores.get(key) for key in keys]
+    for score in scores:
+        cache_result("validator", score is not None)
+
+    futures = {
+        i: _validator_pool.submit(chunks_validator, llm=llm, theme=theme, text=doc.page_content)
+        for i, doc in enumerate(docs) if scores[i] is None
+    }
+    if futures:
+        wait(futures.values(), timeout=CONFIG.VALIDATOR_TIMEOUT)
+    for i, future in futures.items():
+        if future.done() and future.exception() is None and future.result() is not None:
+            scores[i] = future.result()
+            _validator_scores.set(keys[i], scores[i])
+        else:
+            future.cancel()
+
+    return [doc for doc, score in zip(docs, scores) if score is None or score > threshold]
 
 def base_retriver(question, chat_id, llm_s, database, retriver=1, **validator_kwargs):
     """
@@ -144,27 +369,113 @@ def base_retriver(question, chat_id, llm_s, database, retriver=1, **validator_kw
     :param question: Запрос для поиска.
     :param chat_id: Идентификатор чата.
     :param llm_s: Языковая модель.
-    :param database: База данных документов.
-    :param retriver: Тип извлекателя (1 — стандартный, 2 — MultiQueryRetriever, 3 — с валидацией).
+    :param database: Хранилище документов, разбитое на разделы по чатам.
+    :param retriver: Тип извлекателя (1 — стандартный, 2 — MultiQueryRetriever, 3 — с переранжированием
+                     локальным кросс-энкодером, 4 — гибридный BM25 + векторный, 5 — с валидацией через LLM).
     :param validator_kwargs: Дополнительные параметры для валидации.
     :return: Список релевантных документов.
     """
-    if retriver == 1:
-        return database.similarity_search(question, k=10, filter={"table": chat_id})
-
-    elif retriver == 2:
-        retriever_from_llm = MultiQueryRetriever.from_llm(
-            retriever=database.as_retriever(search_kwargs={"k": 10, "filter": {"table": chat_id}}),
-            llm=llm_s
-        )
-        return retriever_from_llm.invoke(question)
-
-    elif retriver == 3:
-        unique_docs = database.similarity_search(question, k=10, filter={"table": chat_id})
-        theme = validator_kwargs.get("theme", question)
-        return [doc for doc in unique_docs if chunks_validator(llm=llm_s, theme=theme, text=doc) > 70]
+    with span("retrieve", mode=retriver) as stage:
+        docs = None
+        if retriver == 1:
+            docs = database.similarity_search(chat_id, question, k=10)
+
+        elif retriver == 2:
+            chat_retriever = database.as_retriever(chat_id, k=10)
+            if chat_retriever is None:
+                docs = []
+            else:
+                retriever_from_llm = MultiQueryRetriever.from_llm(
+                    retriever=chat_retriever,
+                    llm=llm_s
+                )
+                with span("multi_query"):
+                    docs = retriever_from_llm.invoke(question)
+
+        elif retriver == 3:
+            candidates = database.similarity_search(chat_id, question, k=CONFIG.RERANK_FETCH_K)
+            try:
+                docs = _reranker.rerank(question, candidates, k=CONFIG.RERANK_TOP_K, threshold=CONFIG.RERANK_THRESHOLD)
+            except Exception as e:
+                # Без модели (нет в кэше и нет сети) работаем как обычный поиск; ошибка видна в трассе и метриках
+                stage.set(rerank_error=str(e))
+                count("rerank_errors")
+                docs = candidates[:CONFIG.RERANK_TOP_K]
+
+        elif retriver == 5:
+            unique_docs = database.similarity_search(chat_id, question, k=10)
+            theme = validator_kwargs.get("theme", question)
+            with span("validate", candidates=len(unique_docs)) as validate_stage:
+                docs = validate_chunks(llm_s, theme, unique_docs)
+                validate_stage.set(kept=len(docs))
+
+        elif retriver == 4:
+            docs = database.hybrid_search(chat_id, question, k=10)
+
+        stage.set(chunks=len(docs) if docs is not None else None)
+        return docs
+
+def stream_rag_request(llm, question, sys_prompt, database, retriver=1, chat_id="default_chat", answer_cache=None, **validator_kwargs):
+    """
+    Формирует запрос RAG и отдает ответ LLM по мере генерации.
 
-def full_rag_request(llm, question, sys_prompt, database, retriver=1, chat_id="default_chat", **validator_kwargs):
+    :param llm: Языковая модель.
+    :param question: Запрос пользователя.
+    :param sys_prompt: Системное сообщение.
+    :param database: База данных для поиска.
+    :param retriver: Тип извлекателя.
+    :param chat_id: Идентификатор чата.
+    :param answer_cache: Необязательный семантический кэш ответов (SemanticCache).
+    :param validator_kwargs: Дополнительные параметры для валидации.
+    :return: Генератор фрагментов ответа (строк).
+    """
+    with trace("rag", chat_id=chat_id, mode=retriver):
+        if answer_cache is not None:
+            with span("answer_cache_lookup"):
+                cache_key = (chat_id, database.version(chat_id), (retriver, sys_prompt, repr(sorted(validator_kwargs.items()))))
+                question_vector = database.embedding.embed_query(question)
+                cached_answer = answer_cache.lookup(*cache_key, question_vector)
+            cache_result("answer", cached_answer is not None)
+            if cached_answer is not None:
+                yield cached_answer
+                return
+
+        chunks = base_retriver(question, chat_id, llm, database, retriver, **validator_kwargs)
+        # Перекрывающиеся чанки склеиваются, контекст обрезается по бюджету токенов
+        with span("pack_context", chunks=len(chunks or [])) as stage:
+            context, context_tokens = pack_context(chunks or [], CONFIG.CONTEXT_TOKEN_BUDGET)
+            stage.set(tokens=context_tokens)
+        count("context_tokens", context_tokens)
+
+        system_message = SystemMessage(content=(
+            f"""{sys_prompt or "Ты — интеллектуальный помощник."}
+
+Используй следующий контекст:
+{context}
+
+Ответ должен быть точным, кратким и структурированным.
+"""
+        ))
+
+        human_message = HumanMessage(content=question)
+        messages = [system_message, human_message]
+
+        answer_parts = []
+        with span("llm") as stage:
+            start = time.perf_counter()
+            for message_chunk in llm.stream(messages):
+                if message_chunk.content:
+                    if not answer_parts:
+                        stage.set(first_token_ms=round((time.perf_counter() - start) * 1000, 2))
+                    answer_parts.append(message_chunk.content)
+                    yield message_chunk.content
+            stage.set(chars=sum(len(part) for part in answer_parts))
+
+        if answer_cache is not None:
+            with span("answer_cache_store"):
+                answer_cache.store(*cache_key, question_vector, "".join(answer_parts))
+
+def full_rag_request(llm, question, sys_prompt, database, retriver=1, chat_id="default_chat", answer_cache=None, **validator_kwargs):
     """
     Формирует полный запрос RAG (Retrieve-and-Generate) для получения ответа.
 
@@ -174,20 +485,8 @@ def full_rag_request(llm, question, sys_prompt, database, retriver=1, chat_id="d
     :param database: База данных для поиска.
     :param retriver: Тип извлекателя.
     :param chat_id: Идентификатор чата.
+    :param answer_cache: Необязательный семантический кэш ответов (SemanticCache).
     :param validator_kwargs: Дополнительные параметры для валидации.
     :return: Ответ на запрос.
     """
-    chunks = base_retriver(question, chat_id, llm, database, retriver, **validator_kwargs)
-    context = "\n".join([doc.page_content for doc in chunks]) if chunks else ""
-
-    system_message = SystemMessage(content=(
-        f"""
-        Ты — интеллектуальный помощник. Используй следующий контекст: {context}.
-        Ответ должен быть точным, кратким и структурированным.
-        """
-    ))
-
-    human_message = HumanMessage(content=question)
-    messages = [system_message, human_message]
-
-    return llm.invoke(messages).content
+    return "".join(stream_rag_request(llm, question, sys_prompt, database, retriver, chat_id, answer_cache, **validator_kwargs))
@@ -0,0 +1,98 @@
+import time
+import queue
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+
+class MicroBatcher:
+    """
+    Собирает одиночные запросы из разных потоков в батчи. Запросы, пришедшие
+    в течение max_wait секунд после первого, обрабатываются одним вызовом fn.
+    Батчи собирает один поток, а обрабатывать их могут несколько: медленный
+    батч не задерживает следующие. С функцией key батч делится на группы
+    запросов с одинаковым ключом, и каждая группа обрабатывается отдельно.
+    """
+    def __init__(self, fn, max_batch=32, max_wait=0.005, workers=1, key=None):
+        """
+        Инициализация батчера и запуск рабочего потока.
+
+        :param fn: Функция fn(items), возвращающая список результатов в порядке items.
+        :param max_batch: Максимальный размер батча.
+        :param max_wait: Сколько секунд ждать остальные запросы батча после первого.
+        :param workers: Сколько батчей (групп) может обрабатываться одновременно.
+        :param key: Функция key(item), по которой батч делится на группы (None — без деления).
+        """
+        self.fn = fn
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.key = key
+        self.batches = 0
+        self.items = 0
+        self._queue = queue.Queue()
+        self._pool = ThreadPoolExecutor(max_workers=workers) if workers > 1 else None
+        threading.Thread(target=self._worker, daemon=True).start()
+
+    def submit(self, item):
+        """
+        Ставит запрос в очередь и ждет результат.
+
+        :param item: Запрос.
+        :return: Результат fn для этого запроса.
+        """
+        future = Future()
+        self._queue.put((item, future))
+        return future.result()
+
+    def _collect(self):
+        """
+        Забирает из очереди следующий батч: первый запрос ждет бесконечно,
+        остальные — до истечения max_wait или заполнения батча.
+
+        :return: Список пар (запрос, Future).
+        """
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=timeout))
+            except queue.Empty:
+                break
+        return batch
+
+    def _worker(self):
+        while True:
+            batch = self._collect()
+            self.batches += 1
+            self.items += len(batch)
+            groups = {}
+            for entry in batch:
+                groups.setdefault(self.key(entry[0]) if self.key else None, []).append(entry)
+            for group in groups.values():
+                if self._pool is not None:
+                    self._pool.submit(self._process, group)
+                else:
+                    self._process(group)
+
+    def _process(self, batch):
+        try:
+            results = self.fn([item for item, _ in batch])
+            for (_, future), result in zip(batch, results):
+                future.set_result(result)
+        except Exception as e:
+            for _, future in batch:
+                future.set_exception(e)
+
+    def stats(self):
+        """
+        Возвращает счетчики батчера.
+
+        :return: Словарь с batches, items и avg_batch.
+        """
+        return {
+            "batches": self.batches,
+            "items": self.items,
+            "avg_batch": self.items / self.batches if self.batches else 0.0,
+        }
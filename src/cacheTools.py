@@ -0,0 +1,149 @@
+import threading
+from collections import OrderedDict
+import numpy as np
+
+
+class SemanticCache:
+    """
+    Семантический кэш ответов RAG. Ответы хранятся в корзинах по ключу
+    (чат, режим поиска, системный промпт, версия документов чата); внутри корзины
+    ближайший вопрос ищется по косинусной близости эмбеддингов в маленьком индексе FAISS.
+    """
+    def __init__(self, threshold=0.95, max_entries=256, max_buckets=64):
+        """
+        Инициализация кэша.
+
+        :param threshold: Минимальная косинусная близость вопросов для попадания.
+        :param max_entries: Максимальное число ответов в одной корзине.
+        :param max_buckets: Максимальное число корзин (вытесняются по LRU).
+        """
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.max_buckets = max_buckets
+        self.hits = 0
+        self.misses = 0
+        self._buckets = OrderedDict()
+        self._versions = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _normalize(vector):
+        # FAISS импортируется при первом вопросе, а не при старте интерфейса
+        import faiss
+
+        vector = np.array([vector], dtype=np.float32)
+        faiss.normalize_L2(vector)
+        return vector
+
+    def _bucket(self, table_id, version, params, create=False):
+        """
+        Возвращает корзину ответов. При смене версии документов чата
+        все корзины этого чата сбрасываются.
+
+        :param table_id: Идентификатор таблицы/чата.
+        :param version: Версия документов чата.
+        :param params: Кортеж остальных параметров ключа (режим поиска, промпт и т.д.).
+        :param create: Создать корзину, если её нет.
+        :return: Корзина {"index": ..., "answers": [...]} или None.
+        """
+        if self._versions.get(table_id) != version:
+            for key in [key for key in self._buckets if key[0] == table_id]:
+                del self._buckets[key]
+            self._versions[table_id] = version
+
+        key = (table_id, version, params)
+        bucket = self._buckets.get(key)
+        if bucket is not None:
+            self._buckets.move_to_end(key)
+        elif create:
+            bucket = {"index": None, "answers": []}
+            self._buckets[key] = bucket
+            while len(self._buckets) > self.max_buckets:
+                self._buckets.popitem(last=False)
+        return bucket
+
+    def lookup(self, table_id, version, params, vector):
+        """
+        Ищет сохраненный ответ на близкий вопрос.
+
+        :param table_id: Идентификатор таблицы/чата.
+        :param version: Версия документов чата.
+        :param params: Кортеж остальных параметров ключа.
+        :param vector: Эмбеддинг вопроса.
+        :return: Ответ или None.
+        """
+        with self._lock:
+            bucket = self._bucket(table_id, version, params)
+            if bucket is not None and bucket["index"] is not None and bucket["answers"]:
+                scores, indices = bucket["index"].search(self._normalize(vector), 1)
+                if indices[0][0] != -1 and scores[0][0] >= self.threshold:
+                    self.hits += 1
+                    return bucket["answers"][indices[0][0]]
+            self.misses += 1
+            return None
+
+    def store(self, table_id, version, params, vector, answer):
+        """
+        Сохраняет ответ. Самые старые ответы корзины вытесняются.
+
+        :param table_id: Идентификатор таблицы/чата.
+        :param version: Версия документов чата.
+        :param params: Кортеж остальных параметров ключа.
+        :param vector: Эмбеддинг вопроса.
+        :param answer: Ответ LLM.
+        """
+        with self._lock:
+            bucket = self._bucket(table_id, version, params, create=True)
+            vector = self._normalize(vector)
+            if bucket["index"] is None:
+                import faiss
+
+                bucket["index"] = faiss.IndexFlatIP(vector.shape[1])
+            if len(bucket["answers"]) >= self.max_entries:
+                bucket["index"].remove_ids(np.array([0], dtype=np.int64))
+                bucket["answers"].pop(0)
+            bucket["index"].add(vector)
+            bucket["answers"].append(answer)
+
+    def stats(self):
+        """
+        Возвращает счетчики кэша.
+
+        :return: Словарь с hits, misses, hit_rate и entries.
+        """
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "entries": sum(len(bucket["answers"]) for bucket in self._buckets.values()),
+        }
+
+
+class LRUCache:
+    """
+    Потокобезопасный словарь ограниченного размера с вытеснением по LRU.
+    """
+    def __init__(self, max_items=10000):
+        """
+        Инициализация кэша.
+
+        :param max_items: Максимальное число записей.
+        """
+        self.max_items = max_items
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key not in self._items:
+                return default
+            self._items.move_to_end(key)
+            return self._items[key]
+
+    def set(self, key, value):
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_items:
+                self._items.popitem(last=False)
@@ -1,13 +1,22 @@
 import os
 import json
 import uuid
+import sqlite3
+import threading
+from src.traceTools import span
+from src.lockTools import acquire_writer
+from CONFIG import CONFIG
+
+# Нарезка, которой загружены документы чатов, созданных до настройки нарезки
+LEGACY_CHUNKING = {"size": 1200, "overlap": 600, "strategy": "recursive"}
 
 class Chat:
     """
     Класс для представления чата. Содержит основные свойства чата и методы
     для преобразования его в словарь и создания из словаря.
     """
-    def __init__(self, name, description, system_prompt, id=None, database_id=None, messages=None):
+    def __init__(self, name, description, system_prompt, id=None, database_id=None, messages=None, loader=None,
+                 chunking=None):
         """
         Инициализация чата.
         
@@ -17,13 +26,40 @@ class Chat:
         :param id: Уникальный идентификатор чата. Если не задан, генерируется автоматически.
         :param database_id: Идентификатор базы данных чата. Если не задан, генерируется автоматически.
         :param messages: Список сообщений чата. Если не задан, используется сообщение по умолчанию.
+        :param loader: Функция loader(chat_id) для ленивой загрузки сообщений из хранилища.
+        :param chunking: Настройки нарезки документов {"size", "overlap", "strategy"}.
+                         Если не заданы, берутся из CONFIG.
         """
         self.id = id or str(uuid.uuid4())
         self.name = name
         self.description = description
         self.system_prompt = system_prompt
         self.database_id = database_id or f"{name}_{str(uuid.uuid4())}"
-        self.messages = messages if messages is not None else [{"role": "pass", "content": "pass"}]
+        self.chunking = chunking or {
+            "size": CONFIG.CHUNK_SIZE,
+            "overlap": CONFIG.CHUNK_OVERLAP,
+            "strategy": CONFIG.CHUNK_STRATEGY,
+        }
+        self._loader = loader
+        self.lock = threading.RLock()
+        if messages is None and loader is None:
+            messages = [{"role": "pass", "content": "pass"}]
+        self._messages = messages
+
+    @property
+    def messages(self):
+        """
+        Сообщения чата. При наличии loader загружаются из хранилища при первом обращении.
+        """
+        if self._messages is None:
+            with self.lock:
+                if self._messages is None:
+                    self._messages = self._loader(self.id)
+        return self._messages
+
+    @messages.setter
+    def messages(self, value):
+        self._messages = value
 
     def to_dict(self):
         """
@@ -36,6 +72,7 @@ class Chat:
             "description": self.description,
             "system_prompt": self.system_prompt,
             "database_id": self.database_id,
+            "chunking": self.chunking,
             "messages": self.messages
         }
 
@@ -53,57 +90,214 @@ class Chat:
             description=data["description"],
             system_prompt=data["system_prompt"],
             database_id=data["database_id"],
-            messages=data.get("messages", [])
+            messages=data.get("messages", []),
+            chunking=data.get("chunking", LEGACY_CHUNKING)
+        )
+
+
+class ChatStore:
+    """
+    Хранилище чатов в SQLite (режим WAL). Чаты обновляются построчно,
+    сообщения дописываются в отдельную таблицу.
+    """
+    def __init__(self, path):
+        """
+        Инициализация хранилища. Создает файл базы и таблицы, если их нет.
+
+        :param path: Путь к файлу SQLite.
+        """
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS chats (
+                id TEXT PRIMARY KEY,
+                name TEXT NOT NULL,
+                description TEXT NOT NULL,
+                system_prompt TEXT NOT NULL,
+                database_id TEXT NOT NULL,
+                chunking TEXT
+            );
+            CREATE TABLE IF NOT EXISTS messages (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                chat_id TEXT NOT NULL,
+                role TEXT NOT NULL,
+                content TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS messages_chat_id ON messages (chat_id, id);
+            """
         )
+        columns = [row[1] for row in self._conn.execute("PRAGMA table_info(chats)")]
+        if "chunking" not in columns:
+            self._conn.execute("ALTER TABLE chats ADD COLUMN chunking TEXT")
+        self._conn.commit()
+
+    def load_chats(self):
+        """
+        Загружает чаты без сообщений, в порядке создания.
+
+        :return: Список объектов Chat с ленивой загрузкой сообщений.
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, name, description, system_prompt, database_id, chunking FROM chats ORDER BY rowid"
+            ).fetchall()
+        return [
+            Chat(name, description, system_prompt, id=chat_id, database_id=database_id, loader=self.load_messages,
+                 chunking=json.loads(chunking) if chunking else LEGACY_CHUNKING)
+            for chat_id, name, description, system_prompt, database_id, chunking in rows
+        ]
+
+    def load_messages(self, chat_id):
+        """
+        Загружает сообщения чата.
+
+        :param chat_id: Уникальный идентификатор чата.
+        :return: Список сообщений (словари с role и content).
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT role, content FROM messages WHERE chat_id = ? ORDER BY id", (chat_id,)
+            ).fetchall()
+        return [{"role": role, "content": content} for role, content in rows]
+
+    def save_chat(self, chat, with_messages=False):
+        """
+        Вставляет или обновляет строку чата.
+
+        :param chat: Объект Chat.
+        :param with_messages: Записать также все сообщения чата (для новых чатов и миграции).
+        """
+        with self._lock, self._conn:
+            self._write_chat(chat, with_messages)
+
+    def _write_chat(self, chat, with_messages):
+        """
+        Пишет чат в текущей транзакции (вызывается под блокировкой хранилища).
+        """
+        self._conn.execute(
+            "INSERT INTO chats (id, name, description, system_prompt, database_id, chunking) VALUES (?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT(id) DO UPDATE SET name = excluded.name, description = excluded.description, "
+            "system_prompt = excluded.system_prompt, database_id = excluded.database_id, chunking = excluded.chunking",
+            (chat.id, chat.name, chat.description, chat.system_prompt, chat.database_id, json.dumps(chat.chunking)),
+        )
+        if with_messages:
+            self._conn.execute("DELETE FROM messages WHERE chat_id = ?", (chat.id,))
+            self._conn.executemany(
+                "INSERT INTO messages (chat_id, role, content) VALUES (?, ?, ?)",
+                [(chat.id, message["role"], message["content"]) for message in chat.messages],
+            )
+
+    def delete_chat(self, chat_id):
+        """
+        Удаляет чат и его сообщения.
+
+        :param chat_id: Уникальный идентификатор чата.
+        """
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM messages WHERE chat_id = ?", (chat_id,))
+            self._conn.execute("DELETE FROM chats WHERE id = ?", (chat_id,))
+
+    def append_message(self, chat_id, message):
+        """
+        Дописывает сообщение в чат.
+
+        :param chat_id: Уникальный идентификатор чата.
+        :param message: Сообщение (словарь с role и content).
+        """
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO messages (chat_id, role, content) VALUES (?, ?, ?)",
+                (chat_id, message["role"], message["content"]),
+            )
+
+    def import_json(self, json_path):
+        """
+        Переносит чаты из старого файла chats.json одной транзакцией. Файл после
+        переноса переименовывается в chats.json.migrated. Перенос идемпотентен:
+        если процесс упал до переименования, повторный вызов перезапишет те же чаты.
+
+        :param json_path: Путь к файлу chats.json.
+        """
+        if not os.path.exists(json_path) or os.stat(json_path).st_size == 0:
+            return
+        with open(json_path, "r") as f:
+            chat_dicts = json.load(f)
+        # Без id чат получал бы новый идентификатор при каждом повторе переноса
+        for chat in chat_dicts:
+            chat.setdefault("id", str(uuid.uuid5(uuid.NAMESPACE_URL, chat["database_id"])))
+        chats = [Chat.from_dict(chat) for chat in chat_dicts]
+        with self._lock, self._conn:
+            for chat in chats:
+                self._write_chat(chat, with_messages=True)
+        os.replace(json_path, f"{json_path}.migrated")
 
 
 class ChatManager:
     """
     Менеджер для управления чатами. Содержит методы для загрузки, сохранения,
     добавления, удаления и обновления чатов.
+
+    Один экземпляр разделяется всеми сессиями процесса: список чатов меняется
+    на месте под общей блокировкой, сообщения и параметры чата — под блокировкой чата.
     """
-    def __init__(self, path):
+    def __init__(self, path, legacy_path=None):
         """
-        Инициализация менеджера чатов.
+        Инициализация менеджера чатов. Если рядом лежит старый chats.json
+        (в том числе не переименованный после прерванного переноса), чаты
+        переносятся из него.
         
-        :param path: Путь к файлу, где хранятся чаты.
+        :param path: Путь к файлу SQLite, где хранятся чаты.
+        :param legacy_path: Путь к старому файлу chats.json (опционально).
         """
         self.path = path
+        # Чаты кэшируются в памяти процесса и не перечитываются, поэтому писатель один
+        acquire_writer(path + ".lock")
+        self.store = ChatStore(path)
+        self._lock = threading.Lock()
+        if legacy_path:
+            self.store.import_json(legacy_path)
         self.chats = self.load_chats()
 
     def load_chats(self):
         """
-        Загружает чаты из файла. Если файл отсутствует или пуст, возвращает пустой список.
+        Загружает чаты из хранилища. Сообщения загружаются при первом обращении.
         
         :return: Список объектов Chat.
         """
-        if not os.path.exists(self.path) or os.stat(self.path).st_size == 0:
-            return []
-        with open(self.path, "r") as f:
-            chat_dicts = json.load(f)
-            return [Chat.from_dict(chat) for chat in chat_dicts]
+        return self.store.load_chats()
 
     def save_chats(self):
         """
-        Сохраняет чаты в файл. Если директория не существует, создает её.
+        Сохраняет параметры всех чатов. Сообщения пишутся по одному
+        в add_message_to_chat, поэтому здесь не перезаписываются.
         """
-        directory = os.path.dirname(self.path)
-        if not os.path.exists(directory):
-            os.makedirs(directory)
+        with span("save_chats", chats=len(self.chats)):
+            for chat in list(self.chats):
+                with chat.lock:
+                    self.store.save_chat(chat)
 
-        with open(self.path, "w") as f:
-            json.dump([chat.to_dict() for chat in self.chats], f, ensure_ascii=False, indent=4)
-    def add_chat(self, name, description, system_prompt):
+    def add_chat(self, name, description, system_prompt, chunking=None):
         """
         Добавляет новый чат и сохраняет изменения.
         
         :param name: Имя чата.
         :param description: Описание чата.
         :param system_prompt: Системное сообщение для чата.
+        :param chunking: Настройки нарезки документов (опционально).
+        :return: Созданный объект Chat.
         """
-        new_chat = Chat(name, description, system_prompt)
-        self.chats.append(new_chat)
-        self.save_chats()
+        new_chat = Chat(name, description, system_prompt, chunking=chunking)
+        with self._lock:
+            self.store.save_chat(new_chat, with_messages=True)
+            self.chats.append(new_chat)
+        return new_chat
 
     def delete_chat(self, chat_id):
         """
@@ -111,8 +305,9 @@ class ChatManager:
         
         :param chat_id: Уникальный идентификатор чата для удаления.
         """
-        self.chats = [chat for chat in self.chats if chat.id != chat_id]
-        self.save_chats()
+        with self._lock:
+            self.store.delete_chat(chat_id)
+            self.chats[:] = [chat for chat in self.chats if chat.id != chat_id]
 
     def get_chat_by_id(self, chat_id):
         """
@@ -121,7 +316,7 @@ class ChatManager:
         :param chat_id: Уникальный идентификатор чата.
         :return: Объект Chat или None, если чат не найден.
         """
-        return next((chat for chat in self.chats if chat.id == chat_id), None)
+        return next((chat for chat in list(self.chats) if chat.id == chat_id), None)
 
     def add_message_to_chat(self, chat_id, message):
         """
@@ -132,12 +327,13 @@ class ChatManager:
         """
         chat = self.get_chat_by_id(chat_id)
         if chat:
-            chat.messages.append(message)
-            self.save_chats()
+            with span("add_message", role=message.get("role")), chat.lock:
+                chat.messages.append(message)
+                self.store.append_message(chat_id, message)
         else:
             raise ValueError(f"Чат с ID {chat_id} не найден")
 
-    def update_chat(self, chat_id, name=None, description=None, system_prompt=None):
+    def update_chat(self, chat_id, name=None, description=None, system_prompt=None, chunking=None):
         """
         Обновляет параметры чата (имя, описание, системное сообщение) и сохраняет изменения.
         
@@ -145,15 +341,20 @@ class ChatManager:
         :param name: Новое имя чата (опционально).
         :param description: Новое описание чата (опционально).
         :param system_prompt: Новое системное сообщение (опционально).
+        :param chunking: Новые настройки нарезки документов (опционально). Уже загруженные
+                         документы перенарезаются командой scripts/rechunk.
         """
         chat = self.get_chat_by_id(chat_id)
         if chat:
-            if name:
-                chat.name = name
-            if description:
-                chat.description = description
-            if system_prompt:
-                chat.system_prompt = system_prompt
-            self.save_chats()
+            with chat.lock:
+                if name:
+                    chat.name = name
+                if description:
+                    chat.description = description
+                if system_prompt:
+                    chat.system_prompt = system_prompt
+                if chunking:
+                    chat.chunking = chunking
+                self.store.save_chat(chat)
         else:
             raise ValueError(f"Чат с ID {chat_id} не найден")
@@ -0,0 +1,173 @@
+import threading
+
+_encoding = None
+_encoding_lock = threading.Lock()
+
+
+def count_tokens(text, encoding_name="o200k_base", chars_per_token=3):
+    """
+    Считает токены текста локальным токенизатором tiktoken. Если словарь
+    токенизатора недоступен (нет в кэше и нет сети), используется оценка по длине.
+
+    :param text: Текст.
+    :param encoding_name: Имя кодировки tiktoken (o200k_base — gpt-4o).
+    :param chars_per_token: Символов на токен для оценки без токенизатора.
+    :return: Число токенов.
+    """
+    global _encoding
+    if _encoding is None:
+        with _encoding_lock:
+            if _encoding is None:
+                try:
+                    import tiktoken
+                    _encoding = tiktoken.get_encoding(encoding_name)
+                except Exception:
+                    _encoding = False
+    if _encoding is False:
+        return -(-len(text) // chars_per_token)
+    return len(_encoding.encode(text, disallowed_special=()))
+
+
+def _overlap(left, right):
+    """
+    Ищет, с какой позиции left совпадает с началом right (нахлест соседних чанков).
+
+    :param left: Текст левого чанка.
+    :param right: Текст правого чанка.
+    :return: Позиция в left или None, если нахлеста нет.
+    """
+    probe = right[:16]
+    position = left.find(probe) if probe else -1
+    while position != -1:
+        if right.startswith(left[position:]):
+            return position
+        position = left.find(probe, position + 1)
+    return None
+
+
+def merge_chunks(chunks):
+    """
+    Склеивает соседние чанки одного документа, убирая перекрывающийся текст.
+    Чанки со смещениями (metadata["start_index"]) склеиваются по смещениям,
+    чанки без них — по совпадению конца одного с началом другого.
+
+    :param chunks: Список объектов Document в порядке релевантности.
+    :return: Список фрагментов {"doc_id", "name_doc", "text", "rank"} в порядке
+             релевантности лучшего чанка фрагмента.
+    """
+    groups = {}
+    seen = set()
+    for rank, chunk in enumerate(chunks):
+        if chunk.page_content in seen:
+            continue
+        seen.add(chunk.page_content)
+        groups.setdefault(chunk.metadata.get("doc_id"), []).append((rank, chunk))
+
+    spans = []
+    for doc_id, items in groups.items():
+        name_doc = items[0][1].metadata.get("name_doc")
+        positioned = sorted(
+            (item for item in items if item[1].metadata.get("start_index") is not None),
+            key=lambda item: item[1].metadata["start_index"],
+        )
+        current = None
+        for rank, chunk in positioned:
+            start = chunk.metadata["start_index"]
+            text = chunk.page_content
+            if current is not None and start <= current["end"]:
+                current["text"] += text[current["end"] - start:]
+                current["end"] = max(current["end"], start + len(text))
+                current["rank"] = min(current["rank"], rank)
+            else:
+                current = {"doc_id": doc_id, "name_doc": name_doc, "text": text, "rank": rank, "end": start + len(text)}
+                spans.append(current)
+
+        # Чанки, загруженные до появления смещений
+        loose = [{"doc_id": doc_id, "name_doc": name_doc, "text": chunk.page_content, "rank": rank}
+                 for rank, chunk in items if chunk.metadata.get("start_index") is None]
+        merged = True
+        while merged:
+            merged = False
+            for left in loose:
+                for right in loose:
+                    if left is right:
+                        continue
+                    position = _overlap(left["text"], right["text"])
+                    if position is not None:
+                        left["text"] = left["text"][:position] + right["text"]
+                        left["rank"] = min(left["rank"], right["rank"])
+                        loose.remove(right)
+                        merged = True
+                        break
+                if merged:
+                    break
+        spans.extend(loose)
+
+    for span in spans:
+        span.pop("end", None)
+    return sorted(spans, key=lambda span: span["rank"])
+
+
+def join_chunks(chunks, doc_id=None):
+    """
+    Собирает текст документа из его чанков, идущих по порядку, убирая перекрытия.
+    Смещения start_index используются только у чанков этого документа: общий
+    с другим документом чанк хранит смещение в том документе. Промежуток между
+    чанками берется из metadata["gap"] (см. PartitionedStore.document_chunks),
+    для чанков без смещений перекрытие ищется по совпадению текста.
+
+    :param chunks: Список объектов Document в порядке следования в документе.
+    :param doc_id: Идентификатор документа (по умолчанию doc_id первого чанка).
+    :return: Текст документа.
+    """
+    if doc_id is None and chunks:
+        doc_id = chunks[0].metadata.get("doc_id")
+    text, end = "", None
+    for chunk in chunks:
+        content = chunk.page_content
+        start = chunk.metadata.get("start_index") if chunk.metadata.get("doc_id") == doc_id else None
+        if start is not None and end is not None:
+            if start <= end:
+                text += content[end - start:]
+            else:
+                gap = chunk.metadata.get("gap")
+                text += gap if gap is not None and len(gap) == start - end else " " * (start - end)
+                text += content
+        elif text:
+            tail_start = max(0, len(text) - len(content))
+            position = _overlap(text[tail_start:], content)
+            if position is not None:
+                text = text[:tail_start + position] + content
+            else:
+                text += "\n" + content
+        else:
+            text = content
+        if start is not None:
+            end = start + len(content) if end is None else max(end, start + len(content))
+        else:
+            end = None
+    return text
+
+
+def render_context(spans):
+    return "\n\n".join(f'[{span["name_doc"]}]\n{span["text"]}' for span in spans)
+
+
+def pack_context(chunks, budget):
+    """
+    Собирает контекст для LLM: склеивает перекрывающиеся чанки и добавляет
+    их в порядке релевантности, пока контекст помещается в бюджет токенов.
+
+    :param chunks: Список объектов Document в порядке релевантности.
+    :param budget: Бюджет контекста в токенах.
+    :return: Кортеж (текст контекста, число токенов контекста).
+    """
+    selected = []
+    context, tokens = "", 0
+    for chunk in chunks:
+        candidate = render_context(merge_chunks(selected + [chunk]))
+        candidate_tokens = count_tokens(candidate)
+        if candidate_tokens <= budget:
+            selected.append(chunk)
+            context, tokens = candidate, candidate_tokens
+    return context, tokens
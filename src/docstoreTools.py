@@ -0,0 +1,272 @@
+import os
+import json
+import mmap
+import numpy as np
+from langchain_community.docstore.base import Docstore, AddableMixin
+from langchain_core.documents import Document
+
+FORMAT_VERSION = 1
+# Поля метаданных чанка, которые хранятся числовыми колонками, а не в общей для документа записи
+INT_COLUMNS = ("start_index", "end_index", "ordinal")
+MISSING = -2  # поля нет в метаданных
+NONE = -1  # поле есть и равно None
+
+
+def _split_metadata(metadata):
+    """
+    Делит метаданные чанка на общую для документа часть и числовые поля чанка.
+
+    :param metadata: Словарь метаданных.
+    :return: Кортеж (общая часть, список значений INT_COLUMNS).
+    """
+    shared = {}
+    values = [MISSING] * len(INT_COLUMNS)
+    for key, value in (metadata or {}).items():
+        if key in INT_COLUMNS and (value is None or (isinstance(value, int) and not isinstance(value, bool) and value >= 0)):
+            values[INT_COLUMNS.index(key)] = NONE if value is None else value
+        else:
+            shared[key] = value
+    return shared, values
+
+
+class Segment:
+    """
+    Неизменяемый колоночный сегмент чанков на диске, читается через mmap:
+    id чанков, номера строк FAISS, смещения текста в общем блобе, номер записи
+    общих метаданных документа и числовые колонки чанка.
+    """
+    def __init__(self, path):
+        """
+        Открывает сегмент. В память читаются только идентификаторы чанков
+        и таблица общих метаданных, тексты остаются на диске.
+
+        :param path: Каталог сегмента.
+        """
+        self.path = path
+        with open(os.path.join(path, "format.json"), "r", encoding="utf-8") as f:
+            info = json.load(f)
+        if info["version"] != FORMAT_VERSION:
+            raise ValueError(f"Неподдерживаемая версия docstore: {info['version']}")
+        self.count = info["count"]
+        with open(os.path.join(path, "ids.txt"), "r", encoding="utf-8") as f:
+            self.ids = f.read().split("\n") if self.count else []
+        with open(os.path.join(path, "groups.json"), "r", encoding="utf-8") as f:
+            self.groups = json.load(f)
+        self.slot_of = {chunk_id: slot for slot, chunk_id in enumerate(self.ids)}
+
+        def column(name):
+            return np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r" if self.count else None)
+
+        self.rows = column("rows")
+        self.offsets = column("offsets")
+        self.group = column("group")
+        self.columns = {name: column(name) for name in INT_COLUMNS}
+        self._text_file = open(os.path.join(path, "text.bin"), "rb")
+        size = os.fstat(self._text_file.fileno()).st_size
+        self.text = mmap.mmap(self._text_file.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+
+    def __contains__(self, chunk_id):
+        return chunk_id in self.slot_of
+
+    def raw(self, chunk_id):
+        """
+        Возвращает текст и метаданные чанка без создания Document.
+
+        :param chunk_id: Идентификатор чанка.
+        :return: Кортеж (текст, словарь метаданных).
+        """
+        slot = self.slot_of[chunk_id]
+        start, end = int(self.offsets[slot]), int(self.offsets[slot + 1])
+        metadata = dict(self.groups[int(self.group[slot])])
+        for name in INT_COLUMNS:
+            value = int(self.columns[name][slot])
+            if value != MISSING:
+                metadata[name] = None if value == NONE else value
+        return self.text[start:end].decode("utf-8"), metadata
+
+    def close(self):
+        if isinstance(self.text, mmap.mmap):
+            self.text.close()
+        self._text_file.close()
+
+
+def _write(path, write):
+    with open(path, "wb") as f:
+        write(f)
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def write_segment(path, rows, lookup):
+    """
+    Записывает колоночный сегмент. Чанки пишутся в порядке номеров строк FAISS.
+
+    :param path: Каталог сегмента (создается).
+    :param rows: Словарь {номер строки FAISS: id чанка}.
+    :param lookup: Функция lookup(id чанка) -> (текст, метаданные).
+    """
+    os.makedirs(path, exist_ok=True)
+    ordered = sorted(rows.items())
+    offsets = np.zeros(len(ordered) + 1, dtype=np.int64)
+    group = np.zeros(len(ordered), dtype=np.int32)
+    columns = {name: np.full(len(ordered), MISSING, dtype=np.int64) for name in INT_COLUMNS}
+    groups, group_of = [], {}
+
+    with open(os.path.join(path, "text.bin"), "wb") as f:
+        position = 0
+        for slot, (_, chunk_id) in enumerate(ordered):
+            text, metadata = lookup(chunk_id)
+            data = text.encode("utf-8")
+            f.write(data)
+            position += len(data)
+            offsets[slot + 1] = position
+
+            shared, values = _split_metadata(metadata)
+            key = json.dumps(shared, ensure_ascii=False, default=str)
+            if key not in group_of:
+                group_of[key] = len(groups)
+                groups.append(shared)
+            group[slot] = group_of[key]
+            for name, value in zip(INT_COLUMNS, values):
+                columns[name][slot] = value
+        f.flush()
+        os.fsync(f.fileno())
+
+    arrays = {"rows": np.asarray([row for row, _ in ordered], dtype=np.int64), "offsets": offsets, "group": group, **columns}
+    for name, values in arrays.items():
+        _write(os.path.join(path, f"{name}.npy"), lambda f: np.save(f, values))
+    files = {
+        "ids.txt": "\n".join(chunk_id for _, chunk_id in ordered),
+        "groups.json": json.dumps(groups, ensure_ascii=False, default=str),
+        # format.json пишется последним: сегмент без него не открывается
+        "format.json": json.dumps({"version": FORMAT_VERSION, "count": len(ordered), "int_columns": list(INT_COLUMNS)}),
+    }
+    for name, text in files.items():
+        _write(os.path.join(path, name), lambda f: f.write(text.encode("utf-8")))
+
+
+class ColumnarDocstore(Docstore, AddableMixin):
+    """
+    Docstore раздела поверх колоночного сегмента на диске. Объекты Document
+    создаются только для найденных чанков. Изменения после последнего снимка
+    держатся в памяти: добавленные чанки — в overlay, удаленные из сегмента — в deleted.
+    При компакции раздела пишется новый сегмент (см. write_segment, adopt).
+    """
+    def __init__(self, segment=None, documents=None):
+        """
+        Инициализация docstore.
+
+        :param segment: Открытый сегмент (Segment) или None.
+        :param documents: Начальные документы в памяти {id чанка: Document} (например, из старого pickle).
+        """
+        self.segment = segment
+        self.overlay = dict(documents or {})
+        self.deleted = set()
+
+    @classmethod
+    def open(cls, path):
+        return cls(Segment(path))
+
+    def __contains__(self, chunk_id):
+        if chunk_id in self.overlay:
+            return True
+        return self.segment is not None and chunk_id in self.segment and chunk_id not in self.deleted
+
+    def __len__(self):
+        return len(self.ids())
+
+    def ids(self):
+        """
+        Возвращает идентификаторы всех живых чанков.
+
+        :return: Список идентификаторов.
+        """
+        base = [chunk_id for chunk_id in self.segment.ids if chunk_id not in self.deleted] if self.segment else []
+        return [chunk_id for chunk_id in base if chunk_id not in self.overlay] + list(self.overlay)
+
+    def row_ids(self):
+        """
+        Возвращает соответствие строк FAISS и чанков сегмента (для index_to_docstore_id).
+
+        :return: Словарь {номер строки: id чанка}.
+        """
+        if self.segment is None:
+            return {}
+        return dict(zip(self.segment.rows.tolist(), self.segment.ids))
+
+    def raw(self, chunk_id):
+        """
+        Возвращает текст и метаданные чанка.
+
+        :param chunk_id: Идентификатор чанка.
+        :return: Кортеж (текст, словарь метаданных).
+        """
+        document = self.overlay.get(chunk_id)
+        if document is not None:
+            return document.page_content, document.metadata
+        return self.segment.raw(chunk_id)
+
+    def search(self, search):
+        """
+        Возвращает чанк по идентификатору.
+
+        :param search: Идентификатор чанка.
+        :return: Объект Document или строка с сообщением, если чанка нет (как InMemoryDocstore).
+        """
+        document = self.overlay.get(search)
+        if document is not None:
+            return document
+        if search not in self:
+            return f"ID {search} not found."
+        text, metadata = self.segment.raw(search)
+        return Document(id=search, page_content=text, metadata=metadata)
+
+    def add(self, texts):
+        """
+        Добавляет или заменяет чанки.
+
+        :param texts: Словарь {id чанка: Document}.
+        """
+        self.overlay.update(texts)
+
+    def delete(self, ids):
+        """
+        Удаляет чанки. Чанки сегмента помечаются удаленными до следующей компакции.
+
+        :param ids: Список идентификаторов чанков.
+        """
+        for chunk_id in ids:
+            self.overlay.pop(chunk_id, None)
+            if self.segment is not None and chunk_id in self.segment:
+                self.deleted.add(chunk_id)
+
+    def freeze(self):
+        """
+        Запоминает состояние для записи снимка вне блокировки раздела.
+        Сегмент неизменяем, поэтому копируются только изменения в памяти.
+
+        :return: Копия docstore с общим сегментом.
+        """
+        frozen = ColumnarDocstore(self.segment, self.overlay)
+        frozen.deleted = set(self.deleted)
+        return frozen
+
+    def adopt(self, path, frozen):
+        """
+        Переключается на только что записанный сегмент. Изменения, сделанные
+        после freeze, остаются в памяти поверх нового сегмента.
+
+        :param path: Каталог нового сегмента.
+        :param frozen: Состояние, из которого записан сегмент (результат freeze).
+        """
+        segment = Segment(path)
+        deleted = {chunk_id for chunk_id in segment.ids if chunk_id not in self}
+        self.overlay = {
+            chunk_id: document for chunk_id, document in self.overlay.items()
+            if frozen.overlay.get(chunk_id) is not document
+        }
+        old_segment, self.segment, self.deleted = self.segment, segment, deleted
+        if old_segment is not None and old_segment is not frozen.segment:
+            old_segment.close()
+        if frozen.segment is not None:
+            frozen.segment.close()
@@ -0,0 +1,323 @@
+import os
+import re
+import json
+import zlib
+import hashlib
+import threading
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from src.batchTools import MicroBatcher
+from src.traceTools import cache_result
+from src.lockTools import acquire_writer
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Обертка над моделью эмбеддингов с дисковым кэшем векторов.
+
+    Векторы лежат в memory-mapped файле float32 фиксированной емкости,
+    ключи (хэш модели, типа и текста) — в журнале keys.log вместе с номером
+    слота и контрольной суммой вектора. При заполнении кэш перезаписывает
+    самые старые слоты по кругу. Если процесс упал между записью вектора
+    и записью ключа, контрольная сумма старого ключа слота не сойдется
+    с новым вектором, и при загрузке слот будет считаться пустым.
+    """
+    def __init__(self, embedding, model_id, path, max_items=50000):
+        """
+        Инициализация кэша.
+
+        :param embedding: Исходная модель эмбеддингов.
+        :param model_id: Идентификатор модели (входит в ключ кэша).
+        :param path: Каталог кэша.
+        :param max_items: Максимальное число векторов в кэше.
+        """
+        self.embedding = embedding
+        self.model_id = model_id
+        self.path = os.path.join(path, re.sub(r"[^\w\-.]", "_", model_id))
+        self.max_items = max_items
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._slots = {}
+        self._slot_keys = [None] * max_items
+        self._next = 0
+        self._log_lines = 0
+        self._vectors = None
+        # Слоты кэша раздаются в памяти процесса, второй процесс писал бы в те же слоты
+        acquire_writer(os.path.join(self.path, ".lock"))
+        self._load()
+
+    @property
+    def _meta_path(self):
+        return os.path.join(self.path, "meta.json")
+
+    @property
+    def _vectors_path(self):
+        return os.path.join(self.path, "vectors.f32")
+
+    @property
+    def _keys_path(self):
+        return os.path.join(self.path, "keys.log")
+
+    def _load(self):
+        """
+        Открывает существующий кэш. Кэш другой емкости сбрасывается.
+        """
+        if not os.path.exists(self._meta_path):
+            return
+        with open(self._meta_path, "r") as f:
+            meta = json.load(f)
+        if meta["capacity"] != self.max_items or not os.path.exists(self._vectors_path):
+            # Файл блокировки остается: он удерживается этим процессом
+            for path in (self._meta_path, self._vectors_path, self._keys_path):
+                if os.path.exists(path):
+                    os.remove(path)
+            return
+
+        self._vectors = np.memmap(self._vectors_path, dtype=np.float32, mode="r+", shape=(meta["capacity"], meta["dim"]))
+        last_slot = -1
+        checksums = [None] * self.max_items
+        invalid = False
+        if os.path.exists(self._keys_path):
+            with open(self._keys_path, "r") as f:
+                for line in f:
+                    parts = line.split()
+                    # Обрывок строки или запись старого формата без контрольной суммы
+                    if len(parts) != 3 or not line.endswith("\n"):
+                        invalid = True
+                        continue
+                    last_slot = int(parts[1])
+                    self._slot_keys[last_slot] = parts[0]
+                    checksums[last_slot] = int(parts[2])
+                    self._log_lines += 1
+        for slot, key in enumerate(self._slot_keys):
+            if key is not None and checksums[slot] != self._checksum(self._vectors[slot]):
+                self._slot_keys[slot] = None
+                invalid = True
+        self._slots = {key: slot for slot, key in enumerate(self._slot_keys) if key is not None}
+        self._next = (last_slot + 1) % self.max_items
+        if invalid:
+            self._rewrite_keys()
+
+    @staticmethod
+    def _checksum(vector):
+        return zlib.crc32(np.asarray(vector, dtype=np.float32).tobytes())
+
+    def _key(self, kind, text):
+        return hashlib.sha256(f"{self.model_id}\0{kind}\0{text}".encode("utf-8")).hexdigest()
+
+    def _lookup(self, keys):
+        """
+        Ищет векторы в кэше.
+
+        :param keys: Список ключей.
+        :return: Список векторов (None для промахов).
+        """
+        with self._lock:
+            result = []
+            for key in keys:
+                slot = self._slots.get(key)
+                result.append(self._vectors[slot].tolist() if slot is not None else None)
+            hits = sum(vector is not None for vector in result)
+            self.hits += hits
+            self.misses += len(keys) - hits
+            return result
+
+    def _store(self, keys, vectors):
+        """
+        Записывает векторы в кэш, вытесняя самые старые слоты.
+
+        :param keys: Список ключей.
+        :param vectors: Список векторов.
+        """
+        if not keys or self.max_items <= 0:
+            return
+        with self._lock:
+            if self._vectors is None:
+                os.makedirs(self.path, exist_ok=True)
+                dim = len(vectors[0])
+                self._vectors = np.memmap(self._vectors_path, dtype=np.float32, mode="w+", shape=(self.max_items, dim))
+                with open(self._meta_path, "w") as f:
+                    json.dump({"model_id": self.model_id, "capacity": self.max_items, "dim": dim}, f)
+
+            lines = []
+            for key, vector in zip(keys, vectors):
+                if key in self._slots:
+                    continue
+                slot = self._next
+                old_key = self._slot_keys[slot]
+                if old_key is not None:
+                    del self._slots[old_key]
+                self._vectors[slot] = vector
+                self._slot_keys[slot] = key
+                self._slots[key] = slot
+                self._next = (slot + 1) % self.max_items
+                lines.append(f"{key} {slot} {self._checksum(self._vectors[slot])}\n")
+
+            # Ключ пишется только после сброса вектора на диск; если запись ключа
+            # не дойдет до диска, старый ключ слота отбросится по контрольной сумме
+            self._vectors.flush()
+            with open(self._keys_path, "a") as f:
+                f.writelines(lines)
+            self._log_lines += len(lines)
+            if self._log_lines > 4 * self.max_items:
+                self._rewrite_keys()
+
+    def _rewrite_keys(self):
+        """
+        Переписывает журнал ключей, оставляя только актуальные записи.
+        """
+        tmp_path = self._keys_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            for slot in [(self._next + i) % self.max_items for i in range(self.max_items)]:
+                if self._slot_keys[slot] is not None:
+                    f.write(f"{self._slot_keys[slot]} {slot} {self._checksum(self._vectors[slot])}\n")
+        os.replace(tmp_path, self._keys_path)
+        self._log_lines = len(self._slots)
+
+    def embed_documents(self, texts):
+        """
+        Возвращает эмбеддинги документов, считая моделью только отсутствующие в кэше.
+
+        :param texts: Список текстов.
+        :return: Список векторов.
+        """
+        keys = [self._key("passage", text) for text in texts]
+        result = self._lookup(keys)
+        hits = sum(vector is not None for vector in result)
+        cache_result("passage", True, hits)
+        cache_result("passage", False, len(result) - hits)
+
+        missing = {}
+        for i, vector in enumerate(result):
+            if vector is None:
+                missing.setdefault(keys[i], texts[i])
+        if missing:
+            vectors = self.embedding.embed_documents(list(missing.values()))
+            computed = dict(zip(missing.keys(), vectors))
+            self._store(list(computed.keys()), list(computed.values()))
+            result = [vector if vector is not None else computed[key] for key, vector in zip(keys, result)]
+        return result
+
+    def embed_query(self, text):
+        """
+        Возвращает эмбеддинг запроса из кэша или считает его моделью.
+
+        :param text: Текст запроса.
+        :return: Вектор.
+        """
+        key = self._key("query", text)
+        vector = self._lookup([key])[0]
+        cache_result("embedding", vector is not None)
+        if vector is None:
+            vector = self.embedding.embed_query(text)
+            self._store([key], [vector])
+        return vector
+
+    def stats(self):
+        """
+        Возвращает счетчики кэша.
+
+        :return: Словарь с hits, misses, hit_rate и items.
+        """
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "items": len(self._slots),
+        }
+
+
+class BatchedEmbeddings(Embeddings):
+    """
+    Обертка над моделью эмбеддингов, которая объединяет одновременные
+    embed_query из разных потоков в один вызов embed_documents.
+
+    Подходит для моделей, у которых эмбеддинг запроса совпадает с эмбеддингом
+    документа (HuggingFaceEmbeddings без отдельных инструкций для запросов).
+    """
+    def __init__(self, embedding, max_batch=32, max_wait=0.005):
+        """
+        Инициализация обертки.
+
+        :param embedding: Исходная модель эмбеддингов.
+        :param max_batch: Максимальное число запросов в одном проходе модели.
+        :param max_wait: Сколько секунд ждать остальные запросы батча после первого.
+        """
+        self.embedding = embedding
+        self.batcher = MicroBatcher(embedding.embed_documents, max_batch, max_wait)
+
+    def embed_documents(self, texts):
+        return self.embedding.embed_documents(texts)
+
+    def embed_query(self, text):
+        return self.batcher.submit(text)
+
+    def stats(self):
+        return self.batcher.stats()
+
+
+class OnnxEmbeddings(Embeddings):
+    """
+    Модель эмбеддингов, экспортированная в ONNX (см. scripts/export_onnx.py)
+    и исполняемая через onnxruntime на CPU. Повторяет пайплайн sentence-transformers
+    для e5: mean pooling по маске внимания и L2-нормализация.
+    """
+    def __init__(self, path, quantized=True, threads=4, batch_size=64, max_length=512):
+        """
+        Инициализация модели.
+
+        :param path: Каталог с model.onnx / model_quantized.onnx и токенизатором.
+        :param quantized: Использовать int8-квантованную модель.
+        :param threads: Число потоков onnxruntime внутри одного батча.
+        :param batch_size: Размер батча для модели.
+        :param max_length: Максимальная длина текста в токенах.
+        """
+        # onnxruntime нужен только для этого бэкенда
+        import onnxruntime
+        from transformers import AutoTokenizer
+
+        self.path = path
+        self.batch_size = batch_size
+        self.max_length = max_length
+        self.tokenizer = AutoTokenizer.from_pretrained(path)
+
+        options = onnxruntime.SessionOptions()
+        options.intra_op_num_threads = threads
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        model_file = os.path.join(path, "model_quantized.onnx" if quantized else "model.onnx")
+        self.session = onnxruntime.InferenceSession(model_file, options, providers=["CPUExecutionProvider"])
+        self.input_names = [item.name for item in self.session.get_inputs()]
+
+    def _embed(self, texts):
+        """
+        Считает нормализованные эмбеддинги одного батча.
+
+        :param texts: Список текстов.
+        :return: Матрица векторов (float32).
+        """
+        tokens = self.tokenizer(texts, padding=True, truncation=True, max_length=self.max_length, return_tensors="np")
+        inputs = {name: tokens[name].astype(np.int64) for name in self.input_names}
+        hidden = self.session.run(None, inputs)[0]
+        mask = tokens["attention_mask"][..., None].astype(np.float32)
+        vectors = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        return vectors / np.clip(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12, None)
+
+    def embed_documents(self, texts):
+        """
+        Возвращает эмбеддинги документов.
+
+        :param texts: Список текстов.
+        :return: Список векторов.
+        """
+        vectors = []
+        # Сортировка по длине уменьшает паддинг внутри батча
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        for start in range(0, len(order), self.batch_size):
+            batch = order[start:start + self.batch_size]
+            vectors.extend(zip(batch, self._embed([texts[i] for i in batch]).tolist()))
+        return [vector for _, vector in sorted(vectors, key=lambda item: item[0])]
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
@@ -0,0 +1,103 @@
+import hashlib
+import unicodedata
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+
+def content_hash(text):
+    """
+    Хэш нормализованного текста: Unicode NFC и схлопнутые пробельные символы.
+    Используется как адрес документов и чанков.
+
+    :param text: Исходный текст.
+    :return: Шестнадцатеричная строка хэша.
+    """
+    normalized = " ".join(unicodedata.normalize("NFC", text).split())
+    return hashlib.sha256(normalized.encode("utf-8")).hexdigest()[:32]
+
+
+class UploadedDoc:
+    """
+    Копия загруженного файла в памяти. Нужна, чтобы фоновая загрузка не зависела
+    от объектов UploadedFile, которые живут только в рамках сессии Streamlit.
+    """
+    def __init__(self, name, size, type, data):
+        """
+        Инициализация копии файла.
+
+        :param name: Имя файла.
+        :param size: Размер файла в байтах.
+        :param type: MIME-тип файла.
+        :param data: Содержимое файла (bytes).
+        """
+        self.name = name
+        self.size = size
+        self.type = type
+        self.data = data
+
+    def read(self):
+        return self.data
+
+    @staticmethod
+    def from_upload(doc):
+        """
+        Создает копию из загруженного файла (UploadedFile или аналогичного объекта).
+
+        :param doc: Загруженный файл.
+        :return: Объект UploadedDoc.
+        """
+        return UploadedDoc(doc.name, doc.size, doc.type, doc.read())
+
+
+def embed_documents_pipeline(document_list, split_fn, embedding, batch_size=64, workers=4, progress=None):
+    """
+    Конвейер загрузки: файлы читаются и режутся на чанки в пуле потоков,
+    параллельно с этим чанки эмбеддятся большими батчами.
+
+    :param document_list: Список загружаемых документов (например, файлов).
+    :param split_fn: Функция, превращающая файл в список объектов Document.
+    :param embedding: Экземпляр модели эмбеддингов.
+    :param batch_size: Размер батча для модели эмбеддингов.
+    :param workers: Число потоков для чтения и разбиения файлов.
+    :param progress: Необязательный колбэк progress(индекс файла, готово чанков, всего чанков).
+    :return: Кортеж (список Document, список векторов) в порядке исходных файлов.
+    """
+    documents = []
+    embedding_futures = []
+    totals = {}
+    embedded = Counter()
+
+    def report(file_idx):
+        if progress is not None:
+            progress(file_idx, embedded[file_idx], totals[file_idx])
+
+    def embed_batch(batch):
+        vectors = embedding.embed_documents([doc.page_content for _, doc in batch])
+        for file_idx, count in Counter(file_idx for file_idx, _ in batch).items():
+            embedded[file_idx] += count
+            report(file_idx)
+        return vectors
+
+    # Модель эмбеддингов сама использует все ядра, поэтому батчи идут в один поток,
+    # а чтение и разбиение следующих файлов продолжается параллельно
+    with ThreadPoolExecutor(max_workers=workers) as split_pool, ThreadPoolExecutor(max_workers=1) as embed_pool:
+        split_futures = [split_pool.submit(split_fn, doc) for doc in document_list]
+
+        pending = []
+        for file_idx, future in enumerate(split_futures):
+            chunks = future.result()
+            totals[file_idx] = len(chunks)
+            report(file_idx)
+            pending.extend((file_idx, chunk) for chunk in chunks)
+            while len(pending) >= batch_size:
+                batch, pending = pending[:batch_size], pending[batch_size:]
+                documents.extend(doc for _, doc in batch)
+                embedding_futures.append(embed_pool.submit(embed_batch, batch))
+
+        if pending:
+            documents.extend(doc for _, doc in pending)
+            embedding_futures.append(embed_pool.submit(embed_batch, pending))
+
+        embeddings = [vector for future in embedding_futures for vector in future.result()]
+
+    return documents, embeddings
@@ -1,45 +1,91 @@
-from langchain_huggingface import HuggingFaceEmbeddings
 import streamlit as st
-from langchain_community.vectorstores import FAISS
 import os
-from langchain_openai import ChatOpenAI
+import threading
+from src.jobTools import JobQueue
+from src.chatTools import ChatManager
+from src.warmupTools import Warmup
+from src.traceTools import start_metrics_server
+from CONFIG import CONFIG
+
+# Тяжелые библиотеки (torch, langchain, FAISS) импортируются внутри загрузчиков,
+# чтобы интерфейс отрисовывался до их загрузки (см. load_resources)
 
 
 @st.cache_resource
 def load_embeddings(type):
     """
-    Загружает модель эмбеддингов HuggingFace для заданного устройства (CPU или GPU).
+    Загружает модель эмбеддингов HuggingFace для заданного устройства (CPU или GPU)
+    либо её ONNX-экспорт, если CONFIG.EMBEDDINGS_BACKEND = 'onnx' (только CPU).
+    Одновременные запросы объединяются в батчи (BatchedEmbeddings),
+    если включен кэш эмбеддингов, модель оборачивается в CachedEmbeddings.
 
     :param type: Тип устройства для загрузки модели ('cpu' или 'cuda').
-    :return: Экземпляр HuggingFaceEmbeddings.
+    :return: Экземпляр модели эмбеддингов.
     """
-    model_id = 'intfloat/multilingual-e5-large'
-    if type == 'cpu':
-        model_kwargs = {'device': 'cpu'}
+    from src.embeddingTools import CachedEmbeddings, BatchedEmbeddings, OnnxEmbeddings
+
+    model_id = CONFIG.EMBEDDINGS_MODEL
+    if CONFIG.EMBEDDINGS_BACKEND == 'onnx':
+        embeddings = OnnxEmbeddings(
+            CONFIG.ONNX_MODEL_PATH,
+            quantized=CONFIG.ONNX_QUANTIZED,
+            threads=CONFIG.ONNX_THREADS,
+            batch_size=CONFIG.EMBEDDING_BATCH_SIZE,
+        )
+        # Векторы ONNX-модели, особенно квантованной, немного отличаются — кэш у них свой
+        model_id = f"{model_id}-onnx{'-int8' if CONFIG.ONNX_QUANTIZED else ''}"
     else:
-        model_kwargs = {'device': 'cuda'}
-    embeddings = HuggingFaceEmbeddings(
-        model_name=model_id,
-        model_kwargs=model_kwargs
-    )
+        from langchain_huggingface import HuggingFaceEmbeddings
+
+        if type == 'cpu':
+            model_kwargs = {'device': 'cpu'}
+        else:
+            model_kwargs = {'device': 'cuda'}
+        # В контейнере модель скачана при сборке образа, сеть при старте не нужна
+        model_kwargs['local_files_only'] = CONFIG.EMBEDDINGS_LOCAL_ONLY
+        embeddings = HuggingFaceEmbeddings(
+            model_name=model_id,
+            model_kwargs=model_kwargs,
+            encode_kwargs={'batch_size': CONFIG.EMBEDDING_BATCH_SIZE}
+        )
+    if CONFIG.QUERY_BATCH_SIZE:
+        embeddings = BatchedEmbeddings(embeddings, CONFIG.QUERY_BATCH_SIZE, CONFIG.QUERY_BATCH_WAIT_MS / 1000)
+    if CONFIG.EMBEDDING_CACHE_SIZE:
+        embeddings = CachedEmbeddings(embeddings, model_id, CONFIG.EMBEDDING_CACHE_PATH, CONFIG.EMBEDDING_CACHE_SIZE)
     return embeddings
 
 
 @st.cache_resource
 def load_database(_embedding, faiss_idx):
     """
-    Загружает или создает локальную базу данных FAISS для хранения векторных представлений.
+    Загружает или создает локальное хранилище FAISS, разбитое на разделы по чатам.
+    Если по пути лежит старый общий индекс, он переносится в разделы.
+    Журналы операций разделов проигрываются поверх последних снимков.
 
     :param _embedding: Экземпляр модели эмбеддингов.
-    :param faiss_idx: Путь к локальному индексу FAISS.
-    :return: Экземпляр FAISS базы данных.
+    :param faiss_idx: Путь к корневому каталогу хранилища FAISS.
+    :return: Экземпляр PartitionedStore.
     """
-    if os.path.exists(faiss_idx) and os.path.isdir(faiss_idx):
-        db = FAISS.load_local(faiss_idx, _embedding, allow_dangerous_deserialization=True)
-    else:
-        db = FAISS.from_texts("Hello pipl", _embedding)
-        db.save_local(faiss_idx)
-    return db
+    from src.storeTools import PartitionedStore, migrate_legacy_index
+
+    store = PartitionedStore(
+        _embedding,
+        faiss_idx,
+        max_partitions=CONFIG.PARTITION_CACHE_SIZE,
+        compact_bytes=CONFIG.WAL_COMPACT_BYTES,
+        index_options={
+            "factory": CONFIG.FAISS_INDEX_FACTORY,
+            "min_vectors": CONFIG.FAISS_INDEX_MIN_VECTORS,
+            "train_size": CONFIG.FAISS_INDEX_TRAIN_SIZE,
+            "nprobe": CONFIG.FAISS_NPROBE,
+        },
+        search_batch=CONFIG.QUERY_BATCH_SIZE,
+        search_wait=CONFIG.QUERY_BATCH_WAIT_MS / 1000,
+    )
+    if os.path.isfile(os.path.join(faiss_idx, "index.faiss")):
+        migrate_legacy_index(store, faiss_idx)
+    store.recover()
+    return store
 
 
 @st.cache_resource
@@ -51,6 +97,8 @@ def load_llm(api_key, proxy):
     :param proxy: Прокси-сервер для запросов к OpenAI.
     :return: Экземпляр ChatOpenAI.
     """
+    from langchain_openai import ChatOpenAI
+
     llm = ChatOpenAI(
         model="gpt-4o",
         api_key=api_key,
@@ -62,3 +110,101 @@ def load_llm(api_key, proxy):
         streaming=True
     )
     return llm
+
+
+@st.cache_resource
+def load_job_queue(workers):
+    """
+    Создает общую для процесса очередь фоновых задач загрузки документов.
+
+    :param workers: Число рабочих потоков.
+    :return: Экземпляр JobQueue.
+    """
+    return JobQueue(workers=workers)
+
+
+@st.cache_resource
+def load_answer_cache(threshold, max_entries):
+    """
+    Создает общий для процесса семантический кэш ответов.
+
+    :param threshold: Минимальная косинусная близость вопросов для попадания.
+    :param max_entries: Максимальное число ответов на чат и набор параметров.
+    :return: Экземпляр SemanticCache.
+    """
+    from src.cacheTools import SemanticCache
+
+    return SemanticCache(threshold=threshold, max_entries=max_entries)
+
+
+@st.cache_resource
+def load_chat_manager(path, legacy_path=None):
+    """
+    Создает общий для процесса менеджер чатов. Сессии Streamlit хранят
+    только ссылки на него и на его чаты.
+
+    :param path: Путь к файлу SQLite с чатами.
+    :param legacy_path: Путь к старому файлу chats.json для переноса (опционально).
+    :return: Экземпляр ChatManager.
+    """
+    return ChatManager(path, legacy_path)
+
+
+@st.cache_resource
+def load_metrics_server(host, port):
+    """
+    Запускает общий для процесса HTTP-сервер метрик Prometheus (/metrics).
+
+    :param host: Адрес.
+    :param port: Порт.
+    :return: Экземпляр сервера или None, если порт занят.
+    """
+    try:
+        return start_metrics_server(host, port)
+    except OSError as e:
+        print(f"Сервер метрик не запущен на порту {port}: {e}", flush=True)
+        return None
+
+
+@st.cache_resource
+def load_api_server(host, port):
+    """
+    Запускает HTTP API (api.py) в фоновом потоке процесса Streamlit. API берет
+    модель эмбеддингов, хранилище, LLM, кэши и менеджер чатов из тех же
+    загрузчиков st.cache_resource, поэтому работает с теми же объектами, что и интерфейс.
+
+    :param host: Адрес.
+    :param port: Порт.
+    :return: Экземпляр uvicorn.Server.
+    """
+    import uvicorn
+    import api
+
+    server = uvicorn.Server(uvicorn.Config(api.app, host=host, port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    return server
+
+
+@st.cache_resource
+def load_resources():
+    """
+    Запускает фоновую загрузку модели эмбеддингов, хранилища FAISS и LLM.
+    Страницы, которым они не нужны, отрисовываются сразу; страница чата
+    ждет готовности (Warmup.ready).
+
+    :return: Экземпляр Warmup с результатами шагов embeddings, database и llm
+             (и api, если CONFIG.API_IN_APP).
+    """
+    def import_modules(results):
+        import src.aiTools
+
+    steps = [
+        ("modules", import_modules),
+        ("embeddings", lambda results: load_embeddings(CONFIG.EMBEDDINGS_DEVICE)),
+        ("database", lambda results: load_database(results["embeddings"], CONFIG.FAISS_INDEX_PATH)),
+        ("llm", lambda results: load_llm(CONFIG.OPENAI_API_KEY, CONFIG.OPENAI_PROXY)),
+    ]
+    if CONFIG.API_IN_APP:
+        # API стартует последним: все загрузчики к этому моменту уже в кэше
+        steps.append(("api", lambda results: load_api_server(CONFIG.API_HOST, CONFIG.API_PORT)))
+    return Warmup(steps)
@@ -0,0 +1,131 @@
+import time
+import queue
+import threading
+from uuid import uuid4
+
+
+class IngestJob:
+    """
+    Фоновая задача загрузки документов в раздел чата. Хранит статус и прогресс по файлам.
+    """
+    def __init__(self, table_id, file_names):
+        """
+        Инициализация задачи.
+
+        :param table_id: Идентификатор таблицы/чата.
+        :param file_names: Имена загружаемых файлов.
+        """
+        self.id = str(uuid4())
+        self.table_id = table_id
+        self.status = "queued"
+        self.error = None
+        self.created = time.time()
+        self.finished = None
+        self.files = [{"name": name, "done": 0, "total": None} for name in file_names]
+
+    def update_file(self, file_idx, done, total):
+        """
+        Обновляет прогресс файла. Подходит как колбэк для embed_documents_pipeline.
+
+        :param file_idx: Индекс файла в задаче.
+        :param done: Сколько чанков файла уже обработано.
+        :param total: Сколько всего чанков в файле.
+        """
+        self.files[file_idx]["done"] = done
+        self.files[file_idx]["total"] = total
+
+    @property
+    def active(self):
+        return self.status in ("queued", "running")
+
+    def to_dict(self):
+        """
+        Преобразует задачу в словарь.
+        :return: Словарь с данными задачи.
+        """
+        return {
+            "id": self.id,
+            "table_id": self.table_id,
+            "status": self.status,
+            "error": self.error,
+            "created": self.created,
+            "finished": self.finished,
+            "files": [dict(file) for file in self.files],
+        }
+
+
+class JobQueue:
+    """
+    Очередь фоновых задач загрузки с пулом рабочих потоков.
+    """
+    def __init__(self, workers=1, keep_finished=50):
+        """
+        Инициализация очереди и запуск рабочих потоков.
+
+        :param workers: Число рабочих потоков.
+        :param keep_finished: Сколько завершенных задач хранить для отображения.
+        """
+        self.keep_finished = keep_finished
+        self._queue = queue.Queue()
+        self._jobs = {}
+        self._lock = threading.Lock()
+        for _ in range(workers):
+            threading.Thread(target=self._worker, daemon=True).start()
+
+    def submit(self, table_id, file_names, fn):
+        """
+        Ставит задачу в очередь.
+
+        :param table_id: Идентификатор таблицы/чата.
+        :param file_names: Имена загружаемых файлов.
+        :param fn: Функция fn(job), выполняющая загрузку.
+        :return: Идентификатор задачи.
+        """
+        job = IngestJob(table_id, file_names)
+        with self._lock:
+            self._jobs[job.id] = job
+        self._queue.put((job, fn))
+        return job.id
+
+    def get(self, job_id):
+        """
+        Возвращает задачу по её ID.
+
+        :param job_id: Идентификатор задачи.
+        :return: Объект IngestJob или None.
+        """
+        return self._jobs.get(job_id)
+
+    def jobs_for(self, table_id):
+        """
+        Возвращает задачи чата, от старых к новым.
+
+        :param table_id: Идентификатор таблицы/чата.
+        :return: Список объектов IngestJob.
+        """
+        with self._lock:
+            return [job for job in self._jobs.values() if job.table_id == table_id]
+
+    def _worker(self):
+        while True:
+            job, fn = self._queue.get()
+            job.status = "running"
+            try:
+                fn(job)
+                job.status = "done"
+            except Exception as e:
+                job.status = "error"
+                job.error = str(e)
+            finally:
+                job.finished = time.time()
+                self._prune()
+                self._queue.task_done()
+
+    def _prune(self):
+        """
+        Удаляет самые старые завершенные задачи сверх лимита.
+        """
+        with self._lock:
+            finished = sorted((job for job in self._jobs.values() if not job.active), key=lambda job: job.finished)
+            for job in finished[:max(0, len(finished) - self.keep_finished)]:
+                del self._jobs[job.id]
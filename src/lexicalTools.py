@@ -0,0 +1,125 @@
+import re
+import json
+import math
+from collections import Counter
+
+TOKEN_PATTERN = re.compile(r"\w+(?:[-./]\w+)*")
+
+
+def tokenize(text):
+    """
+    Разбивает текст на термы для лексического поиска. Составные коды вида
+    «АБ-123/4» сохраняются целиком и дополнительно разбиваются на части.
+
+    :param text: Исходный текст.
+    :return: Список термов в нижнем регистре.
+    """
+    tokens = []
+    for token in TOKEN_PATTERN.findall(text.lower()):
+        tokens.append(token)
+        parts = re.split(r"[-./]", token)
+        if len(parts) > 1:
+            tokens.extend(part for part in parts if part)
+    return tokens
+
+
+def reciprocal_rank_fusion(rankings, k=60):
+    """
+    Объединяет несколько ранжированных списков методом Reciprocal Rank Fusion.
+
+    :param rankings: Список ранжированных списков идентификаторов.
+    :param k: Сглаживающая константа RRF.
+    :return: Список идентификаторов по убыванию итогового балла.
+    """
+    scores = Counter()
+    for ranking in rankings:
+        for rank, item in enumerate(ranking):
+            scores[item] += 1.0 / (k + rank + 1)
+    return [item for item, _ in scores.most_common()]
+
+
+class BM25Index:
+    """
+    Инвертированный индекс BM25 по чанкам одного чата. Обновляется инкрементально.
+    """
+    def __init__(self, postings=None, lengths=None, k1=1.5, b=0.75):
+        """
+        Инициализация индекса.
+
+        :param postings: Словарь {терм: {id чанка: частота}}.
+        :param lengths: Словарь {id чанка: длина в термах}.
+        :param k1: Параметр насыщения частоты BM25.
+        :param b: Параметр нормировки по длине BM25.
+        """
+        self.postings = postings or {}
+        self.lengths = lengths or {}
+        self.k1 = k1
+        self.b = b
+        self.total_length = sum(self.lengths.values())
+        self.chunk_terms = {}
+        for term, chunks in self.postings.items():
+            for chunk_id in chunks:
+                self.chunk_terms.setdefault(chunk_id, []).append(term)
+
+    def add(self, ids, texts):
+        """
+        Индексирует чанки.
+
+        :param ids: Список идентификаторов чанков.
+        :param texts: Список текстов чанков.
+        """
+        for chunk_id, text in zip(ids, texts):
+            if chunk_id in self.lengths:
+                continue
+            counts = Counter(tokenize(text))
+            for term, tf in counts.items():
+                self.postings.setdefault(term, {})[chunk_id] = tf
+            self.chunk_terms[chunk_id] = list(counts)
+            self.lengths[chunk_id] = sum(counts.values())
+            self.total_length += self.lengths[chunk_id]
+
+    def remove(self, ids):
+        """
+        Удаляет чанки из индекса.
+
+        :param ids: Список идентификаторов чанков.
+        """
+        for chunk_id in ids:
+            for term in self.chunk_terms.pop(chunk_id, ()):
+                chunks = self.postings.get(term)
+                if chunks is not None:
+                    chunks.pop(chunk_id, None)
+                    if not chunks:
+                        del self.postings[term]
+            self.total_length -= self.lengths.pop(chunk_id, 0)
+
+    def search(self, query, k=10):
+        """
+        Ищет чанки по BM25.
+
+        :param query: Текст запроса.
+        :param k: Количество результатов.
+        :return: Список пар (id чанка, балл) по убыванию балла.
+        """
+        n = len(self.lengths)
+        if not n:
+            return []
+        avg_length = self.total_length / n
+        scores = Counter()
+        for term in set(tokenize(query)):
+            chunks = self.postings.get(term)
+            if not chunks:
+                continue
+            idf = math.log(1 + (n - len(chunks) + 0.5) / (len(chunks) + 0.5))
+            for chunk_id, tf in chunks.items():
+                norm = self.k1 * (1 - self.b + self.b * self.lengths[chunk_id] / avg_length)
+                scores[chunk_id] += idf * tf * (self.k1 + 1) / (tf + norm)
+        return scores.most_common(k)
+
+    def dumps(self):
+        return json.dumps({"postings": self.postings, "lengths": self.lengths}, ensure_ascii=False)
+
+    @staticmethod
+    def loads(data):
+        data = json.loads(data)
+        return BM25Index(data["postings"], data["lengths"])
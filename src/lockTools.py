@@ -0,0 +1,48 @@
+import os
+import threading
+
+try:
+    import fcntl
+except ImportError:  # Windows: блокировка не поддерживается
+    fcntl = None
+
+_held = {}
+_lock = threading.Lock()
+
+
+class StoreLockedError(RuntimeError):
+    """
+    Файлы на диске уже открыты на запись другим процессом.
+    """
+
+
+def acquire_writer(path):
+    """
+    Делает текущий процесс единственным писателем данных, защищенных файлом блокировки.
+    Блокировка держится до завершения процесса; повторный вызов в том же процессе
+    ничего не делает. Индексы, журналы и кэши в памяти процесса не видят
+    изменений другого процесса, поэтому второй писатель не допускается.
+
+    :param path: Путь к файлу блокировки (например, <каталог>/.lock или <файл>.lock).
+    :raises StoreLockedError: Если данные открыты другим процессом.
+    """
+    path = os.path.realpath(path)
+    with _lock:
+        if fcntl is None or path in _held:
+            return
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        f = open(path, "a+")
+        try:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            f.seek(0)
+            owner = f.read().strip()
+            f.close()
+            raise StoreLockedError(
+                f"{path} занят другим процессом (pid {owner or '?'}). "
+                f"Остановите приложение или используйте HTTP API, встроенный в него (CONFIG.API_IN_APP)."
+            )
+        f.truncate(0)
+        f.write(str(os.getpid()))
+        f.flush()
+        _held[path] = f
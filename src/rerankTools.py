@@ -0,0 +1,111 @@
+import time
+import threading
+from src.cacheTools import LRUCache
+from src.ingestTools import content_hash
+from src.traceTools import span, cache_result
+
+
+class CrossEncoderReranker:
+    """
+    Переранжирование кандидатов поиска локальным кросс-энкодером на CPU.
+    Пары (вопрос, чанк) оцениваются батчами одним проходом модели, оценки
+    кэшируются по паре (вопрос, id чанка). Модель загружается при первом вызове.
+    """
+    def __init__(self, model_name, device="cpu", batch_size=32, max_length=512, cache_size=10000, local_files_only=False,
+                 retry_after=300):
+        """
+        Инициализация переранжировщика.
+
+        :param model_name: Имя кросс-энкодера на HuggingFace или локальный путь.
+        :param device: Устройство ('cpu' или 'cuda').
+        :param batch_size: Пар (вопрос, чанк) в одном проходе модели.
+        :param max_length: Максимальная длина пары в токенах.
+        :param cache_size: Оценок в кэше.
+        :param local_files_only: Брать модель только из локального кэша, без сети.
+        :param retry_after: Через сколько секунд после ошибки загрузки пробовать загрузить модель снова.
+        """
+        self.model_name = model_name
+        self.device = device
+        self.batch_size = batch_size
+        self.max_length = max_length
+        self.local_files_only = local_files_only
+        self.retry_after = retry_after
+        self.model = None
+        self.error = None
+        self.failed_at = None
+        self.scores = LRUCache(cache_size)
+        self._lock = threading.Lock()
+
+    def _load(self):
+        """
+        Загружает модель. Ошибка загрузки запоминается на retry_after секунд,
+        чтобы не повторять загрузку на каждом запросе.
+
+        :return: Экземпляр CrossEncoder.
+        """
+        if self.model is None:
+            with self._lock:
+                if self.error is not None and time.monotonic() - self.failed_at < self.retry_after:
+                    raise RuntimeError(self.error)
+                if self.model is None:
+                    try:
+                        from sentence_transformers import CrossEncoder
+                        self.model = CrossEncoder(
+                            self.model_name,
+                            device=self.device,
+                            max_length=self.max_length,
+                            local_files_only=self.local_files_only,
+                        )
+                        self.error = None
+                    except Exception as e:
+                        self.error = f"Кросс-энкодер {self.model_name} не загружен: {e}"
+                        self.failed_at = time.monotonic()
+                        raise
+        return self.model
+
+    def score(self, question, docs):
+        """
+        Оценивает релевантность чанков вопросу.
+
+        :param question: Вопрос пользователя.
+        :param docs: Список объектов Document.
+        :return: Список оценок от 0 до 1 в порядке docs.
+        """
+        keys = [(question, doc.id or content_hash(doc.page_content)) for doc in docs]
+        scores = [self.scores.get(key) for key in keys]
+        for value in scores:
+            cache_result("rerank", value is not None)
+
+        missing = [i for i, value in enumerate(scores) if value is None]
+        if missing:
+            model = self._load()
+            # Пары отсортированы по длине, чтобы в батче было меньше паддинга
+            missing.sort(key=lambda i: len(docs[i].page_content))
+            predicted = model.predict(
+                [(question, docs[i].page_content) for i in missing],
+                batch_size=self.batch_size,
+                show_progress_bar=False,
+            )
+            for i, value in zip(missing, predicted):
+                scores[i] = float(value)
+                self.scores.set(keys[i], scores[i])
+        return scores
+
+    def rerank(self, question, docs, k=10, threshold=0.0):
+        """
+        Возвращает лучшие чанки по оценке кросс-энкодера.
+
+        :param question: Вопрос пользователя.
+        :param docs: Кандидаты поиска (объекты Document).
+        :param k: Сколько чанков вернуть.
+        :param threshold: Минимальная оценка чанка.
+        :return: Список объектов Document по убыванию оценки.
+        """
+        if not docs:
+            return []
+        with span("rerank", candidates=len(docs)) as stage:
+            scores = self.score(question, docs)
+            ranked = sorted(zip(scores, range(len(docs))), key=lambda item: -item[0])
+            result = [docs[i] for value, i in ranked[:k] if value >= threshold]
+            stage.set(kept=len(result))
+        return result
@@ -0,0 +1,1235 @@
+import os
+import re
+import json
+import base64
+import random
+import shutil
+import tempfile
+import threading
+from functools import lru_cache
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Any
+import faiss
+import numpy as np
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from src.lexicalTools import BM25Index, reciprocal_rank_fusion
+from src.batchTools import MicroBatcher
+from src.docstoreTools import ColumnarDocstore, write_segment, INT_COLUMNS
+from src.traceTools import span
+from src.lockTools import acquire_writer
+
+
+def partition_path(root, table_id):
+    """
+    Возвращает путь к каталогу раздела (суб-индекса) чата.
+
+    :param root: Корневой каталог хранилища.
+    :param table_id: Идентификатор таблицы/чата (Chat.database_id).
+    :return: Путь к каталогу раздела.
+    """
+    safe_name = re.sub(r"[^\w\-.]", "_", str(table_id))
+    return os.path.join(root, safe_name)
+
+
+def build_index(dim, factory, sample=None, nprobe=8):
+    """
+    Создает пустой индекс FAISS по строке фабрики (Flat, HNSW32, IVF1024,Flat,
+    IVF1024,PQ64, IVF1024,SQ8, PQ64 и т.д.). Индексы, требующие обучения, обучаются
+    на выборке векторов; все, кроме IVF, оборачиваются в IDMap2, чтобы у векторов
+    были стабильные номера строк.
+
+    :param dim: Размерность векторов.
+    :param factory: Строка фабрики FAISS.
+    :param sample: Выборка векторов для обучения (нужна, если index.is_trained ложно).
+    :param nprobe: Число просматриваемых кластеров IVF при поиске.
+    :return: Индекс FAISS.
+    """
+    index = faiss.index_factory(dim, factory)
+    if not is_ivf(index):
+        index = faiss.index_factory(dim, f"IDMap2,{factory}")
+    if not index.is_trained:
+        if sample is None or len(sample) < train_minimum(dim, factory):
+            raise ValueError(f"Для обучения индекса {factory} нужно не меньше {train_minimum(dim, factory)} векторов")
+        index.train(np.asarray(sample, dtype=np.float32))
+    if is_ivf(index):
+        ivf = faiss.extract_index_ivf(index)
+        ivf.set_direct_map_type(faiss.DirectMap.Hashtable)
+        ivf.nprobe = nprobe
+    return index
+
+
+@lru_cache(maxsize=None)
+def train_minimum(dim, factory):
+    """
+    Возвращает, сколько векторов нужно для обучения индекса: число кластеров IVF,
+    256 центроидов кодовых книг PQ/SQ или 0, если обучение не нужно.
+
+    :param dim: Размерность векторов.
+    :param factory: Строка фабрики FAISS.
+    :return: Минимальный размер обучающей выборки.
+    """
+    index = faiss.index_factory(dim, factory)
+    if index.is_trained:
+        return 0
+    ivf = faiss.try_extract_index_ivf(index)
+    return ivf.nlist if ivf is not None else 256
+
+
+def is_ivf(index):
+    return faiss.try_extract_index_ivf(index) is not None
+
+
+def is_flat(index):
+    """
+    Проверяет, что индекс плоский (возможно, в обертке IDMap).
+    """
+    index = faiss.downcast_index(index)
+    if isinstance(index, (faiss.IndexIDMap, faiss.IndexIDMap2)):
+        index = faiss.downcast_index(index.index)
+    return isinstance(index, faiss.IndexFlat)
+
+
+def reconstruct_rows(index, rows):
+    """
+    Восстанавливает векторы по номерам строк (для PQ/SQ8 — приближенно).
+
+    :param index: Индекс FAISS с поддержкой add_with_ids.
+    :param rows: Номера строк.
+    :return: Матрица float32.
+    """
+    return index.reconstruct_batch(np.asarray(rows, dtype=np.int64))
+
+
+class MetaIndex:
+    """
+    Вторичный индекс метаданных раздела: doc_id → чанки документа и его статистика.
+    Позволяет получать список файлов чата и удалять документ без обхода docstore.
+    Один чанк может принадлежать нескольким документам (одинаковый текст хранится один раз)
+    и повторяться внутри документа, поэтому положение каждого вхождения чанка хранится
+    здесь списком в порядке документа: [id чанка, смещение, число символов, текст между
+    предыдущим чанком и этим].
+    """
+    def __init__(self, docs=None):
+        """
+        Инициализация индекса.
+
+        :param docs: Словарь {doc_id: {"metadata": ..., "chunks": [[id чанка, start, length, gap], ...]}}.
+                     Старые форматы {id чанка: число символов} и {id чанка: [start, length, gap]} тоже принимаются.
+        """
+        self.docs = {}
+        self.chunk_refs = {}
+        for doc_id, entry in (docs or {}).items():
+            self.add_document(doc_id, entry["metadata"], entry["chunks"])
+
+    @staticmethod
+    def _occurrences(chunks):
+        if not isinstance(chunks, dict):
+            return [list(item) for item in chunks]
+        # Старые записи: одно вхождение на чанк, иногда только число символов
+        return [[chunk_id, *value] if isinstance(value, (list, tuple)) else [chunk_id, None, value, None]
+                for chunk_id, value in chunks.items()]
+
+    def add_document(self, doc_id, metadata, chunks):
+        """
+        Регистрирует документ и его чанки.
+
+        :param doc_id: Идентификатор документа.
+        :param metadata: Метаданные документа (поля отдельного чанка отбрасываются).
+        :param chunks: Список вхождений [id чанка, start, length, gap] в порядке документа
+                       (или старый словарь {id чанка: ...}).
+        """
+        entry = self.docs.get(doc_id)
+        if entry is None:
+            metadata = {key: value for key, value in metadata.items() if key not in INT_COLUMNS}
+            entry = self.docs[doc_id] = {"metadata": metadata, "chunks": []}
+        known = {(chunk_id, start) for chunk_id, start, _, _ in entry["chunks"]}
+        for occurrence in self._occurrences(chunks):
+            if (occurrence[0], occurrence[1]) in known:
+                continue
+            entry["chunks"].append(occurrence)
+            self.chunk_refs.setdefault(occurrence[0], set()).add(doc_id)
+
+    def add(self, ids, texts, metadatas):
+        """
+        Регистрирует добавленные чанки по полю doc_id их метаданных.
+
+        :param ids: Список идентификаторов чанков.
+        :param texts: Список текстов чанков.
+        :param metadatas: Список метаданных чанков.
+        """
+        for chunk_id, text, metadata in zip(ids, texts, metadatas):
+            doc_id = metadata.get("doc_id") if metadata else None
+            if doc_id:
+                self.add_document(doc_id, metadata, [[chunk_id, metadata.get("start_index"), len(text), None]])
+
+    def remove(self, ids):
+        """
+        Удаляет чанки из индекса. Документ без чанков удаляется целиком.
+
+        :param ids: Список идентификаторов чанков.
+        """
+        for chunk_id in ids:
+            for doc_id in self.chunk_refs.pop(chunk_id, ()):
+                entry = self.docs[doc_id]
+                entry["chunks"] = [occurrence for occurrence in entry["chunks"] if occurrence[0] != chunk_id]
+                if not entry["chunks"]:
+                    del self.docs[doc_id]
+
+    def remove_document(self, doc_id):
+        """
+        Удаляет документ из индекса.
+
+        :param doc_id: Идентификатор документа.
+        :return: Кортеж (чанки, на которые больше никто не ссылается, {чанк: другой документ-владелец}).
+        """
+        entry = self.docs.pop(doc_id, None)
+        orphans, survivors = [], {}
+        for chunk_id in dict.fromkeys(occurrence[0] for occurrence in (entry["chunks"] if entry else ())):
+            refs = self.chunk_refs.get(chunk_id, set())
+            refs.discard(doc_id)
+            if refs:
+                survivors[chunk_id] = next(iter(refs))
+            else:
+                self.chunk_refs.pop(chunk_id, None)
+                orphans.append(chunk_id)
+        return orphans, survivors
+
+    def has_document(self, doc_id):
+        return doc_id in self.docs
+
+    def chunk_ids(self, doc_id):
+        """
+        Возвращает идентификаторы чанков документа (без повторов).
+
+        :param doc_id: Идентификатор документа.
+        :return: Список идентификаторов чанков.
+        """
+        entry = self.docs.get(doc_id)
+        return list(dict.fromkeys(occurrence[0] for occurrence in entry["chunks"])) if entry else []
+
+    def layout(self, doc_id):
+        """
+        Возвращает вхождения чанков в документ в порядке следования.
+        Чанки старых записей без смещений идут в порядке добавления.
+
+        :param doc_id: Идентификатор документа.
+        :return: Список кортежей (id чанка, start, length, gap).
+        """
+        entry = self.docs.get(doc_id)
+        items = [tuple(occurrence) for occurrence in entry["chunks"]] if entry else []
+        if all(start is not None for _, start, _, _ in items):
+            items.sort(key=lambda item: item[1])
+        return items
+
+    def stats(self):
+        """
+        Возвращает метаданные документов раздела вместе со статистикой.
+
+        :return: Список словарей метаданных с полями chunks_count и chars_count.
+        """
+        return [
+            {**entry["metadata"], "chunks_count": len(entry["chunks"]), "chars_count": sum(length for _, _, length, _ in entry["chunks"])}
+            for entry in self.docs.values()
+        ]
+
+    def dumps(self):
+        return json.dumps(self.docs, ensure_ascii=False)
+
+    @staticmethod
+    def from_docstore(docstore):
+        """
+        Строит индекс обходом docstore (для снимков без meta.json).
+
+        :param docstore: Docstore раздела (ColumnarDocstore).
+        :return: Объект MetaIndex.
+        """
+        meta = MetaIndex()
+        ids = docstore.ids()
+        items = [docstore.raw(chunk_id) for chunk_id in ids]
+        meta.add(ids, [text for text, _ in items], [metadata for _, metadata in items])
+        return meta
+
+
+class Partition:
+    """
+    Суб-индекс FAISS одного чата. Пустой раздел не содержит индекса (db = None),
+    индекс создается при первом добавлении документов.
+
+    На диске раздел хранится как снимок (snapshot/) и журнал операций (wal.log).
+    Каждая мутация дописывается в журнал, снимок периодически пересобирается
+    в фоне, после чего журнал обрезается. Тексты и метаданные чанков снимка
+    лежат в колоночном docstore (snapshot/docstore) и читаются через mmap.
+    """
+    def __init__(self, table_id, path, embedding, compact_bytes=64 * 1024 * 1024, index_options=None):
+        """
+        Инициализация раздела.
+
+        :param table_id: Идентификатор таблицы/чата.
+        :param path: Каталог раздела на диске.
+        :param embedding: Экземпляр модели эмбеддингов.
+        :param compact_bytes: Размер журнала, после которого запускается компакция.
+        :param index_options: Параметры индекса: factory, min_vectors, train_size, nprobe.
+        """
+        self.table_id = table_id
+        self.path = path
+        self.embedding = embedding
+        self.compact_bytes = compact_bytes
+        self.index_options = {"factory": "Flat", "min_vectors": 10000, "train_size": 50000, "nprobe": 8, **(index_options or {})}
+        self.lock = threading.RLock()
+        self.db = None
+        self.row_of = {}
+        self.next_row = 0
+        # Строки, удаленные из docstore, но оставшиеся в индексе без remove_ids (HNSW)
+        self.deleted = set()
+        self.meta = MetaIndex()
+        self.lexical = BM25Index()
+        self.seq = 0
+        self.compacting = False
+        # Компакции раздела выполняются строго по одной: синхронные вызовы ждут фоновую
+        self.compact_lock = threading.Lock()
+        self.legacy_snapshot = False
+        # Сколько потоков сейчас работает с разделом (меняется под блокировкой хранилища)
+        self.users = 0
+
+    @property
+    def wal_path(self):
+        return os.path.join(self.path, "wal.log")
+
+    @property
+    def snapshot_path(self):
+        return os.path.join(self.path, "snapshot")
+
+    def load(self):
+        """
+        Загружает последний снимок раздела и проигрывает поверх него журнал.
+        """
+        # Обрыв компакции между переименованиями оставляет только snapshot.old,
+        # раздел в старом формате хранит индекс прямо в своем каталоге
+        candidates = [self.snapshot_path, self.snapshot_path + ".old", self.path]
+        snapshot = next((path for path in candidates if os.path.exists(os.path.join(path, "index.faiss"))), None)
+        # Недописанные снимки прерванных компакций
+        if os.path.isdir(self.path):
+            for name in os.listdir(self.path):
+                if name.startswith("snapshot.tmp"):
+                    shutil.rmtree(os.path.join(self.path, name), ignore_errors=True)
+        if snapshot is not None:
+            docstore_path = os.path.join(snapshot, "docstore")
+            if os.path.isdir(docstore_path):
+                docstore = ColumnarDocstore.open(docstore_path)
+                index = faiss.read_index(os.path.join(snapshot, "index.faiss"))
+                self.db = FAISS(self.embedding, index, docstore, docstore.row_ids())
+            else:
+                # Снимок старого формата: docstore в pickle, при компакции переводится в колоночный
+                self.db = FAISS.load_local(snapshot, self.embedding, allow_dangerous_deserialization=True)
+                self.db.docstore = ColumnarDocstore(documents=self.db.docstore._dict)
+                self.legacy_snapshot = True
+            self._adopt_index()
+            meta_file = os.path.join(snapshot, "meta.json")
+            if os.path.exists(meta_file):
+                with open(meta_file, "r", encoding="utf-8") as f:
+                    self.meta = MetaIndex(json.load(f))
+            else:
+                self.meta = MetaIndex.from_docstore(self.db.docstore)
+            lexical_file = os.path.join(snapshot, "lexical.json")
+            if os.path.exists(lexical_file):
+                with open(lexical_file, "r", encoding="utf-8") as f:
+                    self.lexical = BM25Index.loads(f.read())
+            else:
+                chunk_ids = list(self.db.index_to_docstore_id.values())
+                self.lexical.add(chunk_ids, [self.db.docstore.search(chunk_id).page_content for chunk_id in chunk_ids])
+            seq_file = os.path.join(snapshot, "seq")
+            if os.path.exists(seq_file):
+                with open(seq_file, "r") as f:
+                    self.seq = int(f.read().strip() or 0)
+
+        records, size = self._read_wal()
+        for record in records:
+            if record["seq"] > self.seq:
+                self._apply(record)
+                self.seq = record["seq"]
+        # Обрывок недописанной записи обрезается, иначе следующая запись склеилась бы с ним
+        if os.path.exists(self.wal_path) and os.path.getsize(self.wal_path) > size:
+            with open(self.wal_path, "r+b") as f:
+                f.truncate(size)
+                f.flush()
+                os.fsync(f.fileno())
+
+    def _adopt_index(self):
+        """
+        Приводит загруженный индекс к виду со стабильными номерами строк:
+        плоский индекс старого формата (строка = позиция) переносится в IDMap2.
+        """
+        index = self.db.index
+        if not is_ivf(index) and not isinstance(faiss.downcast_index(index), (faiss.IndexIDMap, faiss.IndexIDMap2)):
+            rows = sorted(self.db.index_to_docstore_id)
+            wrapped = faiss.index_factory(index.d, "IDMap2,Flat")
+            if rows:
+                wrapped.add_with_ids(index.reconstruct_n(0, index.ntotal)[rows], np.asarray(rows, dtype=np.int64))
+            self.db.index = wrapped
+        elif is_ivf(index):
+            faiss.extract_index_ivf(index).nprobe = self.index_options["nprobe"]
+        else:
+            stored = faiss.vector_to_array(faiss.downcast_index(index).id_map)
+            self.deleted = set(stored.tolist()) - set(self.db.index_to_docstore_id)
+
+        self.row_of = {chunk_id: row for row, chunk_id in self.db.index_to_docstore_id.items()}
+        self.next_row = max([*self.db.index_to_docstore_id, *self.deleted], default=-1) + 1
+
+    def _read_wal(self):
+        """
+        Читает записи журнала. Недописанная последняя строка (обрыв при записи) отбрасывается.
+
+        :return: Кортеж (список записей журнала, размер целых записей в байтах).
+        """
+        if not os.path.exists(self.wal_path):
+            return [], 0
+        records, size = [], 0
+        with open(self.wal_path, "rb") as f:
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    break
+                size += len(line)
+        return records, size
+
+    def _copy_wal(self, target, offset):
+        """
+        Дописывает в target журнал начиная с байта offset.
+
+        :param target: Файл, открытый на запись в двоичном режиме.
+        :param offset: Смещение в журнале.
+        :return: Смещение конца скопированной части.
+        """
+        if not os.path.exists(self.wal_path):
+            return offset
+        with open(self.wal_path, "rb") as f:
+            f.seek(offset)
+            shutil.copyfileobj(f, target)
+            return f.tell()
+
+    def _append_wal(self, record):
+        """
+        Дописывает запись в журнал и сбрасывает её на диск.
+
+        :param record: Запись журнала (словарь).
+        """
+        os.makedirs(self.path, exist_ok=True)
+        self.seq += 1
+        record["seq"] = self.seq
+        with open(self.wal_path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _apply(self, record):
+        """
+        Применяет запись журнала к индексу в памяти.
+
+        :param record: Запись журнала (словарь).
+        """
+        if record["op"] == "add":
+            vectors = np.frombuffer(base64.b64decode(record["embeddings"]), dtype=np.float32)
+            vectors = vectors.reshape(len(record["ids"]), -1).tolist() if record["ids"] else []
+            self._add(record["texts"], vectors, record["metadatas"], record["ids"], record.get("docs"), record.get("replace"))
+        elif record["op"] == "delete":
+            self._delete(record["ids"])
+        elif record["op"] == "delete_doc":
+            self._delete_document(record["doc_id"])
+
+    def has_chunk(self, chunk_id):
+        return chunk_id in self.row_of
+
+    def _add_rows(self, texts, vectors, metadatas, ids):
+        """
+        Добавляет векторы в индекс под новыми номерами строк и чанки в docstore.
+        """
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if self.db is None:
+            factory = self.index_options["factory"]
+            # Индексы с обучением (IVF, PQ) нельзя построить без выборки, поэтому маленький раздел начинается с плоского
+            index = build_index(vectors.shape[1], "Flat" if train_minimum(vectors.shape[1], factory) else factory)
+            self.db = FAISS(self.embedding, index, ColumnarDocstore(), {})
+
+        rows = list(range(self.next_row, self.next_row + len(ids)))
+        self.db.index.add_with_ids(vectors, np.asarray(rows, dtype=np.int64))
+        self.db.docstore.add({
+            chunk_id: Document(id=chunk_id, page_content=text, metadata=metadata)
+            for chunk_id, text, metadata in zip(ids, texts, metadatas)
+        })
+        self.db.index_to_docstore_id.update(zip(rows, ids))
+        self.row_of.update(zip(ids, rows))
+        self.next_row += len(ids)
+
+    def _remove_chunks(self, ids):
+        """
+        Удаляет чанки из индекса и docstore. Индексы без remove_ids (HNSW)
+        не пересобираются под блокировкой: строки помечаются удаленными,
+        поиск их пропускает, а из индекса их убирает компакция (см. rebuild).
+        """
+        rows = [self.row_of.pop(chunk_id) for chunk_id in ids]
+        try:
+            self.db.index.remove_ids(np.asarray(rows, dtype=np.int64))
+        except RuntimeError:
+            self.deleted.update(rows)
+        for row in rows:
+            del self.db.index_to_docstore_id[row]
+        self.db.docstore.delete(ids)
+        self.lexical.remove(ids)
+
+    def _add(self, texts, embeddings, metadatas, ids, docs=None, replace=None):
+        keep = set()
+        if replace is not None:
+            # Чанки старой версии документа, которые есть и в новой, остаются в индексе
+            keep = {occurrence[0] for entry in docs.values() for occurrence in MetaIndex._occurrences(entry["chunks"])}
+            self._delete_document(replace, keep)
+        new = [i for i, chunk_id in enumerate(ids) if not self.has_chunk(chunk_id)]
+        if new:
+            self._add_rows(
+                [texts[i] for i in new],
+                [embeddings[i] for i in new],
+                [metadatas[i] for i in new],
+                [ids[i] for i in new],
+            )
+            self.lexical.add([ids[i] for i in new], [texts[i] for i in new])
+
+        if docs is None:
+            self.meta.add(ids, texts, metadatas)
+        else:
+            for doc_id, entry in docs.items():
+                self.meta.add_document(doc_id, entry["metadata"], entry["chunks"])
+        # Оставшиеся чанки документа получают смещения из его новой версии
+        for doc_id in (docs or {}):
+            for chunk_id in keep & set(self.meta.chunk_ids(doc_id)):
+                document = self.db.docstore.search(chunk_id) if self.has_chunk(chunk_id) else None
+                if isinstance(document, Document) and document.metadata.get("doc_id") == replace:
+                    self.db.docstore.add({chunk_id: Document(id=chunk_id, page_content=document.page_content,
+                                                             metadata=self.chunk_metadata(doc_id, chunk_id))})
+
+    def _delete(self, ids):
+        present = [chunk_id for chunk_id in ids if self.has_chunk(chunk_id)]
+        if present:
+            self._remove_chunks(present)
+        self.meta.remove(ids)
+
+    def _delete_document(self, doc_id, keep=()):
+        orphans, survivors = self.meta.remove_document(doc_id)
+        present = [chunk_id for chunk_id in orphans if self.has_chunk(chunk_id) and chunk_id not in keep]
+        if present:
+            self._remove_chunks(present)
+        # Общие чанки остаются у другого документа и получают его метаданные и свое положение в нем
+        for chunk_id, owner_id in survivors.items():
+            document = self.db.docstore.search(chunk_id)
+            if isinstance(document, Document) and document.metadata.get("doc_id") == doc_id:
+                self.db.docstore.add({chunk_id: Document(id=chunk_id, page_content=document.page_content,
+                                                         metadata=self.chunk_metadata(owner_id, chunk_id))})
+
+    def chunk_metadata(self, doc_id, chunk_id):
+        """
+        Возвращает метаданные чанка в составе документа: общие поля документа
+        и положение первого вхождения чанка в нем по вторичному индексу.
+
+        :param doc_id: Идентификатор документа.
+        :param chunk_id: Идентификатор чанка.
+        :return: Словарь метаданных.
+        """
+        for ordinal, (other_id, start, length, _) in enumerate(self.meta.layout(doc_id)):
+            if other_id == chunk_id:
+                return self._occurrence_metadata(doc_id, ordinal, start, length)
+        return dict(self.meta.docs[doc_id]["metadata"])
+
+    def _occurrence_metadata(self, doc_id, ordinal, start, length):
+        metadata = dict(self.meta.docs[doc_id]["metadata"])
+        metadata.update({
+            "start_index": start,
+            "end_index": start + length if start is not None else None,
+            "ordinal": ordinal if start is not None else None,
+        })
+        return metadata
+
+    def add_embeddings(self, texts, embeddings, metadatas, ids, docs=None, replace=None):
+        """
+        Добавляет в раздел тексты с уже посчитанными эмбеддингами и журналирует операцию.
+        Чанки, которые уже есть в разделе, повторно не добавляются.
+
+        :param texts: Список текстов чанков.
+        :param embeddings: Список векторов.
+        :param metadatas: Список метаданных.
+        :param ids: Список идентификаторов чанков.
+        :param docs: Состав документов {doc_id: {"metadata": ..., "chunks": [[id чанка, start, length, gap], ...]}}.
+                     Если не задан, строится по полю doc_id метаданных.
+        :param replace: Документ, который заменяется новой версией из docs в той же записи журнала.
+        """
+        if not texts and not docs:
+            return
+        self._add(texts, embeddings, metadatas, ids, docs, replace)
+        record = {
+            "op": "add",
+            "ids": list(ids),
+            "texts": list(texts),
+            "metadatas": list(metadatas),
+            "embeddings": base64.b64encode(np.asarray(embeddings, dtype=np.float32).tobytes()).decode("ascii"),
+        }
+        if docs is not None:
+            record["docs"] = docs
+        if replace is not None:
+            record["replace"] = replace
+        self._append_wal(record)
+        self.maybe_compact()
+
+    def delete_document(self, doc_id):
+        """
+        Удаляет документ из раздела и журналирует операцию. Чанки, общие
+        с другими документами, остаются в индексе.
+
+        :param doc_id: Идентификатор документа.
+        """
+        if not self.meta.has_document(doc_id):
+            return
+        self._delete_document(doc_id)
+        self._append_wal({"op": "delete_doc", "doc_id": doc_id})
+        self.maybe_compact()
+
+    def delete(self, ids):
+        """
+        Удаляет чанки из раздела и журналирует операцию.
+
+        :param ids: Список идентификаторов чанков.
+        """
+        if self.db is None or not ids:
+            return
+        self._delete(ids)
+        self._append_wal({"op": "delete", "ids": list(ids)})
+        self.maybe_compact()
+
+    def search_by_vectors(self, vectors, k):
+        """
+        Ищет ближайшие чанки сразу для нескольких векторов одним вызовом index.search.
+
+        :param vectors: Список векторов запросов.
+        :param k: Количество результатов на запрос.
+        :return: Список списков объектов Document (по одному на вектор).
+        """
+        if self.db is None:
+            return [[] for _ in vectors]
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if self.db._normalize_L2:
+            faiss.normalize_L2(vectors)
+        # Помеченные удаленными строки могут занять часть выдачи, поэтому берем с запасом
+        _, rows = self.db.index.search(vectors, k + len(self.deleted))
+        mapping = self.db.index_to_docstore_id
+        return [
+            [self.db.docstore.search(mapping[row]) for row in query_rows if row in mapping][:k]
+            for query_rows in rows
+        ]
+
+    def fits_factory(self, factory):
+        """
+        Проверяет, что векторов раздела хватает для индекса с обучением:
+        не меньше min_vectors и размера обучающей выборки (числа кластеров IVF).
+
+        :param factory: Строка фабрики FAISS.
+        :return: True, если индекс можно построить (или обучение не нужно).
+        """
+        minimum = train_minimum(self.db.index.d, factory)
+        return not minimum or len(self.row_of) >= max(minimum, self.index_options["min_vectors"])
+
+    def wants_upgrade(self):
+        """
+        Проверяет, что раздел дорос до настроенного индекса с обучением (IVF, PQ),
+        но еще хранится в плоском.
+        """
+        factory = self.index_options["factory"]
+        return (
+            self.db is not None
+            and train_minimum(self.db.index.d, factory) > 0
+            and is_flat(self.db.index)
+            and self.fits_factory(factory)
+        )
+
+    def wants_purge(self):
+        """
+        Проверяет, что помеченных удаленными строк набралось на десятую часть индекса.
+        """
+        return self.db is not None and len(self.deleted) * 10 >= max(self.db.index.ntotal, 1)
+
+    def rebuild(self, factory=None):
+        """
+        Пересобирает индекс раздела, сохраняя номера строк и отбрасывая строки,
+        помеченные удаленными. Под блокировкой векторы только копируются;
+        обучение и добавление в новый индекс (долгое для HNSW) идут без неё,
+        поиск в это время работает со старым индексом. Изменения раздела за
+        время сборки переносятся в новый индекс перед подменой.
+
+        :param factory: Строка фабрики FAISS (None — индекс того же вида).
+        """
+        with self.lock:
+            if self.db is None:
+                return
+            dim = self.db.index.d
+            rows = list(self.db.index_to_docstore_id)
+            vectors = reconstruct_rows(self.db.index, rows) if rows else None
+            # Пустая копия текущего индекса с теми же параметрами (M, efConstruction, кластеры)
+            index = faiss.clone_index(self.db.index) if factory is None else None
+
+        if index is not None:
+            index.reset()
+        else:
+            sample = None
+            if train_minimum(dim, factory):
+                sample = vectors[random.sample(range(len(rows)), min(len(rows), self.index_options["train_size"]))]
+            index = build_index(dim, factory, sample, self.index_options["nprobe"])
+        if rows:
+            index.add_with_ids(vectors, np.asarray(rows, dtype=np.int64))
+
+        with self.lock:
+            copied = set(rows)
+            added = [row for row in self.db.index_to_docstore_id if row not in copied]
+            if added:
+                index.add_with_ids(reconstruct_rows(self.db.index, added), np.asarray(added, dtype=np.int64))
+            removed = [row for row in rows if row not in self.db.index_to_docstore_id]
+            deleted = set()
+            if removed:
+                try:
+                    index.remove_ids(np.asarray(removed, dtype=np.int64))
+                except RuntimeError:
+                    deleted = set(removed)
+            self.db.index = index
+            self.deleted = deleted
+
+    def maybe_compact(self):
+        """
+        Запускает фоновую компакцию, если журнал превысил порог, раздел
+        пора перевести на индекс IVF или из индекса пора убрать удаленные строки.
+        """
+        if self.compacting:
+            return
+        wal_size = os.path.getsize(self.wal_path) if os.path.exists(self.wal_path) else 0
+        if wal_size >= self.compact_bytes or self.wants_upgrade() or self.wants_purge():
+            self.start_compaction()
+
+    def start_compaction(self):
+        """
+        Запускает компакцию в фоновом потоке, если она еще не запущена.
+
+        :return: True, если компакция запущена этим вызовом.
+        """
+        with self.lock:
+            if self.compacting:
+                return False
+            self.compacting = True
+        threading.Thread(target=self.compact, daemon=True).start()
+        return True
+
+    def compact(self):
+        """
+        Сохраняет снимок раздела и обрезает журнал. Индекс сериализуется в память
+        под блокировкой, запись на диск (в том числе колоночного docstore) идет без неё.
+        Если компакция уже идет, вызов ждет ее окончания и делает свою.
+        """
+        with self.compact_lock:
+            self._compact()
+
+    def _compact(self):
+        self.compacting = True
+        try:
+            if self.wants_upgrade():
+                self.rebuild(self.index_options["factory"])
+            elif self.deleted:
+                self.rebuild()
+
+            with self.lock:
+                if self.db is None:
+                    return
+                index_bytes = faiss.serialize_index(self.db.index)
+                rows = dict(self.db.index_to_docstore_id)
+                docstore = self.db.docstore.freeze()
+                meta_bytes = self.meta.dumps().encode("utf-8")
+                lexical_bytes = self.lexical.dumps().encode("utf-8")
+                snapshot_seq = self.seq
+                # Записи после снимка начинаются с этого байта журнала
+                wal_offset = os.path.getsize(self.wal_path) if os.path.exists(self.wal_path) else 0
+
+            old_path = self.snapshot_path + ".old"
+            os.makedirs(self.path, exist_ok=True)
+            tmp_path = tempfile.mkdtemp(prefix="snapshot.tmp-", dir=self.path)
+            write_segment(os.path.join(tmp_path, "docstore"), rows, docstore.raw)
+            for name, data in (("index.faiss", index_bytes.tobytes()), ("meta.json", meta_bytes), ("lexical.json", lexical_bytes), ("seq", str(snapshot_seq).encode())):
+                with open(os.path.join(tmp_path, name), "wb") as f:
+                    f.write(data)
+                    f.flush()
+                    os.fsync(f.fileno())
+
+            shutil.rmtree(old_path, ignore_errors=True)
+            if os.path.exists(self.snapshot_path):
+                os.replace(self.snapshot_path, old_path)
+            os.replace(tmp_path, self.snapshot_path)
+            shutil.rmtree(old_path, ignore_errors=True)
+            for name in ("index.faiss", "index.pkl"):
+                legacy_file = os.path.join(self.path, name)
+                if os.path.exists(legacy_file):
+                    os.remove(legacy_file)
+
+            # Хвост журнала копируется по смещению: основная часть без блокировки,
+            # под блокировкой только записи, добавленные за время копирования
+            wal_tmp = self.wal_path + ".tmp"
+            with open(wal_tmp, "wb") as f:
+                copied = self._copy_wal(f, wal_offset)
+                with self.lock:
+                    self.db.docstore.adopt(os.path.join(self.snapshot_path, "docstore"), docstore)
+                    self.legacy_snapshot = False
+                    self._copy_wal(f, copied)
+                    f.flush()
+                    os.fsync(f.fileno())
+                    os.replace(wal_tmp, self.wal_path)
+        finally:
+            self.compacting = False
+
+
+class PartitionedStore:
+    """
+    Векторное хранилище, разбитое на суб-индексы FAISS по Chat.database_id.
+    Разделы загружаются лениво, редко используемые вытесняются по LRU.
+    """
+    def __init__(self, embedding, root, max_partitions=16, compact_bytes=64 * 1024 * 1024, index_options=None,
+                 search_batch=0, search_wait=0.005, search_workers=4):
+        """
+        Инициализация хранилища.
+
+        :param embedding: Экземпляр модели эмбеддингов.
+        :param root: Корневой каталог хранилища.
+        :param max_partitions: Максимальное число разделов, одновременно держащихся в памяти.
+        :param compact_bytes: Размер журнала раздела, после которого запускается компакция.
+        :param index_options: Параметры индекса разделов (см. Partition).
+        :param search_batch: Максимальный батч одновременных поисков (0 — без батчинга).
+        :param search_wait: Сколько секунд ждать остальные поиски батча после первого.
+        :param search_workers: Сколько разделов может искаться параллельно.
+        """
+        self.embedding = embedding
+        self.root = root
+        self.max_partitions = max_partitions
+        self.compact_bytes = compact_bytes
+        self.index_options = index_options
+        self._partitions = OrderedDict()
+        # Разделы, которые сейчас читаются с диска: путь → Future с загруженным разделом
+        self._loading = {}
+        self._lock = threading.Lock()
+        # Батч поисков делится по разделам: занятый записью раздел не задерживает поиск по остальным
+        self.search_batcher = MicroBatcher(self.search_batch, search_batch, search_wait, search_workers,
+                                           key=lambda request: request[0]) if search_batch else None
+        self._search_pool = ThreadPoolExecutor(max_workers=search_workers)
+        os.makedirs(root, exist_ok=True)
+        # Журналы и индексы разделов живут в памяти процесса, второй процесс затер бы их изменения
+        acquire_writer(os.path.join(root, ".lock"))
+
+    def _pin(self, table_id):
+        """
+        Возвращает раздел чата, при необходимости загружая его с диска,
+        и закрепляет его в памяти до вызова _unpin. Загрузка идет вне блокировки
+        хранилища: работа с другими разделами не ждет чтения снимка, а потоки,
+        которым нужен тот же раздел, ждут его Future.
+
+        :param table_id: Идентификатор таблицы/чата.
+        :return: Объект Partition.
+        """
+        path = partition_path(self.root, table_id)
+        while True:
+            with self._lock:
+                part = self._partitions.get(path)
+                if part is not None:
+                    self._partitions.move_to_end(path)
+                    part.users += 1
+                    return part
+                loading = self._loading.get(path)
+                if loading is None:
+                    loading = self._loading[path] = Future()
+                    break
+            # Раздел загружает другой поток; после загрузки он уже в кэше (или вытеснен — тогда загрузим сами)
+            loading.result()
+
+        try:
+            part = Partition(str(table_id), path, self.embedding, self.compact_bytes, self.index_options)
+            part.load()
+        except BaseException as e:
+            with self._lock:
+                del self._loading[path]
+            loading.set_exception(e)
+            raise
+        with self._lock:
+            del self._loading[path]
+            part.users += 1
+            self._partitions[path] = part
+            self._evict()
+        loading.set_result(part)
+        if part.legacy_snapshot:
+            part.start_compaction()
+        return part
+
+    def _unpin(self, part):
+        with self._lock:
+            part.users -= 1
+            self._evict()
+
+    @contextmanager
+    def pinned(self, table_id):
+        """
+        Закрепляет раздел чата в памяти на время блока: пока раздел используется,
+        он не вытесняется, и другой поток не загрузит второй экземпляр того же раздела.
+
+        :param table_id: Идентификатор таблицы/чата.
+        :return: Контекстный менеджер, отдающий Partition.
+        """
+        part = self._pin(table_id)
+        try:
+            yield part
+        finally:
+            self._unpin(part)
+
+    @contextmanager
+    def locked(self, table_id):
+        """
+        Закрепляет раздел чата и берет его блокировку на время блока.
+
+        :param table_id: Идентификатор таблицы/чата.
+        :return: Контекстный менеджер, отдающий Partition.
+        """
+        with self.pinned(table_id) as part, part.lock:
+            yield part
+
+    def _evict(self):
+        """
+        Вытесняет из памяти наименее используемые разделы. Закрепленные
+        и компактируемые разделы пропускаются.
+        """
+        for path in list(self._partitions.keys()):
+            if len(self._partitions) <= self.max_partitions:
+                break
+            part = self._partitions[path]
+            if part.users or part.compacting or part.compact_lock.locked():
+                continue
+            if part.lock.acquire(blocking=False):
+                try:
+                    del self._partitions[path]
+                finally:
+                    part.lock.release()
+
+    def add_documents(self, table_id, documents, ids):
+        """
+        Эмбеддит и добавляет документы в раздел чата.
+
+        :param table_id: Идентификатор таблицы/чата.
+        :param documents: Список объектов Document.
+        :param ids: Список идентификаторов чанков.
+        """
+        embeddings = self.embedding.embed_documents([doc.page_content for doc in documents])
+        self.add_embeddings(table_id, documents, embeddings, ids)
+
+    def add_embeddings(self, table_id, documents, embeddings, ids, docs=None):
+        """
+        Добавляет документы с уже посчитанными эмбеддингами в раздел чата
+        одной записью журнала.
+
+        :param table_id: Идентификатор таблицы/чата.
+        :param documents: Список объектов Document.
+        :param embeddings: Список векторов.
+        :param ids: Список идентификаторов чанков.
+        :param docs: Необязательный состав документов (см. Partition.add_embeddings).
+        """
+        with self.locked(table_id) as part:
+            part.add_embeddings([doc.page_content for doc in documents], embeddings, [doc.metadata for doc in documents], ids, docs)
+
+    def has_document(self, table_id, doc_id):
+        """
+        Проверяет, загружен ли документ в раздел чата.
+
+        :param table_id: Идентификатор таблицы/чата.
+        :param doc_id: Идентификатор документа.
+        :return: True, если документ уже есть.
+        """
+        with self.locked(table_id) as part:
+            return part.meta.has_document(doc_id)
+
+    def missing_chunks(self, table_id, ids):
+        """
+        Возвращает идентификаторы чанков, которых еще нет в разделе чата.
+
+        :param table_id: Идентификатор таблицы/чата.
+        :param ids: Список идентификаторов чанков.
+        :return: Множество отсутствующих идентификаторов.
+        """
+        with self.locked(table_id) as part:
+            return {chunk_id for chunk_id in ids if not part.has_chunk(chunk_id)}
+
+    def list_documents(self, table_id):
+        """
+        Возвращает метаданные и статистику документов чата по вторичному индексу.
+
+        :param table_id: Идентификатор таблицы/чата.
+        :return: Список словарей метаданных документов.
+        """
+        with self.locked(table_id) as part:
+            return part.meta.stats()
+
+    def delete_document(self, table_id, doc_id):
+        """
+        Удаляет все чанки документа из раздела чата.
+
+        :param table_id: Идентификатор таблицы/чата.
+        :param doc_id: Идентификатор документа.
+        """
+        with self.locked(table_id) as part:
+            part.delete_document(doc_id)
+
+    def document_chunks(self, table_id, doc_id):
+        """
+        Возвращает чанки документа в порядке их следования в документе, повторяющийся
+        в документе чанк — столько раз, сколько он встречается. Метаданные
+        чанков (doc_id, start_index, end_index, ordinal) берутся из вторичного индекса
+        для этого документа, даже если чанк хранится с метаданными другого документа;
+        в поле gap — текст между предыдущим чанком и этим (None, если неизвестен).
+
+        :param table_id: Идентификатор таблицы/чата.
+        :param doc_id: Идентификатор документа.
+        :return: Список объектов Document.
+        """
+        with self.locked(table_id) as part:
+            if part.db is None:
+                return []
+            chunks = []
+            for ordinal, (chunk_id, start, length, gap) in enumerate(part.meta.layout(doc_id)):
+                if part.has_chunk(chunk_id):
+                    text, _ = part.db.docstore.raw(chunk_id)
+                    metadata = {**part._occurrence_metadata(doc_id, ordinal, start, length), "gap": gap}
+                    chunks.append(Document(id=chunk_id, page_content=text, metadata=metadata))
+            return chunks
+
+    def replace_document(self, table_id, doc_id, documents, embeddings, ids, layout=None):
+        """
+        Заменяет чанки документа новыми (например, после перенарезки) под одной блокировкой раздела.
+
+        :param table_id: Идентификатор таблицы/чата.
+        :param doc_id: Идентификатор документа.
+        :param documents: Новые чанки документа (объекты Document).
+        :param embeddings: Векторы новых чанков. None — для чанков, которые уже есть в разделе;
+                           если такой чанк успели удалить, он эмбеддится здесь.
+        :param ids: Идентификаторы новых чанков.
+        :param layout: Вхождения чанков в документ [[id чанка, start, length, gap], ...].
+                       Если не заданы, берутся из start_index метаданных чанков.
+        """
+        if layout is None:
+            layout = [[chunk_id, doc.metadata.get("start_index"), len(doc.page_content), None]
+                      for chunk_id, doc in zip(ids, documents)]
+        with self.locked(table_id) as part:
+            docs = {doc_id: {
+                "metadata": dict(part.meta.docs[doc_id]["metadata"]) if part.meta.has_document(doc_id) else dict(documents[0].metadata),
+                "chunks": layout,
+            }}
+            first = {}
+            for i, chunk_id in enumerate(ids):
+                first.setdefault(chunk_id, i)
+            fresh = [i for chunk_id, i in first.items() if not part.has_chunk(chunk_id)]
+            lost = [i for i in fresh if embeddings[i] is None]
+            if lost:
+                vectors = self.embedding.embed_documents([documents[i].page_content for i in lost])
+                embeddings = list(embeddings)
+                for i, vector in zip(lost, vectors):
+                    embeddings[i] = vector
+            part.add_embeddings(
+                [documents[i].page_content for i in fresh],
+                [embeddings[i] for i in fresh],
+                [documents[i].metadata for i in fresh],
+                [ids[i] for i in fresh],
+                docs,
+                replace=doc_id,
+            )
+
+    def delete(self, table_id, ids):
+        """
+        Удаляет чанки из раздела чата.
+
+        :param table_id: Идентификатор таблицы/чата.
+        :param ids: Список идентификаторов чанков.
+        """
+        with self.locked(table_id) as part:
+            part.delete(ids)
+
+    def version(self, table_id):
+        """
+        Возвращает версию документов чата: номер последней операции в журнале раздела.
+        Меняется при каждой загрузке и удалении документов.
+
+        :param table_id: Идентификатор таблицы/чата.
+        :return: Целое число.
+        """
+        with self.locked(table_id) as part:
+            return part.seq
+
+    def compact(self, table_id):
+        """
+        Синхронно сохраняет снимок раздела чата и обрезает его журнал.
+
+        :param table_id: Идентификатор таблицы/чата.
+        """
+        with self.pinned(table_id) as part:
+            part.compact()
+
+    def recover(self):
+        """
+        Проигрывает непустые журналы разделов поверх их снимков и запускает
+        фоновую компакцию, чтобы журналы не копились между перезапусками.
+        """
+        for name in os.listdir(self.root):
+            wal_path = os.path.join(self.root, name, "wal.log")
+            if os.path.exists(wal_path) and os.path.getsize(wal_path) > 0:
+                with self.pinned(name) as part:
+                    part.start_compaction()
+
+    def similarity_search(self, table_id, query, k=10):
+        """
+        Ищет ближайшие чанки только внутри раздела чата.
+
+        :param table_id: Идентификатор таблицы/чата.
+        :param query: Текст запроса.
+        :param k: Количество результатов.
+        :return: Список объектов Document.
+        """
+        # Эмбеддинг считается вне блокировки раздела
+        with span("embed_query"):
+            vector = self.embedding.embed_query(query)
+        with span("faiss_search", k=k) as stage:
+            if self.search_batcher is not None:
+                docs = self.search_batcher.submit((table_id, vector, k))
+            else:
+                docs = self.search_batch([(table_id, vector, k)])[0]
+            stage.set(hits=len(docs))
+        return docs
+
+    def search_batch(self, requests):
+        """
+        Выполняет несколько поисков по векторам: запросы к одному разделу
+        объединяются в один вызов index.search. Разделы, занятые записью или
+        компакцией, откладываются, и поиск по ним идет параллельно после
+        свободных, чтобы один занятый раздел не задерживал остальные.
+
+        :param requests: Список кортежей (table_id, вектор, k).
+        :return: Список списков объектов Document в порядке запросов.
+        """
+        results = [None] * len(requests)
+        groups = {}
+        for i, (table_id, _, _) in enumerate(requests):
+            groups.setdefault(table_id, []).append(i)
+
+        def search(part, positions):
+            k = max(requests[i][2] for i in positions)
+            found = part.search_by_vectors([requests[i][1] for i in positions], k)
+            for i, docs in zip(positions, found):
+                results[i] = docs[:requests[i][2]]
+
+        def search_locked(table_id, positions):
+            with self.locked(table_id) as part:
+                search(part, positions)
+
+        busy = []
+        for table_id, positions in groups.items():
+            with self.pinned(table_id) as part:
+                if not part.lock.acquire(blocking=False):
+                    busy.append((table_id, positions))
+                    continue
+                try:
+                    search(part, positions)
+                finally:
+                    part.lock.release()
+        if len(busy) == 1:
+            search_locked(*busy[0])
+        elif busy:
+            for future in [self._search_pool.submit(search_locked, *group) for group in busy]:
+                future.result()
+        return results
+
+    def hybrid_search(self, table_id, query, k=10, fetch_k=50):
+        """
+        Гибридный поиск внутри раздела чата: результаты FAISS и BM25
+        объединяются методом Reciprocal Rank Fusion.
+
+        :param table_id: Идентификатор таблицы/чата.
+        :param query: Текст запроса.
+        :param k: Количество результатов.
+        :param fetch_k: Сколько кандидатов брать из каждого поиска.
+        :return: Список объектов Document.
+        """
+        dense = [doc.id for doc in self.similarity_search(table_id, query, k=fetch_k)]
+        with self.locked(table_id) as part:
+            if part.db is None:
+                return []
+            dense = [chunk_id for chunk_id in dense if part.has_chunk(chunk_id)]
+            with span("bm25_search", k=fetch_k):
+                lexical = [chunk_id for chunk_id, _ in part.lexical.search(query, k=fetch_k)]
+            return [part.db.docstore.search(chunk_id) for chunk_id in reciprocal_rank_fusion([dense, lexical])[:k]]
+
+    def as_retriever(self, table_id, k=10):
+        """
+        Возвращает LangChain-ретривер по разделу чата.
+
+        :param table_id: Идентификатор таблицы/чата.
+        :param k: Количество результатов.
+        :return: PartitionRetriever или None, если раздел пуст.
+        """
+        with self.locked(table_id) as part:
+            if part.db is None:
+                return None
+        return PartitionRetriever(store=self, table_id=str(table_id), k=k)
+
+
+class PartitionRetriever(BaseRetriever):
+    """
+    LangChain-ретривер по разделу чата. Ищет через PartitionedStore.search_batch,
+    то есть под блокировкой раздела, а не напрямую по его индексу FAISS.
+    """
+    store: Any
+    table_id: str
+    k: int = 10
+
+    def _get_relevant_documents(self, query, *, run_manager=None):
+        # MultiQueryRetriever ищет перефразировки по очереди, ждать соседей по батчу поиска незачем
+        vector = self.store.embedding.embed_query(query)
+        return self.store.search_batch([(self.table_id, vector, self.k)])[0]
+
+
+def migrate_legacy_index(store, faiss_idx):
+    """
+    Переносит чанки из старого общего индекса FAISS в разделы по чатам,
+    не пересчитывая эмбеддинги. Файлы старого индекса переименовываются.
+
+    :param store: Экземпляр PartitionedStore.
+    :param faiss_idx: Путь к каталогу старого индекса.
+    """
+    legacy = FAISS.load_local(faiss_idx, store.embedding, allow_dangerous_deserialization=True)
+    vectors = legacy.index.reconstruct_n(0, legacy.index.ntotal) if legacy.index.ntotal else []
+
+    grouped = {}
+    for row, chunk_id in legacy.index_to_docstore_id.items():
+        document = legacy.docstore.search(chunk_id)
+        table_id = document.metadata.get("table") if document.metadata else None
+        if table_id is None:
+            continue
+        grouped.setdefault(table_id, []).append((chunk_id, document, vectors[row].tolist()))
+
+    for table_id, items in grouped.items():
+        with store.pinned(table_id) as part:
+            with part.lock:
+                part.add_embeddings(
+                    [doc.page_content for _, doc, _ in items],
+                    [vector for _, _, vector in items],
+                    [doc.metadata for _, doc, _ in items],
+                    [chunk_id for chunk_id, _, _ in items],
+                )
+            part.compact()
+
+    for name in ("index.faiss", "index.pkl"):
+        os.replace(os.path.join(faiss_idx, name), os.path.join(faiss_idx, f"{name}.legacy"))
@@ -0,0 +1,361 @@
+import sys
+import json
+import time
+import uuid
+import logging
+import threading
+import contextvars
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from CONFIG import CONFIG
+
+# Границы корзин гистограмм длительности, секунды
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+logger = logging.getLogger("rag.trace")
+_current = contextvars.ContextVar("rag_trace", default=None)
+_recent = deque(maxlen=CONFIG.TRACE_KEEP)
+_enabled = False
+
+
+class Metrics:
+    """
+    Счетчики и гистограммы процесса в памяти. Отдаются в текстовом формате Prometheus.
+    """
+    def __init__(self, buckets=BUCKETS):
+        """
+        Инициализация реестра метрик.
+
+        :param buckets: Границы корзин гистограмм.
+        """
+        self.buckets = buckets
+        self._counters = {}
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    def inc(self, name, value=1, **labels):
+        """
+        Увеличивает счетчик.
+
+        :param name: Имя метрики.
+        :param value: Приращение.
+        :param labels: Метки.
+        """
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        """
+        Добавляет наблюдение в гистограмму.
+
+        :param name: Имя метрики.
+        :param value: Значение (для длительностей — секунды).
+        :param labels: Метки.
+        """
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = {"buckets": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    histogram["buckets"][i] += 1
+            histogram["sum"] += value
+            histogram["count"] += 1
+
+    @staticmethod
+    def _labels(labels, extra=()):
+        pairs = list(labels) + list(extra)
+        if not pairs:
+            return ""
+        escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in pairs)
+        return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+    def render(self):
+        """
+        Возвращает все метрики в текстовом формате Prometheus.
+
+        :return: Строка для ответа на /metrics.
+        """
+        with self._lock:
+            counters = dict(self._counters)
+            histograms = {key: {"buckets": list(value["buckets"]), "sum": value["sum"], "count": value["count"]}
+                          for key, value in self._histograms.items()}
+
+        lines = []
+        for name in sorted({name for name, _ in counters}):
+            lines.append(f"# TYPE {name} counter")
+            for (metric, labels), value in sorted(counters.items()):
+                if metric == name:
+                    lines.append(f"{name}{self._labels(labels)} {value}")
+        for name in sorted({name for name, _ in histograms}):
+            lines.append(f"# TYPE {name} histogram")
+            for (metric, labels), value in sorted(histograms.items()):
+                if metric != name:
+                    continue
+                for bound, count in zip(self.buckets, value["buckets"]):
+                    lines.append(f"{name}_bucket{self._labels(labels, [('le', bound)])} {count}")
+                lines.append(f"{name}_bucket{self._labels(labels, [('le', '+Inf')])} {value['count']}")
+                lines.append(f"{name}_sum{self._labels(labels)} {value['sum']}")
+                lines.append(f"{name}_count{self._labels(labels)} {value['count']}")
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
+
+
+class Trace:
+    """
+    Трасса одного запроса: этапы с длительностями и атрибутами, счетчики кэшей.
+    По завершении пишется в структурированный лог и в метрики.
+    """
+    def __init__(self, kind, attrs):
+        """
+        Инициализация трассы.
+
+        :param kind: Тип запроса (rag, ingest, chat_turn, ...).
+        :param attrs: Атрибуты запроса (например, chat_id).
+        """
+        self.id = uuid.uuid4().hex[:12]
+        self.kind = kind
+        self.attrs = dict(attrs)
+        self.spans = []
+        self.counters = {}
+        self.started_at = time.time()
+        self.start = None
+        self.duration = None
+        self.depth = 0
+        self._previous = None
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def count(self, name, value=1):
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def __enter__(self):
+        self._previous = _current.get()
+        _current.set(self)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.duration = time.perf_counter() - self.start
+        # Не reset(token): генератор может закрываться в другом контексте
+        _current.set(self._previous)
+        if exc_type is not None and exc_type is not GeneratorExit:
+            self.attrs["error"] = exc_type.__name__
+        metrics.inc("rag_requests_total", kind=self.kind, status="error" if "error" in self.attrs else "ok")
+        metrics.observe("rag_request_seconds", self.duration, kind=self.kind)
+        _recent.append(self)
+        if logger.handlers:
+            logger.info(json.dumps(self.to_dict(), ensure_ascii=False, default=str))
+        return False
+
+    def to_dict(self):
+        return {
+            "trace_id": self.id,
+            "kind": self.kind,
+            "ts": self.started_at,
+            "duration_ms": round(self.duration * 1000, 2) if self.duration is not None else None,
+            "attrs": self.attrs,
+            "counters": self.counters,
+            "spans": self.spans,
+        }
+
+
+class Span:
+    """
+    Этап запроса. Длительность пишется в гистограмму rag_stage_seconds и,
+    если этап выполняется внутри трассы, в саму трассу.
+    """
+    def __init__(self, trace, name, attrs):
+        self.trace = trace
+        self.name = name
+        self.record = {"name": name, "depth": 0, "offset_ms": None, "ms": None, **attrs}
+        self.start = None
+
+    def set(self, **attrs):
+        self.record.update(attrs)
+
+    def count(self, name, value=1):
+        if self.trace is not None:
+            self.trace.count(name, value)
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        if self.trace is not None:
+            self.record["depth"] = self.trace.depth
+            self.record["offset_ms"] = round((self.start - self.trace.start) * 1000, 2)
+            self.trace.depth += 1
+            self.trace.spans.append(self.record)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        duration = time.perf_counter() - self.start
+        self.record["ms"] = round(duration * 1000, 2)
+        if exc_type is not None and exc_type is not GeneratorExit:
+            self.record["error"] = exc_type.__name__
+        if self.trace is not None:
+            self.trace.depth -= 1
+        metrics.observe("rag_stage_seconds", duration, stage=self.name)
+        return False
+
+
+class _Noop:
+    """
+    Заглушка для выключенной трассировки: ничего не измеряет и не выделяет.
+    """
+    id = None
+    kind = None
+    duration = None
+    attrs = {}
+    counters = {}
+    spans = ()
+
+    def set(self, **attrs):
+        pass
+
+    def count(self, name, value=1):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+NOOP = _Noop()
+
+
+def configure(enabled=None, log=None):
+    """
+    Включает или выключает трассировку и настраивает структурированный лог.
+
+    :param enabled: Включить трассировку (по умолчанию CONFIG.TRACE_ENABLED).
+    :param log: Куда писать JSON-строки трасс: 'stdout', путь к файлу или '' — не писать
+                (по умолчанию CONFIG.TRACE_LOG).
+    """
+    global _enabled
+    _enabled = CONFIG.TRACE_ENABLED if enabled is None else enabled
+    log = CONFIG.TRACE_LOG if log is None else log
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+        handler.close()
+    if _enabled and log:
+        handler = logging.StreamHandler(sys.stdout) if log == "stdout" else logging.FileHandler(log, encoding="utf-8")
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+
+
+def enabled():
+    return _enabled
+
+
+def trace(kind, **attrs):
+    """
+    Начинает трассу запроса. Внутри уже начатой трассы становится ее этапом,
+    поэтому вложенные вызовы (чат -> RAG) попадают в одну трассу.
+
+    :param kind: Тип запроса.
+    :param attrs: Атрибуты запроса.
+    :return: Контекстный менеджер Trace, Span или заглушка, если трассировка выключена.
+    """
+    if not _enabled:
+        return NOOP
+    current = _current.get()
+    if current is not None:
+        return Span(current, kind, attrs)
+    return Trace(kind, attrs)
+
+
+def span(name, **attrs):
+    """
+    Измеряет этап запроса.
+
+    :param name: Имя этапа (метка stage в rag_stage_seconds).
+    :param attrs: Атрибуты этапа (например, число чанков).
+    :return: Контекстный менеджер Span или заглушка, если трассировка выключена.
+    """
+    if not _enabled:
+        return NOOP
+    return Span(_current.get(), name, attrs)
+
+
+def cache_result(cache, hit, value=1):
+    """
+    Учитывает попадания или промахи кэша.
+
+    :param cache: Имя кэша (answer, embedding, passage, rerank, validator).
+    :param hit: True при попадании.
+    :param value: Число попаданий (промахов).
+    """
+    if not _enabled or not value:
+        return
+    metrics.inc("rag_cache_total", value, cache=cache, result="hit" if hit else "miss")
+    current = _current.get()
+    if current is not None:
+        current.count(f"{cache}_cache_{'hits' if hit else 'misses'}", value)
+
+
+def count(name, value=1):
+    """
+    Увеличивает счетчик rag_<name>_total и счетчик текущей трассы.
+
+    :param name: Имя счетчика (например, context_tokens).
+    :param value: Приращение.
+    """
+    if not _enabled:
+        return
+    metrics.inc(f"rag_{name}_total", value)
+    current = _current.get()
+    if current is not None:
+        current.count(name, value)
+
+
+def recent(limit=None):
+    """
+    Возвращает последние завершенные трассы процесса, новые первыми.
+
+    :param limit: Сколько трасс вернуть.
+    :return: Список объектов Trace.
+    """
+    traces = list(reversed(_recent))
+    return traces[:limit] if limit else traces
+
+
+def start_metrics_server(host, port):
+    """
+    Запускает в фоне HTTP-сервер, отдающий метрики на /metrics.
+
+    :param host: Адрес.
+    :param port: Порт.
+    :return: Экземпляр ThreadingHTTPServer.
+    """
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = metrics.render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", CONTENT_TYPE)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+configure()
@@ -0,0 +1,77 @@
+import time
+import threading
+
+# Момент импорта модуля — приблизительное время старта процесса
+PROCESS_START = time.perf_counter()
+
+
+class Warmup:
+    """
+    Фоновая загрузка тяжелых ресурсов (модели, хранилища, LLM-клиента).
+    Шаги выполняются по порядку в отдельном потоке, интерфейс в это время
+    уже доступен и может показывать состояние готовности.
+    """
+    def __init__(self, steps):
+        """
+        Инициализация и запуск фоновой загрузки.
+
+        :param steps: Список пар (имя, функция fn(results)), где results — словарь
+                      уже загруженных ресурсов по именам шагов.
+        """
+        self.steps = [name for name, _ in steps]
+        self.results = {}
+        self.timings = {}
+        self.current = None
+        self.error = None
+        self.ui_ready = None
+        self._done = threading.Event()
+        threading.Thread(target=self._run, args=(steps,), daemon=True).start()
+
+    def _run(self, steps):
+        try:
+            for name, fn in steps:
+                self.current = name
+                start = time.perf_counter()
+                self.results[name] = fn(self.results)
+                self.timings[name] = time.perf_counter() - start
+            self.current = None
+            self.timings["total"] = time.perf_counter() - PROCESS_START
+            print(f"Ресурсы загружены: {self.describe()}", flush=True)
+        except Exception as e:
+            self.error = f"{self.current}: {e}"
+        finally:
+            self._done.set()
+
+    @property
+    def ready(self):
+        return self._done.is_set() and self.error is None
+
+    def wait(self, timeout=None):
+        """
+        Ждет окончания загрузки.
+
+        :param timeout: Максимальное время ожидания в секундах.
+        :return: True, если все ресурсы загружены.
+        """
+        self._done.wait(timeout)
+        return self.ready
+
+    def get(self, name):
+        """
+        Возвращает загруженный ресурс.
+
+        :param name: Имя шага.
+        :return: Результат шага или None, если он еще не загружен.
+        """
+        return self.results.get(name)
+
+    def mark_ui(self):
+        """
+        Запоминает, через сколько секунд после старта процесса интерфейс впервые отрисовался.
+        """
+        if self.ui_ready is None:
+            self.ui_ready = time.perf_counter() - PROCESS_START
+            print(f"Интерфейс доступен через {self.ui_ready:.2f} с после старта", flush=True)
+
+    def describe(self):
+        return ", ".join(f"{name} {seconds:.2f} с" for name, seconds in self.timings.items())
@@ -0,0 +1,68 @@
+import json
+import pytest
+from src.chatTools import ChatManager, ChatStore, LEGACY_CHUNKING
+
+CHATS = [
+    {"id": "a", "name": "Договоры", "description": "", "system_prompt": "Ты юрист", "database_id": "db-a",
+     "messages": [{"role": "user", "content": "Привет"}, {"role": "assistant", "content": "Здравствуйте"}]},
+    {"name": "Без id", "description": "старый формат", "system_prompt": "", "database_id": "db-b", "messages": []},
+]
+
+
+@pytest.fixture
+def legacy(tmp_path):
+    path = tmp_path / "chats.json"
+    path.write_text(json.dumps(CHATS, ensure_ascii=False))
+    return path
+
+
+def test_interrupted_import_is_retried(tmp_path, legacy, monkeypatch):
+    store = ChatStore(str(tmp_path / "chats.db"))
+    calls = []
+    original = ChatStore._write_chat
+
+    def crash_on_second(self, chat, with_messages):
+        calls.append(chat.id)
+        if len(calls) == 2:
+            raise OSError("диск отключен")
+        original(self, chat, with_messages)
+
+    monkeypatch.setattr(ChatStore, "_write_chat", crash_on_second)
+    with pytest.raises(OSError):
+        store.import_json(str(legacy))
+    # Транзакция откатилась целиком, chats.json на месте
+    assert store.load_chats() == [] and legacy.exists()
+    monkeypatch.undo()
+
+    store.import_json(str(legacy))
+    store.import_json(str(legacy) + ".missing")
+    assert [chat.name for chat in store.load_chats()] == ["Договоры", "Без id"]
+    assert not legacy.exists()
+
+
+def test_import_without_rename_is_idempotent(tmp_path, legacy, monkeypatch):
+    # Падение после коммита, но до переименования файла
+    monkeypatch.setattr("os.replace", lambda *args: None)
+    ChatStore(str(tmp_path / "chats.db")).import_json(str(legacy))
+    monkeypatch.undo()
+
+    manager = ChatManager(str(tmp_path / "chats.db"), str(legacy))
+    assert len(manager.chats) == 2 and not legacy.exists()
+    assert manager.get_chat_by_id("a").messages == CHATS[0]["messages"]
+
+
+def test_migration_round_trip(tmp_path, legacy):
+    manager = ChatManager(str(tmp_path / "chats.db"), str(legacy))
+    assert not legacy.exists() and (tmp_path / "chats.json.migrated").exists()
+    manager.add_message_to_chat("a", {"role": "user", "content": "Еще вопрос"})
+
+    reopened = ChatManager(str(tmp_path / "chats.db"), str(legacy))
+    migrated = [chat.to_dict() for chat in reopened.chats]
+    assert [chat["name"] for chat in migrated] == [chat["name"] for chat in CHATS]
+    for chat, source in zip(migrated, CHATS):
+        for field in ("name", "description", "system_prompt", "database_id"):
+            assert chat[field] == source[field]
+        assert chat["chunking"] == LEGACY_CHUNKING
+    assert migrated[0]["id"] == "a"
+    assert migrated[0]["messages"] == CHATS[0]["messages"] + [{"role": "user", "content": "Еще вопрос"}]
+    assert migrated[1]["messages"] == []
@@ -0,0 +1,72 @@
+import pytest
+from bench.fakes import FakeEmbeddings
+from src.ingestTools import UploadedDoc
+from src.storeTools import PartitionedStore
+from src.contextTools import join_chunks
+from src.aiTools import ingest_docs, rechunk_docs, split_text, chunk_offsets
+
+DISCLAIMER = "Информация носит справочный характер и не является офертой."
+CONTENT = "\n\n".join(
+    f"Раздел {i}. Условия обслуживания клиентов, пункт {i}, действуют с начала года.\n{DISCLAIMER}"
+    for i in range(42)
+)
+SMALL = {"size": 120, "overlap": 30, "strategy": "recursive"}
+
+
+class CountingEmbeddings(FakeEmbeddings):
+    def __init__(self):
+        super().__init__(dim=32)
+        self.embedded = []
+
+    def embed_documents(self, texts):
+        self.embedded.extend(texts)
+        return super().embed_documents(texts)
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = PartitionedStore(CountingEmbeddings(), str(tmp_path / "db"))
+    data = CONTENT.encode("utf-8")
+    ingest_docs([UploadedDoc("terms.txt", len(data), "text/plain", data)], "chat", store, chunking=SMALL)
+    return store
+
+
+def document_text(store):
+    doc_id = store.list_documents("chat")[0]["doc_id"]
+    return join_chunks(store.document_chunks("chat", doc_id), doc_id)
+
+
+def test_offsets_of_repeated_chunks():
+    chunks = split_text(CONTENT, "chat", "terms.txt", 0, "", "doc", SMALL)
+    assert sum(chunk.page_content == DISCLAIMER for chunk in chunks) > 1
+    for chunk in chunks:
+        start = chunk.metadata["start_index"]
+        assert CONTENT[start:start + len(chunk.page_content)] == chunk.page_content
+    starts = [chunk.metadata["start_index"] for chunk in chunks]
+    assert starts == sorted(starts) and len(set(starts)) == len(starts)
+
+
+def test_offsets_respect_overlap():
+    assert chunk_offsets("ab ab ab", ["ab", "ab", "ab"], overlap=0) == [0, 3, 6]
+
+
+def test_repeated_text_round_trip(store):
+    assert document_text(store) == CONTENT
+    for chunking in ({"size": 300, "overlap": 0, "strategy": "sentence"}, {"size": 80, "overlap": 20, "strategy": "recursive"}):
+        rechunk_docs(store, "chat", chunking)
+        text = document_text(store)
+        assert text == CONTENT
+        assert text.count(DISCLAIMER) == 42
+
+    # Замена документа проигрывается из журнала раздела
+    reloaded = PartitionedStore(FakeEmbeddings(dim=32), store.root)
+    assert document_text(reloaded) == CONTENT
+
+
+def test_rechunk_embeds_only_new_chunks(store):
+    embedding = store.embedding
+    rechunk_docs(store, "chat", SMALL)
+    embedding.embedded.clear()
+    rechunk_docs(store, "chat", SMALL)
+    assert embedding.embedded == []
+    assert document_text(store) == CONTENT
@@ -0,0 +1,33 @@
+import numpy as np
+from bench.fakes import FakeEmbeddings
+from src.embeddingTools import CachedEmbeddings
+
+
+def open_cache(path):
+    return CachedEmbeddings(FakeEmbeddings(dim=8), "model", str(path), max_items=4)
+
+
+def test_vector_without_key_record_is_dropped(tmp_path):
+    cache = open_cache(tmp_path)
+    cache.embed_documents(["а", "б", "в", "г"])
+    # Процесс перезаписал слот новым вектором и упал до записи ключа
+    slot = cache._slots[cache._key("passage", "а")]
+    cache._vectors[slot] = np.ones(8, dtype=np.float32)
+    cache._vectors.flush()
+
+    reloaded = open_cache(tmp_path)
+    assert cache._key("passage", "а") not in reloaded._slots
+    assert reloaded.stats()["items"] == 3
+    assert reloaded.embed_documents(["а"]) == FakeEmbeddings(dim=8).embed_documents(["а"])
+
+
+def test_torn_key_record_is_ignored(tmp_path):
+    cache = open_cache(tmp_path)
+    cache.embed_documents(["а", "б"])
+    with open(cache._keys_path, "a") as f:
+        f.write("0123abc 2")
+
+    reloaded = open_cache(tmp_path)
+    assert reloaded.stats()["items"] == 2
+    reloaded.embed_documents(["в"])
+    assert open_cache(tmp_path).stats()["items"] == 3
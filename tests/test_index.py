@@ -0,0 +1,59 @@
+import numpy as np
+import pytest
+from bench.fakes import FakeEmbeddings
+from src.storeTools import PartitionedStore, Partition, build_index, train_minimum, is_flat
+
+DIM = 16
+
+
+def add_chunks(part, count, start=0):
+    rng = np.random.default_rng(start)
+    ids = [f"c{i}" for i in range(start, start + count)]
+    part.add_embeddings(
+        [f"текст {i}" for i in range(start, start + count)],
+        rng.normal(size=(count, DIM)).astype(np.float32).tolist(),
+        [{"doc_id": f"d{i}"} for i in range(start, start + count)],
+        ids,
+    )
+    return ids
+
+
+def test_build_index_trains_any_factory():
+    sample = np.random.default_rng(0).normal(size=(300, DIM)).astype(np.float32)
+    for factory in ("SQ8", "IVF16,SQ8", "HNSW8,SQ8"):
+        assert build_index(DIM, factory, sample).is_trained
+    with pytest.raises(ValueError):
+        build_index(DIM, "IVF64,Flat", sample[:10])
+    assert train_minimum(DIM, "IVF64,Flat") == 64 and train_minimum(DIM, "HNSW32") == 0
+
+
+def test_hnsw_delete_marks_rows_until_compaction(tmp_path):
+    store = PartitionedStore(FakeEmbeddings(dim=DIM), str(tmp_path / "db"), index_options={"factory": "HNSW8"})
+    with store.locked("chat") as part:
+        ids = add_chunks(part, 50)
+        query = part.db.index.reconstruct(part.row_of[ids[0]])
+        part.delete(ids[:2])
+        assert part.db.index.ntotal == 50 and len(part.deleted) == 2
+        found = [doc.id for doc in part.search_by_vectors([query], 10)[0]]
+        assert len(found) == 10 and not set(found) & set(ids[:2])
+    part.compact()
+    assert part.db.index.ntotal == 48 and not part.deleted
+
+    with store.locked("chat") as part:
+        part.delete(ids[2:3])
+    reloaded = Partition("chat", part.path, FakeEmbeddings(dim=DIM), index_options={"factory": "HNSW8"})
+    reloaded.load()
+    assert reloaded.deleted == {2}
+    assert reloaded.next_row == 50
+
+
+def test_small_partition_stays_flat(tmp_path):
+    options = {"factory": "IVF64,Flat", "min_vectors": 10}
+    store = PartitionedStore(FakeEmbeddings(dim=DIM), str(tmp_path / "db"), index_options=options)
+    with store.locked("chat") as part:
+        add_chunks(part, 40)
+        assert not part.fits_factory("IVF64,Flat") and not part.wants_upgrade()
+        add_chunks(part, 40, start=40)
+        assert part.fits_factory("IVF64,Flat")
+    part.compact()
+    assert not is_flat(part.db.index) and part.db.index.ntotal == 80
@@ -0,0 +1,72 @@
+import os
+import pytest
+from bench.fakes import FakeEmbeddings
+from src.ingestTools import UploadedDoc
+from src.storeTools import PartitionedStore
+from src.aiTools import ingest_docs, content_hash
+
+SHARED = "Информация носит справочный характер и не является публичной офертой."
+SMALL = {"size": 80, "overlap": 0, "strategy": "recursive"}
+
+
+class CountingEmbeddings(FakeEmbeddings):
+    def __init__(self):
+        super().__init__(dim=16)
+        self.embedded = []
+
+    def embed_documents(self, texts):
+        self.embedded.extend(texts)
+        return super().embed_documents(texts)
+
+
+def upload(name, text):
+    data = text.encode("utf-8")
+    return UploadedDoc(name, len(data), "text/plain", data)
+
+
+def doc_id(store, name):
+    return next(doc["doc_id"] for doc in store.list_documents("chat") if doc["name_doc"] == name)
+
+
+@pytest.fixture
+def store(tmp_path):
+    return PartitionedStore(CountingEmbeddings(), str(tmp_path / "db"))
+
+
+def test_reingest_is_noop(store):
+    doc = upload("terms.txt", "Первый пункт договора.\n\nВторой пункт договора.\n\n" + SHARED)
+    ingest_docs([doc], "chat", store, chunking=SMALL)
+    with store.locked("chat") as part:
+        seq, wal_size = part.seq, os.path.getsize(part.wal_path)
+    documents = store.list_documents("chat")
+    store.embedding.embedded.clear()
+
+    ingest_docs([doc], "chat", store, chunking=SMALL)
+    assert store.embedding.embedded == []
+    assert store.list_documents("chat") == documents
+    with store.locked("chat") as part:
+        assert (part.seq, os.path.getsize(part.wal_path)) == (seq, wal_size)
+
+
+def test_delete_keeps_shared_chunk(store):
+    ingest_docs([
+        upload("a.txt", "Договор поставки оборудования для склада.\n\n" + SHARED),
+        upload("b.txt", "Договор аренды помещения под офис.\n\n" + SHARED),
+    ], "chat", store, chunking=SMALL)
+    shared_id = content_hash(SHARED)
+    a_id, b_id = doc_id(store, "a.txt"), doc_id(store, "b.txt")
+    assert [chunk.id for chunk in store.document_chunks("chat", a_id)][-1] == shared_id
+    # Общий чанк эмбеддится один раз
+    assert store.embedding.embedded.count(SHARED) == 1
+
+    store.delete_document("chat", a_id)
+    assert [doc["name_doc"] for doc in store.list_documents("chat")] == ["b.txt"]
+    assert store.missing_chunks("chat", [shared_id]) == set()
+    for reopened in (store, PartitionedStore(FakeEmbeddings(dim=16), store.root)):
+        chunks = reopened.document_chunks("chat", b_id)
+        assert [chunk.page_content for chunk in chunks][-1] == SHARED
+        found = reopened.similarity_search("chat", SHARED, k=1)[0]
+        assert found.id == shared_id and found.metadata["doc_id"] == b_id
+
+    store.delete_document("chat", b_id)
+    assert store.missing_chunks("chat", [shared_id]) == {shared_id}
@@ -0,0 +1,225 @@
+import os
+import sys
+import time
+import signal
+import threading
+import subprocess
+import numpy as np
+import pytest
+from bench.fakes import FakeEmbeddings
+from src.storeTools import PartitionedStore, Partition
+from src.docstoreTools import ColumnarDocstore
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DIM = 8
+
+# Дочерний процесс бесконечно пишет в раздел и компактирует его, пока его не убьют
+WRITER = """
+import sys
+import numpy as np
+from src.storeTools import Partition
+part = Partition("chat", sys.argv[1], None, compact_bytes=1 << 30)
+part.load()
+start = i = part.seq
+while True:
+    i += 1
+    vector = np.random.default_rng(i).normal(size=(1, 8)).astype(np.float32).tolist()
+    part.add_embeddings([f"текст {i}"], vector, [{"doc_id": f"d{i}"}], [f"c{i}"])
+    if i == start + 1:
+        print("ready", flush=True)
+    if i % 7 == 0:
+        part.delete_document(f"d{i - 3}")
+    if i % 25 == 0:
+        part.compact()
+"""
+
+
+def open_partition(path):
+    part = Partition("chat", str(path), FakeEmbeddings(dim=DIM))
+    part.load()
+    return part
+
+
+def add(part, start, count=1):
+    for i in range(start, start + count):
+        vector = np.random.default_rng(i).normal(size=(1, DIM)).astype(np.float32).tolist()
+        part.add_embeddings([f"текст {i}"], vector, [{"doc_id": f"d{i}"}], [f"c{i}"])
+
+
+def assert_consistent(part):
+    """Вторичный индекс, docstore и FAISS описывают один и тот же набор чанков."""
+    chunk_ids = {chunk_id for doc_id in part.meta.docs for chunk_id in part.meta.chunk_ids(doc_id)}
+    assert chunk_ids == set(part.row_of) == set(part.db.index_to_docstore_id.values())
+    assert part.db.index.ntotal == len(part.row_of) + len(part.deleted)
+    for chunk_id in chunk_ids:
+        assert part.db.docstore.search(chunk_id).page_content == f"текст {chunk_id[1:]}"
+
+
+def test_cold_load_does_not_block_other_partitions(tmp_path, monkeypatch):
+    store = PartitionedStore(FakeEmbeddings(dim=8), str(tmp_path / "db"))
+    started, release = threading.Event(), threading.Event()
+    loads = []
+    original = Partition.load
+
+    def slow_load(part):
+        loads.append(part.table_id)
+        if part.table_id == "slow":
+            started.set()
+            release.wait(5)
+        original(part)
+
+    monkeypatch.setattr(Partition, "load", slow_load)
+    pinned = []
+    threads = [threading.Thread(target=lambda: pinned.append(store._pin("slow"))) for _ in range(3)]
+    threads[0].start()
+    assert started.wait(5)
+    for thread in threads[1:]:
+        thread.start()
+
+    # Пока раздел "slow" читается с диска, другой раздел загружается без ожидания
+    with store.pinned("fast") as part:
+        assert part.table_id == "fast"
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert loads.count("slow") == 1
+    assert len({id(part) for part in pinned}) == 1 and pinned[0].users == 3
+
+
+def test_search_batch_does_not_wait_for_busy_partition(tmp_path):
+    store = PartitionedStore(FakeEmbeddings(dim=8), str(tmp_path / "db"), search_batch=8, search_wait=0.001)
+    for table_id in ("busy", "free"):
+        with store.locked(table_id) as part:
+            part.add_embeddings(["текст"], [[1.0] * 8], [{"doc_id": table_id}], [f"{table_id}-0"])
+
+    results = {}
+
+    def search(table_id):
+        results[table_id] = store.search_batcher.submit((table_id, [1.0] * 8, 1))
+
+    with store.locked("busy"):
+        waiting = threading.Thread(target=search, args=("busy",))
+        waiting.start()
+        # Поиск по занятому разделу ждет, а батчи с другими разделами проходят
+        for _ in range(3):
+            assert [doc.id for doc in store.search_batcher.submit(("free", [1.0] * 8, 1))] == ["free-0"]
+        assert "busy" not in results
+    waiting.join(5)
+    assert [doc.id for doc in results["busy"]] == ["busy-0"]
+
+
+def test_wal_replay(tmp_path):
+    part = open_partition(tmp_path)
+    add(part, 0, 10)
+    part.delete_document("d3")
+    part.compact()
+    add(part, 10, 5)
+    part.delete(["c12"])
+
+    reloaded = open_partition(tmp_path)
+    assert reloaded.seq == part.seq
+    assert set(reloaded.row_of) == set(part.row_of) == {f"c{i}" for i in range(15)} - {"c3", "c12"}
+    assert_consistent(reloaded)
+
+
+def test_torn_wal_tail_is_dropped(tmp_path):
+    part = open_partition(tmp_path)
+    add(part, 0, 3)
+    with open(part.wal_path, "ab") as f:
+        f.write(b'{"op": "add", "ids": ["c3"], "tex')
+
+    reloaded = open_partition(tmp_path)
+    assert set(reloaded.row_of) == {"c0", "c1", "c2"}
+    # Обрывок обрезан, поэтому следующая запись не склеивается с ним
+    add(reloaded, 3)
+    assert set(open_partition(tmp_path).row_of) == {"c0", "c1", "c2", "c3"}
+
+
+def test_compaction_keeps_records_appended_meanwhile(tmp_path, monkeypatch):
+    part = open_partition(tmp_path)
+    add(part, 0, 5)
+    original = Partition._copy_wal
+    calls = []
+
+    def copy_and_append(self, target, offset):
+        copied = original(self, target, offset)
+        calls.append(offset)
+        # Первое копирование идет без блокировки: в это время в раздел пишут
+        if len(calls) == 1:
+            add(self, 5, 2)
+        return copied
+
+    monkeypatch.setattr(Partition, "_copy_wal", copy_and_append)
+    part.compact()
+    monkeypatch.undo()
+
+    reloaded = open_partition(tmp_path)
+    assert set(reloaded.row_of) == {f"c{i}" for i in range(7)}
+    assert len(reloaded._read_wal()[0]) == 2
+
+
+@pytest.mark.parametrize("failing", ["snapshot", "wal"])
+def test_crash_mid_compaction(tmp_path, monkeypatch, failing):
+    part = open_partition(tmp_path)
+    add(part, 0, 5)
+    part.compact()
+    add(part, 5, 5)
+    part.delete_document("d1")
+
+    original = os.replace
+
+    def crash(src, dst):
+        # snapshot: упали между snapshot -> snapshot.old и snapshot.tmp -> snapshot;
+        # wal: новый снимок на месте, журнал еще не обрезан
+        if (failing == "snapshot" and dst == part.snapshot_path) or (failing == "wal" and dst == part.wal_path):
+            raise OSError("процесс убит")
+        original(src, dst)
+
+    monkeypatch.setattr(os, "replace", crash)
+    with pytest.raises(OSError):
+        part.compact()
+    monkeypatch.undo()
+
+    reloaded = open_partition(tmp_path)
+    assert set(reloaded.row_of) == {f"c{i}" for i in range(10)} - {"c1"}
+    assert_consistent(reloaded)
+    reloaded.compact()
+    assert_consistent(open_partition(tmp_path))
+
+
+@pytest.mark.skipif(not hasattr(signal, "SIGKILL"), reason="нужен SIGKILL")
+def test_kill_writer_and_reload(tmp_path):
+    path = str(tmp_path / "chat")
+    for delay in (0.05, 0.2, 0.4):
+        seq = open_partition(path).seq if os.path.isdir(path) else 0
+        writer = subprocess.Popen([sys.executable, "-c", WRITER, path], cwd=ROOT, stdout=subprocess.PIPE)
+        # Ждем первую запись и убиваем процесс посреди работы
+        assert writer.stdout.readline() == b"ready\n"
+        time.sleep(delay)
+        writer.send_signal(signal.SIGKILL)
+        writer.wait()
+
+        part = open_partition(path)
+        assert part.seq > seq
+        assert_consistent(part)
+
+
+def test_columnar_docstore_survives_reload(tmp_path):
+    part = open_partition(tmp_path)
+    add(part, 0, 6)
+    part.compact()
+    # Часть чанков в сегменте снимка, часть — в памяти и журнале
+    add(part, 6, 3)
+    part.delete(["c1", "c7"])
+    expected = {chunk_id: part.db.docstore.raw(chunk_id) for chunk_id in part.row_of}
+
+    for compact in (False, True):
+        reloaded = open_partition(tmp_path)
+        assert isinstance(reloaded.db.docstore, ColumnarDocstore) and reloaded.db.docstore.segment is not None
+        assert {chunk_id: reloaded.db.docstore.raw(chunk_id) for chunk_id in reloaded.row_of} == expected
+        assert sorted(reloaded.db.docstore.ids()) == sorted(expected)
+        if compact:
+            reloaded.compact()
+            assert not reloaded._read_wal()[0]
+    assert_consistent(open_partition(tmp_path))
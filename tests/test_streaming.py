@@ -0,0 +1,54 @@
+import pytest
+from langchain_core.language_models import GenericFakeChatModel
+from langchain_core.messages import AIMessage
+from bench.fakes import FakeEmbeddings
+from src.cacheTools import SemanticCache
+from src.ingestTools import UploadedDoc
+from src.storeTools import PartitionedStore
+from src.aiTools import ingest_docs, stream_rag_request, full_rag_request
+
+ANSWER = "Кошки спят по шестнадцать часов в сутки"
+QUESTION = "Сколько спят кошки?"
+SYS_PROMPT = "Отвечай по контексту."
+
+
+def fake_llm():
+    # GenericFakeChatModel отдает ответ по словам, как потоковая модель
+    return GenericFakeChatModel(messages=iter([AIMessage(content=ANSWER)]))
+
+
+@pytest.fixture
+def database(tmp_path):
+    store = PartitionedStore(FakeEmbeddings(dim=64), str(tmp_path / "db"))
+    data = "Кошки спят по шестнадцать часов в сутки. Собаки спят меньше.".encode("utf-8")
+    ingest_docs([UploadedDoc("cats.txt", len(data), "text/plain", data)], "chat", store)
+    return store
+
+
+def test_stream_yields_several_fragments(database):
+    fragments = list(stream_rag_request(fake_llm(), QUESTION, SYS_PROMPT, database, chat_id="chat"))
+    assert len(fragments) > 1
+    assert "".join(fragments) == ANSWER
+
+
+def test_full_request_joins_stream(database):
+    assert full_rag_request(fake_llm(), QUESTION, SYS_PROMPT, database, chat_id="chat") == ANSWER
+
+
+def test_answer_cached_after_stream_exhausted(database):
+    cache = SemanticCache(threshold=0.95)
+    key = ("chat", database.version("chat"), (1, SYS_PROMPT, repr([])))
+    vector = database.embedding.embed_query(QUESTION)
+
+    stream = stream_rag_request(fake_llm(), QUESTION, SYS_PROMPT, database, chat_id="chat", answer_cache=cache)
+    first = next(stream)
+    assert first != ANSWER
+    assert cache.lookup(*key, vector) is None
+
+    rest = list(stream)
+    assert first + "".join(rest) == ANSWER
+    assert cache.lookup(*key, vector) == ANSWER
+
+    # Повторный вопрос отдается из кэша одним фрагментом, модель не вызывается
+    cached = list(stream_rag_request(None, QUESTION, SYS_PROMPT, database, chat_id="chat", answer_cache=cache))
+    assert cached == [ANSWER]